@@ -1,8 +1,18 @@
-from django.contrib import admin
-from .models import Store, Product, Review, Purchase, ResetToken
-
-admin.site.register(Store)
-admin.site.register(Product)
-admin.site.register(Review)
-admin.site.register(Purchase)
-admin.site.register(ResetToken)
+from django.contrib import admin
+from .models import (
+    Store, Product, Review, Purchase, Order, OrderLine, SalesDailyRollup, Cart, CartItem, StockReservation,
+    ResetToken, OutboxEvent,
+)
+
+admin.site.register(Store)
+admin.site.register(Product)
+admin.site.register(Review)
+admin.site.register(Purchase)
+admin.site.register(Order)
+admin.site.register(OrderLine)
+admin.site.register(SalesDailyRollup)
+admin.site.register(Cart)
+admin.site.register(CartItem)
+admin.site.register(StockReservation)
+admin.site.register(ResetToken)
+admin.site.register(OutboxEvent)
@@ -0,0 +1,193 @@
+"""
+Vendor sales reporting from precomputed daily rollups.
+
+checkout_cart() adds each order line to its (store, product, day)
+SalesDailyRollup row with an UPDATE ... SET units = units + n, so reports
+read a few rows per product per day however large OrderLine and Purchase
+grow. rebuild_rollups() recomputes a range of days from OrderLine (the
+backfill, and the repair if rollups ever drift) under the same product row
+locks checkouts take, and compact_rollups()
+merges the rows that deleted products leave behind.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import Order, OrderLine, Product, SalesDailyRollup
+
+# Default report window, in days, and the most rows a report returns.
+DEFAULT_DAYS = 30
+MAX_LIMIT = 500
+
+
+# ----------------------------
+# Maintenance
+# ----------------------------
+def record_sales(order, lines):
+    """Add an order's lines to their rollups. Call inside the checkout transaction."""
+    day = timezone.localdate(order.created_at)
+    for line in sorted(lines, key=lambda line: line.product_id):
+        rows = SalesDailyRollup.objects.filter(store_id=line.store_id, product_id=line.product_id, day=day)
+        changes = {"units": F("units") + line.quantity, "revenue": F("revenue") + line.subtotal}
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SalesDailyRollup.objects.create(
+                    store_id=line.store_id, product_id=line.product_id, day=day,
+                    units=line.quantity, revenue=line.subtotal,
+                )
+        except IntegrityError:
+            # Another checkout created the row first.
+            rows.update(**changes)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def rebuild_rollups(first_day, last_day):
+    """
+    Recompute the rollups for first_day..last_day from OrderLine, one day
+    per transaction so no lock is held for long. Returns the rows written.
+    """
+    written = 0
+    day = first_day
+    while day <= last_day:
+        written += _rebuild_day(day)
+        day += timedelta(days=1)
+    return written
+
+
+def _rebuild_day(day):
+    """
+    Replace one day's rollups. The day's products are locked first, in
+    primary key order as checkout_cart() locks them, and the totals read
+    after that, so a checkout can't add to a row between the totals being
+    read and the row being replaced. Rows of products first sold after the
+    locks were taken are left to record_sales().
+    """
+    start, end = _day_bounds(day)
+    lines = OrderLine.objects.filter(order__created_at__gte=start, order__created_at__lt=end, store__isnull=False)
+    with transaction.atomic():
+        product_ids = set(lines.values_list("product", flat=True).order_by().distinct())
+        product_ids |= set(
+            SalesDailyRollup.objects.filter(day=day).values_list("product", flat=True).order_by().distinct()
+        )
+        locked = _lock_products(product_ids - {None})
+        # Deleted products (NULL) have no checkouts to race with.
+        scope = Q(product__in=locked) | Q(product=None)
+        totals = (
+            lines.filter(scope)
+            .values("store", "product")
+            .annotate(units=Sum("quantity"), revenue=Sum("subtotal"))
+            .order_by()
+        )
+        SalesDailyRollup.objects.filter(scope, day=day).delete()
+        rows = SalesDailyRollup.objects.bulk_create(
+            SalesDailyRollup(store_id=row["store"], product_id=row["product"], day=day,
+                             units=row["units"], revenue=row["revenue"])
+            for row in totals
+        )
+    return len(rows)
+
+
+def _lock_products(product_ids):
+    """Lock the products that still exist, in primary key order. Returns their ids."""
+    return list(
+        Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk").values_list("pk", flat=True)
+    )
+
+
+def compact_rollups():
+    """
+    Merge the rows of deleted products (product NULL) into one per store
+    and day. Returns the number of rows removed.
+    """
+    removed = 0
+    groups = (
+        SalesDailyRollup.objects.filter(product=None)
+        .values("store", "day")
+        .annotate(rows=Count("pk"), units=Sum("units"), revenue=Sum("revenue"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for group in groups:
+        with transaction.atomic():
+            SalesDailyRollup.objects.filter(store_id=group["store"], day=group["day"], product=None).delete()
+            SalesDailyRollup.objects.create(
+                store_id=group["store"], day=group["day"], units=group["units"], revenue=group["revenue"]
+            )
+        removed += group["rows"] - 1
+    return removed
+
+
+def order_days():
+    """(first, last) day that has orders, or None if there are none."""
+    bounds = Order.objects.aggregate(first=Min("created_at"), last=Max("created_at"))
+    if bounds["first"] is None:
+        return None
+    return timezone.localdate(bounds["first"]), timezone.localdate(bounds["last"])
+
+
+# ----------------------------
+# Reports
+# ----------------------------
+def revenue_by_day(rollups):
+    """[{"day", "units", "revenue"}] for the rollups, oldest day first."""
+    return list(
+        rollups.values("day").annotate(units=Sum("units"), revenue=Sum("revenue")).order_by("day")
+    )
+
+
+def top_products(rollups, limit):
+    """
+    [{"product", "name", "store", "units", "revenue"}] by revenue, highest
+    first. Deleted products appear with product and name None.
+    """
+    return list(
+        rollups.values("product", "store", name=F("product__name"))
+        .annotate(units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-revenue", "product")[:limit]
+    )
+
+
+def sell_through(rollups, limit):
+    """
+    [{"product", "name", "units", "stock", "sell_through"}]: units sold as a
+    share of units sold plus units left, highest first.
+    """
+    return list(
+        rollups.filter(product__isnull=False)
+        .values("product", name=F("product__name"), stock=F("product__stock"))
+        .annotate(units=Sum("units"))
+        .annotate(sell_through=Cast("units", FloatField()) / (F("units") + F("stock")))
+        .order_by("-sell_through", "product")[:limit]
+    )
+
+
+def store_stats(stores):
+    """
+    The stores (a queryset), in primary key order, each with product_count,
+    total_stock, units_sold and revenue set. Two grouped queries, however
+    many products and sales the stores have.
+    """
+    stores = list(
+        stores.annotate(product_count=Count("products"), total_stock=Coalesce(Sum("products__stock"), 0))
+        .order_by("pk")
+    )
+    sales = {
+        row["store"]: row
+        for row in SalesDailyRollup.objects.filter(store__in=[store.pk for store in stores])
+        .values("store").annotate(units=Sum("units"), revenue=Sum("revenue")).order_by()
+    }
+    for store in stores:
+        row = sales.get(store.pk, {})
+        store.units_sold = row.get("units") or 0
+        store.revenue = row.get("revenue") or Decimal("0.00")
+    return stores
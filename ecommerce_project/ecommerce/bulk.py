@@ -0,0 +1,192 @@
+"""
+Streaming bulk import and export of products, as CSV or JSON Lines.
+
+Both formats use the columns in FIELDS. On import, a row with an id updates
+that product (which must belong to one of the allowed stores) and a row
+without one creates a product. An update only changes the columns the row
+fills in. Rows are read one at a time, validated with
+ProductImportSerializer and written a chunk at a time: one bulk_create() for
+new products, and one bulk_update() per set of updated columns. Neither
+sends post_save, so no tweet is queued per row; the search index is updated
+once per chunk and the catalogue cache once per import instead.
+
+Exports stream from a server-side iterator, so memory stays flat however
+many products a store has.
+"""
+import csv
+import io
+import json
+import posixpath
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .caching import CATALOGUE, PRODUCTS, bump_version, product_key, store_key
+from .models import Product, Store
+from .search import _chunks, get_backend as get_search_backend
+from .serializers import ProductImportSerializer
+
+FIELDS = ["id", "store", "name", "description", "price", "stock"]
+CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+# Only the first errors are reported row by row; error_count has the total.
+MAX_REPORTED_ERRORS = 100
+
+
+def format_for(filename):
+    """"csv" or "jsonl" from a file name's extension, or None."""
+    return EXTENSIONS.get(posixpath.splitext(filename or "")[1].lower())
+
+
+# ----------------------------
+# Import
+# ----------------------------
+def read_rows(stream, fmt):
+    """
+    Yield (line number, row) from a binary file object. A row is a dict, or
+    None for a JSONL line that is not valid JSON.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def import_products(stream, fmt, store_ids=None):
+    """
+    Upsert products from a CSV or JSONL binary stream. store_ids limits the
+    stores rows may write to (a vendor's own); None allows every store.
+    Returns {"created", "updated", "error_count", "errors"}.
+    """
+    if store_ids is None:
+        store_ids = Store.objects.values_list("pk", flat=True)
+    store_ids = set(store_ids)
+    serializers = {
+        "create": ProductImportSerializer(context={"store_ids": store_ids}),
+        # Update rows only need an id; columns they leave out are kept.
+        "update": ProductImportSerializer(context={"store_ids": store_ids}, partial=True),
+    }
+    result = {"created": 0, "updated": 0, "error_count": 0, "errors": []}
+    unindexed = False
+
+    for chunk in _chunks(read_rows(stream, fmt), IMPORT_CHUNK_SIZE):
+        unindexed |= _import_chunk(chunk, serializers, store_ids, result)
+
+    if result["created"] or result["updated"]:
+        bump_version(CATALOGUE, PRODUCTS)
+    if unindexed:
+        # The database did not return the new primary keys (MySQL).
+        get_search_backend().rebuild()
+    return result
+
+
+def _report(result, errors):
+    result["error_count"] += len(errors)
+    room = MAX_REPORTED_ERRORS - len(result["errors"])
+    result["errors"].extend({"line": line, "errors": detail} for line, detail in sorted(errors, key=lambda e: e[0])[:room])
+
+
+def _import_chunk(chunk, serializers, store_ids, result):
+    """Validate and write one chunk. Returns True if new rows went unindexed."""
+    valid, errors = [], []
+    for line, row in chunk:
+        if not isinstance(row, dict):
+            errors.append((line, {"non_field_errors": ["Each line must be a JSON object."]}))
+            continue
+        # Blank CSV cells mean "not given": defaults apply on create, and
+        # the current value is kept on update.
+        data = {key: value for key, value in row.items() if key in FIELDS and value not in ("", None)}
+        serializer = serializers["update" if "id" in data else "create"]
+        try:
+            valid.append((line, serializer.run_validation(data)))
+        except ValidationError as exc:
+            errors.append((line, exc.detail))
+
+    ids = [data["id"] for _, data in valid if "id" in data]
+    existing = dict(Product.objects.filter(pk__in=ids).values_list("pk", "store_id")) if ids else {}
+    stores = Store.objects.in_bulk({data["store"] for _, data in valid if "id" not in data})
+
+    created, updated = [], {}
+    for line, data in valid:
+        pk = data.pop("id", None)
+        if pk is not None and existing.get(pk) not in store_ids:
+            errors.append((line, {"id": [f'Invalid pk "{pk}" - object does not exist.']}))
+            continue
+        if pk is None:
+            created.append(Product(store=stores[data.pop("store")], **data))
+        else:
+            # A later row for the same product wins, column by column.
+            updated.setdefault(pk, {}).update(data)
+    _report(result, errors)
+
+    if not created and not updated:
+        return False
+    with transaction.atomic():
+        Product.objects.bulk_create(created)
+        _update_products(updated)
+        changed = list(Product.objects.select_related("store").filter(pk__in=updated)) if updated else []
+        get_search_backend().index_products([p for p in created if p.pk is not None] + changed)
+        store_ids = set(existing.values()) | {p.store_id for p in created + changed}
+        bump_version(*(product_key(pk) for pk in updated), *map(store_key, store_ids))
+    result["created"] += len(created)
+    result["updated"] += len(updated)
+    return not connection.features.can_return_rows_from_bulk_insert and bool(created)
+
+
+def _update_products(updated):
+    """
+    Write {pk: {field: value}} with one bulk_update() per set of fields, so
+    each product only gets the columns its rows supplied.
+    """
+    now = timezone.now()
+    groups = {}
+    for pk, data in updated.items():
+        if data:
+            groups.setdefault(tuple(sorted(data)), []).append(pk)
+    for fields, pks in groups.items():
+        products = []
+        for pk in pks:
+            values = {("store_id" if name == "store" else name): value for name, value in updated[pk].items()}
+            products.append(Product(pk=pk, updated_at=now, **values))
+        # bulk_update() skips auto_now, so updated_at is set above.
+        Product.objects.bulk_update(products, [*fields, "updated_at"])
+
+
+# ----------------------------
+# Export
+# ----------------------------
+class _Echo:
+    """File-like object whose write() returns the text, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_products(queryset, fmt):
+    """Yield the products in queryset as CSV or JSONL text, a chunk at a time."""
+    rows = (
+        queryset.order_by("pk")
+        .values_list("pk", "store_id", "name", "description", "price", "stock")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(FIELDS)
+        for chunk in _chunks(rows, EXPORT_CHUNK_SIZE):
+            yield "".join(writer.writerow(row) for row in chunk)
+    else:
+        for chunk in _chunks(rows, EXPORT_CHUNK_SIZE):
+            yield "".join(json.dumps(dict(zip(FIELDS, row)), default=str) + "\n" for row in chunk)
@@ -0,0 +1,304 @@
+"""
+Versioned keys for the shared cache, and cached reads built on them.
+
+Cached content includes the current version of everything it depends on in
+its key; bump_version() is called from signals (and from the bulk write
+paths, which send none) when that data changes, so stale entries are simply
+never read again and expire on their own. There are versions for whole
+collections (CATALOGUE, PRODUCTS, STORES, REVIEWS) and for single rows
+(product_key(), store_key()). A product page also depends on its store's
+version, so renaming a store bumps one key, not one per product.
+
+aget_versions(), acached() and AsyncCachedReadMixin are the same reads for
+async views, so cache hits under ASGI need no worker thread.
+
+The cache itself is chosen with CACHE_BACKEND in settings.py.
+"""
+import functools
+import hashlib
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+CATALOGUE = "catalogue"  # HTML product list: names, prices and store names
+PRODUCTS = "products"    # any product data, stock and review stats included
+STORES = "stores"
+REVIEWS = "reviews"
+
+# Seconds a cached page or API response is kept; versions never expire.
+PAGE_TIMEOUT = 300
+
+
+def product_key(pk):
+    return f"product:{pk}"
+
+
+def store_key(pk):
+    return f"store:{pk}"
+
+
+def _version_key(name):
+    return f"ecommerce:version:{name}"
+
+
+def _new_version():
+    return uuid.uuid4().hex[:16]
+
+
+def get_versions(*names):
+    """Current version of each name, in order, in one cache round trip."""
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        found.update(cache.get_many(missing))
+    return [found[key] for key in keys]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+async def aget_versions(*names):
+    """get_versions() for async views."""
+    keys = [_version_key(name) for name in names]
+    found = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, _new_version(), None)
+        found.update(await cache.aget_many(missing))
+    return [found[key] for key in keys]
+
+
+async def aget_version(name):
+    return (await aget_versions(name))[0]
+
+
+def _set_new_versions(names):
+    cache.set_many({_version_key(name): _new_version() for name in names}, None)
+
+
+def bump_version(*names):
+    """
+    Invalidate everything cached under these names: now, and again when the
+    current transaction commits, in case another request re-cached the old
+    rows in between.
+    """
+    if not names:
+        return
+    _set_new_versions(names)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _set_new_versions(names))
+
+
+def _cache_key(prefix, parts):
+    digest = hashlib.md5("\n".join(str(part) for part in parts).encode()).hexdigest()
+    return f"ecommerce:{prefix}:{digest}", digest
+
+
+def cached(prefix, parts, versions, compute, timeout=PAGE_TIMEOUT, depends=None):
+    """
+    compute()'s result, cached under parts plus the current versions.
+
+    depends(value) may name more versions the value depends on that are only
+    known once it is computed (say, its product's store). They are stored
+    with the value, and a hit whose versions have moved on is recomputed.
+    """
+    key, _ = _cache_key(prefix, [*parts, *get_versions(*versions)])
+    entry = cache.get(key)
+    if entry is not None and depends is not None:
+        value, names, seen = entry
+        if get_versions(*names) != seen:
+            entry = None
+    if entry is None:
+        value = compute()
+        if depends is None:
+            entry = value
+        else:
+            names = list(depends(value))
+            entry = (value, names, get_versions(*names))
+        cache.set(key, entry, timeout)
+    return entry if depends is None else entry[0]
+
+
+async def acached(prefix, parts, versions, compute, timeout=PAGE_TIMEOUT, depends=None):
+    """cached() for async views; compute is a coroutine function."""
+    key, _ = _cache_key(prefix, [*parts, *await aget_versions(*versions)])
+    entry = await cache.aget(key)
+    if entry is not None and depends is not None:
+        value, names, seen = entry
+        if await aget_versions(*names) != seen:
+            entry = None
+    if entry is None:
+        value = await compute()
+        if depends is None:
+            entry = value
+        else:
+            names = list(depends(value))
+            entry = (value, names, await aget_versions(*names))
+        await cache.aset(key, entry, timeout)
+    return entry if depends is None else entry[0]
+
+
+def _api_cache_key(request, vary, versions):
+    return _cache_key("api", [request.build_absolute_uri(), vary, *versions])[0]
+
+
+def _not_modified(request, validators):
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response["ETag"] = etag
+    return response
+
+
+def _add_validators(response, validators):
+    etag, last_modified = validators
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class CachedReadMixin:
+    """
+    ViewSet mixin for list and retrieve: responses are cached under the
+    versions from cache_versions(), and carry an ETag and Last-Modified
+    derived from the rows' updated_at (so they survive cache flushes and
+    agree between workers). A matching If-None-Match / If-Modified-Since
+    gets a 304 without serializing anything.
+    """
+
+    def cache_versions(self):
+        raise NotImplementedError
+
+    def cache_vary(self):
+        """Extra key part for responses that differ between users."""
+        return ""
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_read(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_read(super().retrieve, request, *args, **kwargs)
+
+    def validators(self):
+        """
+        (etag, last_modified timestamp) for the rows this read returns, from
+        MAX(updated_at) and COUNT(*); None when there is nothing to serve.
+        Separate queries, so each can be answered from an index.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        if self.action == "retrieve":
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            try:
+                queryset = queryset.filter(**{self.lookup_field: lookup})
+            except (TypeError, ValueError, DjangoValidationError):
+                return None
+        count = queryset.count()
+        if not count and self.action == "retrieve":
+            return None
+        last = queryset.aggregate(last=Max("updated_at"))["last"]
+        _, digest = _cache_key("etag", [
+            self.request.build_absolute_uri(), self.cache_vary(), count, last and last.isoformat(),
+        ])
+        return f'"{digest}"', last and int(last.timestamp())
+
+    def _cached_read(self, view, request, *args, **kwargs):
+        key = _api_cache_key(request, self.cache_vary(), get_versions(*self.cache_versions()))
+        entry = cache.get(key)
+        validators = entry["validators"] if entry else self.validators()
+        if validators is None:
+            return view(request, *args, **kwargs)
+
+        not_modified = _not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = {"data": response.data, "validators": validators}
+            cache.set(key, entry, PAGE_TIMEOUT)
+        else:
+            response = Response(entry["data"])
+        return _add_validators(response, validators)
+
+
+class AsyncCachedReadMixin(CachedReadMixin):
+    """
+    CachedReadMixin whose list and retrieve routes are async views: a GET
+    whose response is already cached (or that gets a 304) is answered on the
+    event loop, and anything else runs the normal DRF view in a thread.
+
+    Only requests without an Authorization header take the async path, so
+    DRF authentication never has to run there; the session user is loaded
+    with request.auser(). Override acache_vary() if cache_vary() queries.
+    """
+
+    async def acache_vary(self):
+        return self.cache_vary()
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        action = (actions or {}).get("get")
+        if action not in ("list", "retrieve"):
+            return view
+
+        # The headers DRF would add (Allow, ...), computed as its view() does.
+        probe = cls(**initkwargs)
+        for method, name in actions.items():
+            setattr(probe, method, getattr(probe, name))
+        if "get" in actions and "head" not in actions:
+            probe.head = probe.get
+        headers = probe.default_response_headers
+        # The renderer the DRF view would pick for this action.
+        probe.action = action
+        renderer = probe.get_renderers()[0]
+        sync_view = sync_to_async(view)
+
+        @functools.wraps(view)
+        async def async_view(request, *args, **kwargs):
+            if request.method == "GET" and "HTTP_AUTHORIZATION" not in request.META:
+                response = await cls._acached_read(request, action, kwargs, initkwargs, headers, renderer)
+                if response is not None:
+                    return response
+            return await sync_view(request, *args, **kwargs)
+
+        return async_view
+
+    @classmethod
+    async def _acached_read(cls, request, action, kwargs, initkwargs, headers, renderer):
+        """The cached response or a 304, or None if the DRF view must run."""
+        if not request.accepts(JSONRenderer.media_type):
+            return None
+        request.user = await request.auser()
+        viewset = cls(**initkwargs)
+        viewset.request, viewset.action, viewset.kwargs = request, action, kwargs
+        versions = await aget_versions(*viewset.cache_versions())
+        entry = await cache.aget(_api_cache_key(request, await viewset.acache_vary(), versions))
+        if entry is None:
+            return None
+
+        not_modified = _not_modified(request, entry["validators"])
+        if not_modified is not None:
+            return not_modified
+        response = HttpResponse(renderer.render(entry["data"]), content_type=JSONRenderer.media_type)
+        for name, value in headers.items():
+            response[name] = value
+        return _add_validators(response, entry["validators"])
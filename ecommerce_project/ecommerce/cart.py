@@ -0,0 +1,277 @@
+"""
+The buyer's cart (Cart/CartItem rows), its pricing and checkout into an
+Order, and the invoice shared by the order page and the invoice email.
+
+Adding to the cart is a single UPDATE ... SET quantity = quantity + n on the
+(cart, product) row, so concurrent adds never lose a line and nothing is
+written to the session.
+
+Adding also holds the stock for RESERVATION_TTL (a StockReservation row), so
+when a hot product runs out buyers are turned away at "Add to Cart" rather
+than at checkout. Available stock is stock minus other buyers' unexpired
+holds; expired holds are ignored, and deleted by sweep_reservations().
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .analytics import record_sales
+from .caching import PRODUCTS, bump_version, product_key
+from .models import Cart, CartItem, Order, OrderLine, Product, Purchase, StockReservation
+
+# Seconds the item count shown in page headers is cached for.
+CART_SIZE_TIMEOUT = 300
+# How long adding to the cart holds the stock; each add restarts it.
+RESERVATION_TTL = timedelta(minutes=15)
+SWEEP_BATCH_SIZE = 1000
+
+
+class OutOfStock(Exception):
+    """Raised when a cart line asks for more than is available."""
+
+    def __init__(self, product):
+        super().__init__(f"Not enough stock for {product.name}")
+        self.product = product
+
+
+class EmptyCart(Exception):
+    """Raised when a checkout has no lines left (say, every product was deleted)."""
+
+
+# ----------------------------
+# Cart contents
+# ----------------------------
+def _cart_size_key(user):
+    return f"ecommerce:cart-size:{user.pk}"
+
+
+def load_cart(user):
+    """The user's cart as {product_id: quantity}, in one query."""
+    items = CartItem.objects.filter(cart__user=user).order_by("added_at", "pk")
+    return dict(items.values_list("product_id", "quantity"))
+
+
+def cart_size(user):
+    """Number of lines in the user's cart (cached)."""
+    key = _cart_size_key(user)
+    size = cache.get(key)
+    if size is None:
+        size = CartItem.objects.filter(cart__user=user).count()
+        cache.set(key, size, CART_SIZE_TIMEOUT)
+    return size
+
+
+def _cart_changed(user):
+    cache.delete(_cart_size_key(user))
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete(_cart_size_key(user)))
+
+
+def add_item(user, product, quantity=1):
+    """
+    Add quantity of product to the user's cart and hold the line's new total.
+    Raises OutOfStock, adding nothing, if that much is not available.
+    """
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        items = CartItem.objects.filter(cart=cart, product=product)
+        if not items.update(quantity=F("quantity") + quantity, updated_at=Now()):
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+            except IntegrityError:
+                # Another request created the line first.
+                items.update(quantity=F("quantity") + quantity, updated_at=Now())
+        reserve(user, product, items.values_list("quantity", flat=True).get())
+    _cart_changed(user)
+
+
+def remove_item(user, product_id):
+    CartItem.objects.filter(cart__user=user, product_id=product_id).delete()
+    StockReservation.objects.filter(user=user, product_id=product_id).delete()
+    _cart_changed(user)
+
+
+def clear_cart(user):
+    CartItem.objects.filter(cart__user=user).delete()
+    StockReservation.objects.filter(user=user).delete()
+    _cart_changed(user)
+
+
+# ----------------------------
+# Stock reservations
+# ----------------------------
+def _check_available(user, lines):
+    """
+    Lock the rows of the (product, quantity) lines, in primary key order, and
+    raise OutOfStock for the first product with less than quantity left once
+    other buyers' unexpired holds are set aside. One query.
+    """
+    held = (
+        StockReservation.objects.filter(product=OuterRef("pk"), expires_at__gt=timezone.now())
+        .exclude(user=user).order_by().values("product").annotate(n=Sum("quantity")).values("n")
+    )
+    # The row locks make concurrent holds on one product take turns.
+    available = dict(
+        Product.objects.select_for_update().filter(pk__in=[product.pk for product, _ in lines])
+        .order_by("pk").annotate(held=Coalesce(Subquery(held), 0))
+        .values_list("pk", F("stock") - F("held"))
+    )
+    for product, quantity in sorted(lines, key=lambda line: line[0].pk):
+        if available.get(product.pk, 0) < quantity:
+            raise OutOfStock(product)
+
+
+def reserve(user, product, quantity):
+    """
+    Hold quantity units of product for the user until RESERVATION_TTL from
+    now, replacing their earlier hold. Raises OutOfStock if fewer units are
+    available.
+    """
+    expires_at = timezone.now() + RESERVATION_TTL
+    with transaction.atomic():
+        _check_available(user, [(product, quantity)])
+        # The product row is locked, so the hold cannot be created concurrently.
+        holds = StockReservation.objects.filter(user=user, product=product)
+        if not holds.update(quantity=quantity, expires_at=expires_at):
+            StockReservation.objects.create(user=user, product=product, quantity=quantity, expires_at=expires_at)
+
+
+def sweep_reservations(batch_size=SWEEP_BATCH_SIZE):
+    """
+    Delete expired holds, batch_size rows per statement so no long lock is
+    held. Returns the number deleted.
+    """
+    total = 0
+    while True:
+        now = timezone.now()
+        expired = StockReservation.objects.filter(expires_at__lte=now)
+        pks = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return total
+        # Skips holds that were renewed since the SELECT.
+        deleted, _ = StockReservation.objects.filter(pk__in=pks, expires_at__lte=now).delete()
+        total += deleted
+
+
+# ----------------------------
+# Pricing and checkout
+# ----------------------------
+def price_cart(cart):
+    """
+    Resolve every line of a cart ({product_id: quantity}, see load_cart) with a
+    single query and price it in one pass.
+
+    Returns (items, total). Lines whose product no longer exists are skipped.
+    """
+    quantities = {int(pid): int(qty) for pid, qty in cart.items()}
+    products = Product.objects.select_related("store").in_bulk(list(quantities))
+
+    items = []
+    total = Decimal("0.00")
+    for pid, qty in quantities.items():
+        product = products.get(pid)
+        if product is None:
+            continue
+        subtotal = product.price * qty
+        items.append({"product": product, "quantity": qty, "subtotal": subtotal})
+        total += subtotal
+    return items, total
+
+
+def checkout_cart(user, cart):
+    """
+    Turn a cart into an Order, with its OrderLines, Purchase rows and sales
+    rollups, in one transaction.
+
+    Lines covered by the user's unexpired holds are not checked again. Lines
+    whose hold lapsed (or was never placed) are checked in one query that
+    locks their rows in primary key order, so concurrent checkouts lock rows
+    in the same order. The stock of every line is then taken with a single
+    UPDATE, the holds are deleted, and all purchases are written with a
+    single bulk_create. If any line is short on stock, OutOfStock is raised
+    and nothing is committed; if no line's product exists any more,
+    EmptyCart is raised and no order is created.
+
+    Returns (order, items), items as priced by price_cart with each item's
+    OrderLine under "line" and Purchase under "purchase".
+    """
+    with transaction.atomic():
+        items, total = price_cart(cart)
+        if not items:
+            raise EmptyCart()
+        held = dict(
+            StockReservation.objects.filter(user=user, expires_at__gt=timezone.now())
+            .values_list("product_id", "quantity")
+        )
+        lapsed = [
+            (item["product"], item["quantity"])
+            for item in items if held.get(item["product"].pk, 0) < item["quantity"]
+        ]
+        if lapsed:
+            _check_available(user, lapsed)
+        _convert_holds(user, items, held)
+        bump_version(PRODUCTS, *(product_key(item["product"].pk) for item in items))
+
+        order = Order.objects.create(
+            user=user, item_count=sum(item["quantity"] for item in items), total=total
+        )
+        lines = OrderLine.objects.bulk_create(
+            OrderLine(
+                order=order, product=item["product"], store_id=item["product"].store_id,
+                product_name=item["product"].name,
+                unit_price=item["product"].price, quantity=item["quantity"], subtotal=item["subtotal"],
+            )
+            for item in items
+        )
+        record_sales(order, lines)
+        purchases = Purchase.objects.bulk_create(
+            Purchase(user=user, product=item["product"], quantity=item["quantity"])
+            for item in items
+        )
+        for item, line, purchase in zip(items, lines, purchases):
+            item["line"] = line
+            item["purchase"] = purchase
+    return order, items
+
+
+def _convert_holds(user, items, held):
+    """Take the stock of every line with a single UPDATE, then drop the holds."""
+    quantities = {item["product"].pk: item["quantity"] for item in items}
+    enough = Q()
+    for pk, qty in quantities.items():
+        enough |= Q(pk=pk, stock__gte=qty)
+    with transaction.atomic():
+        taken = Product.objects.filter(enough).update(
+            stock=F("stock") - Case(
+                *(When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()),
+                output_field=PositiveIntegerField(),
+            ),
+            updated_at=Now(),
+        )
+        if taken < len(quantities):
+            # Stock was lowered below the holds (e.g. edited by the vendor).
+            transaction.set_rollback(True)
+    if taken < len(quantities):
+        # Unlocked re-read, to name a product; stock may be back by now.
+        stocks = dict(Product.objects.filter(pk__in=quantities).values_list("pk", "stock"))
+        short = [item for item in items if stocks.get(item["product"].pk, 0) < item["quantity"]]
+        raise OutOfStock((short or items)[0]["product"])
+    for item in items:
+        item["product"].stock -= item["quantity"]
+    if held:
+        StockReservation.objects.filter(user=user, product_id__in=quantities).delete()
+
+
+def render_invoice(order, lines):
+    """Render the HTML invoice for an order and its OrderLines."""
+    return render_to_string("ecommerce/invoice.html", {
+        "order": order,
+        "lines": lines,
+    })
@@ -1,15 +1,25 @@
 """
 Context processors to make variables available in all templates.
 """
+from .cart import cart_size as get_cart_size
+from .roles import is_vendor
+
 
 def user_role(request):
     """
     Add user role information to all template contexts.
     """
-    is_vendor = False
-    if request.user.is_authenticated:
-        is_vendor = request.user.groups.filter(name='Vendor').exists()
-    
     return {
-        'is_vendor': is_vendor,
+        'is_vendor': is_vendor(request.user),
+    }
+
+
+def cart_size(request):
+    """
+    Number of lines in the user's cart, for the header link. Evaluated only
+    by templates that show it.
+    """
+    user = request.user
+    return {
+        'cart_size': lambda: get_cart_size(user) if user.is_authenticated else 0,
     }
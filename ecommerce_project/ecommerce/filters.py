@@ -0,0 +1,142 @@
+"""
+Server-side filtering, ordering and facet counts for the products API.
+
+Query parameters:
+    store       one or more store ids, comma separated (?store=1,4)
+    min_price   inclusive lower price bound
+    max_price   inclusive upper price bound
+    in_stock    "true"/"1" to return only products with stock > 0
+    ordering    price, -price, stock, -stock, name, -name, id, -id
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .models import Store
+
+# Bucket edges for the price facet; the last bucket is open-ended.
+PRICE_BUCKETS = [0, 50, 100, 500, 1000]
+
+TRUE_VALUES = {"1", "true", "yes"}
+
+
+def _parse_price(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "Must be a number."})
+    if not price.is_finite():
+        raise ValidationError({name: "Must be a number."})
+    return price
+
+
+def _parse_ids(value, name):
+    """Comma separated primary keys, each within the database's integer range."""
+    _, largest = connection.ops.integer_field_range(Store._meta.pk.get_internal_type())
+    try:
+        ids = [int(pk) for pk in value.split(",")]
+    except ValueError:
+        ids = None
+    if not ids or not all(0 < pk <= largest for pk in ids):
+        raise ValidationError({name: "Must be a comma separated list of ids."})
+    return ids
+
+
+def product_filters(params):
+    """
+    Build the filter conditions from query params, keyed by facet
+    ("store", "price", "stock") so facets can leave their own filter out.
+    """
+    filters = {}
+
+    store = params.get("store")
+    if store:
+        filters["store"] = Q(store_id__in=_parse_ids(store, "store"))
+
+    min_price = _parse_price(params, "min_price")
+    max_price = _parse_price(params, "max_price")
+    price = Q()
+    if min_price is not None:
+        price &= Q(price__gte=min_price)
+    if max_price is not None:
+        price &= Q(price__lte=max_price)
+    if price:
+        filters["price"] = price
+
+    if params.get("in_stock", "").lower() in TRUE_VALUES:
+        filters["stock"] = Q(stock__gt=0)
+
+    return filters
+
+
+def _combine(filters, exclude=None):
+    combined = Q()
+    for name, condition in filters.items():
+        if name != exclude:
+            combined &= condition
+    return combined
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        condition = _combine(product_filters(request.query_params))
+        return queryset.filter(condition) if condition else queryset
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """OrderingFilter that always ends on id, so cursors stay stable on ties."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            ordering.append("id")
+        return ordering
+
+
+def _count(condition):
+    return Count("pk", filter=condition) if condition else Count("pk")
+
+
+def product_facets(queryset, params):
+    """
+    Products per store and per price bucket, in one grouped query.
+
+    Each facet counts with every filter except its own (so picking one store
+    still shows how many products the other stores have).
+    """
+    filters = product_filters(params)
+    base = queryset.filter(filters["stock"]) if "stock" in filters else queryset
+
+    edges = PRICE_BUCKETS + [None]
+    buckets = {}
+    for low, high in zip(edges, edges[1:]):
+        bucket = Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q())
+        label = f"{low}-{high}" if high is not None else f"{low}+"
+        buckets[label] = _count(bucket & _combine(filters, exclude="price"))
+
+    aliases = {f"bucket_{i}": aggregate for i, aggregate in enumerate(buckets.values())}
+    rows = (
+        base.order_by()
+        .values("store", "store__name")
+        .annotate(store_count=_count(_combine(filters, exclude="store")), **aliases)
+    )
+
+    stores = []
+    price_counts = dict.fromkeys(buckets, 0)
+    for row in rows:
+        if row["store_count"]:
+            stores.append({"id": row["store"], "name": row["store__name"], "count": row["store_count"]})
+        for i, label in enumerate(buckets):
+            price_counts[label] += row[f"bucket_{i}"]
+
+    stores.sort(key=lambda store: (-store["count"], store["id"]))
+    return {
+        "stores": stores,
+        "price": [{"range": label, "count": count} for label, count in price_counts.items()],
+    }
@@ -0,0 +1,120 @@
+"""
+Resized, recompressed variants of product images and store logos.
+
+Every uploaded image gets one file per (variant, format), stored next to the
+original under a "variants/" folder:
+
+    product_images/lambo.jpg -> product_images/variants/lambo.card.webp
+
+When a new file is saved on Product.image or Store.logo, signals.py resets
+the row's image_variants_ready / logo_variants_ready flag and enqueues an
+outbox event; the outbox worker generates the variants and sets the flag on
+every row using that file. Readers go by the flag and never ask the storage.
+`manage.py generate_image_variants` backfills existing uploads.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name -> longest edge in pixels
+VARIANTS = {
+    "thumb": 150,
+    "card": 400,
+    "detail": 1000,
+}
+
+# format -> (file extension, Pillow save options)
+FORMATS = {
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 6}),
+}
+
+
+def variant_name(name, variant, fmt):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, "variants", f"{stem}.{variant}.{FORMATS[fmt][0]}")
+
+
+def generate_variants(name, storage=default_storage):
+    """Write every variant of the stored image `name`. Returns the names written."""
+    with storage.open(name, "rb") as f:
+        original = ImageOps.exif_transpose(Image.open(f))
+        original.load()
+    if original.mode not in ("RGB", "L"):
+        # Flatten transparency onto white so JPEG variants look right.
+        background = Image.new("RGB", original.size, "white")
+        background.paste(original, mask=original.convert("RGBA").getchannel("A"))
+        original = background
+    else:
+        original = original.convert("RGB")
+
+    written = []
+    for variant, size in VARIANTS.items():
+        resized = original.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for fmt, (_, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            target = variant_name(name, variant, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            written.append(storage.save(target, ContentFile(buffer.getvalue())))
+    return written
+
+
+def generate_variants_safely(name):
+    """generate_variants() that logs instead of raising (for uploads and pools)."""
+    try:
+        return generate_variants(name)
+    except Exception:
+        logger.exception("Could not generate image variants for %s", name)
+        return []
+
+
+def mark_variants_ready(names):
+    """Set the variants-ready flag on every product and store using one of names."""
+    from .caching import CATALOGUE, PRODUCTS, STORES, bump_version, product_key, store_key
+    from .models import Product, Store
+
+    names = list(names)
+    products = list(
+        Product.objects.filter(image__in=names, image_variants_ready=False).values_list("pk", "store_id")
+    )
+    store_ids = list(Store.objects.filter(logo__in=names, logo_variants_ready=False).values_list("pk", flat=True))
+    if not products and not store_ids:
+        return
+    now = timezone.now()
+    Product.objects.filter(pk__in=[pk for pk, _ in products]).update(image_variants_ready=True, updated_at=now)
+    Store.objects.filter(pk__in=store_ids).update(logo_variants_ready=True, updated_at=now)
+    bump_version(
+        CATALOGUE, PRODUCTS, STORES, *(product_key(pk) for pk, _ in products),
+        *map(store_key, {store_id for _, store_id in products} | set(store_ids)),
+    )
+
+
+def variants_ready(field_file):
+    """Whether the variants of a model's image field have been generated."""
+    if not field_file:
+        return False
+    return getattr(field_file.instance, f"{field_file.field.name}_variants_ready", False)
+
+
+def variant_urls(name, ready, storage=default_storage):
+    """
+    {variant: {format: url}} for the stored image `name`, or None when there
+    is no image or its variants are not ready (see variants_ready()).
+    """
+    if not name or not ready:
+        return None
+    return {
+        variant: {fmt: storage.url(variant_name(name, variant, fmt)) for fmt in FORMATS}
+        for variant in VARIANTS
+    }
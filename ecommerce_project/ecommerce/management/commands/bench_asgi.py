@@ -0,0 +1,202 @@
+"""
+WSGI vs ASGI load test for the catalogue pages and the read-only API.
+
+Sends the same mix of GET requests (product list, product and store pages,
+product and store API reads) to the project's WSGI and ASGI applications,
+called in-process so the numbers compare the two Django stacks rather than
+two HTTP servers. The WSGI side models a threaded server: --concurrency
+clients share --threads worker threads, and a request's latency includes
+its wait for a free thread. The ASGI side runs every client on one event
+loop. --client-delay makes each client take that long to read a response;
+a WSGI worker is held for that time, an ASGI request is not. Fixtures are
+created on the configured database and deleted afterwards.
+
+    python manage.py bench_asgi --requests 2000 --concurrency 100 --threads 8
+    python manage.py bench_asgi --concurrency 200 --client-delay 50
+"""
+import asyncio
+import io
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+
+from ecommerce.models import Store, Product
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec and p99 latency of the WSGI and ASGI stacks at high concurrency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per stack.")
+        parser.add_argument("--concurrency", type=int, default=100, help="Concurrent clients.")
+        parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads.")
+        parser.add_argument("--client-delay", type=float, default=0.0,
+                            help="Milliseconds each client takes to read a response.")
+        parser.add_argument("--products", type=int, default=50)
+        parser.add_argument("--stack", choices=["both", "wsgi", "asgi"], default="both")
+        parser.add_argument("--host", default="localhost", help="Host header; must be in ALLOWED_HOSTS.")
+
+    def handle(self, *args, **options):
+        suffix = str(int(time.time() * 1000))
+        vendor = User.objects.create_user(f"bench-vendor-{suffix}")
+        buyer = User.objects.create_user(f"bench-buyer-{suffix}")
+        # bulk_create skips post_save, so no tweets are queued for fixtures.
+        store = Store.objects.bulk_create([Store(name="Bench store", vendor=vendor)])[0]
+        products = Product.objects.bulk_create(
+            Product(store=store, name=f"Bench {i}", description="", price=Decimal("9.99"), stock=100)
+            for i in range(options["products"])
+        )
+        client = Client()
+        client.force_login(buyer)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        rng = random.Random(0)
+        paths = []
+        for _ in range(options["requests"]):
+            pk = rng.choice(products).pk
+            paths.append(rng.choice([
+                "/", f"/products/{pk}/", f"/store/{store.pk}/",
+                "/api/products/", f"/api/products/{pk}/", f"/api/stores/{store.pk}/",
+            ]))
+        headers = {"host": options["host"], "cookie": cookie}
+
+        try:
+            wsgi_app = get_wsgi_application()
+            # Warm the caches once so neither stack pays for filling them.
+            for path in set(paths):
+                status = self._wsgi_get(wsgi_app, path, headers, 0)
+                if status != 200:
+                    self.stderr.write(f"warning: {path} returned {status}")
+            stacks = ["wsgi", "asgi"] if options["stack"] == "both" else [options["stack"]]
+            for stack in stacks:
+                if stack == "wsgi":
+                    result = self._run_wsgi(wsgi_app, paths, headers, options)
+                else:
+                    result = asyncio.run(self._run_asgi(get_asgi_application(), paths, headers, options))
+                self._report(stack, *result)
+        finally:
+            vendor.delete()
+            buyer.delete()
+
+    def _report(self, stack, latencies, errors, elapsed):
+        self.stdout.write(
+            f"{stack}: {len(latencies)} requests, {errors} errors in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.1f} req/sec), "
+            f"p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms"
+        )
+
+    # ----------------------------
+    # WSGI
+    # ----------------------------
+    def _wsgi_get(self, app, path, headers, delay):
+        environ = {
+            "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+            "SERVER_NAME": headers["host"], "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": "127.0.0.1", "HTTP_HOST": headers["host"], "HTTP_COOKIE": headers["cookie"],
+            "wsgi.version": (1, 0), "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr, "wsgi.multithread": True, "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        status = []
+        body = app(environ, lambda line, response_headers, exc_info=None: status.append(line))
+        try:
+            for _ in body:
+                time.sleep(delay)
+        finally:
+            body.close()
+        return int(status[0].split()[0])
+
+    def _run_wsgi(self, app, paths, headers, options):
+        delay = options["client_delay"] / 1000
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def client(workers, share):
+            for path in share:
+                started = time.perf_counter()
+                # Requests wait for a free worker in arrival order, as in a threaded server.
+                status = workers.submit(self._wsgi_get, app, path, headers, delay).result()
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    errors[0] += status != 200
+
+        concurrency = options["concurrency"]
+        with ThreadPoolExecutor(max_workers=options["threads"]) as workers:
+            threads = [
+                threading.Thread(target=client, args=(workers, paths[i::concurrency]))
+                for i in range(concurrency)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        return latencies, errors[0], elapsed
+
+    # ----------------------------
+    # ASGI
+    # ----------------------------
+    async def _asgi_get(self, app, path, headers, delay):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "client": ("127.0.0.1", 0), "server": (headers["host"], 80),
+            "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+        }
+        finished = asyncio.Event()
+        status = []
+        sent_body = False
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            elif message["type"] == "http.response.body":
+                await asyncio.sleep(delay)
+                if not message.get("more_body"):
+                    finished.set()
+
+        await app(scope, receive, send)
+        return status[0]
+
+    async def _run_asgi(self, app, paths, headers, options):
+        delay = options["client_delay"] / 1000
+        latencies, errors = [], 0
+
+        async def client(share):
+            nonlocal errors
+            for path in share:
+                started = time.perf_counter()
+                status = await self._asgi_get(app, path, headers, delay)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += status != 200
+
+        concurrency = options["concurrency"]
+        started = time.perf_counter()
+        await asyncio.gather(*(client(paths[i::concurrency]) for i in range(concurrency)))
+        return latencies, errors, time.perf_counter() - started
@@ -0,0 +1,131 @@
+"""
+Flash-sale benchmark: many buyers race for one product with little stock.
+
+Each buyer adds one unit to their cart, waits --think milliseconds and checks
+out. With reservations (the default) the stock is held at "Add to Cart", so
+buyers who miss out are turned away there and every checkout that starts
+succeeds. --late models the old flow, where nothing is held and buyers only
+find out at checkout. Fixtures are created on the configured database and
+deleted afterwards.
+
+    python manage.py bench_flash_sale --buyers 500 --stock 100 --threads 16
+    python manage.py bench_flash_sale --buyers 500 --stock 100 --threads 16 --late
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from ecommerce.cart import OutOfStock, add_item, checkout_cart, clear_cart, load_cart
+from ecommerce.models import Store, Product, Purchase
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark many concurrent buyers checking out one scarce product."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buyers", type=int, default=500)
+        parser.add_argument("--stock", type=int, default=100)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--think", type=float, default=20.0,
+                            help="Milliseconds between adding to the cart and checking out.")
+        parser.add_argument("--late", action="store_true",
+                            help="Hold nothing at add time; check stock only at checkout.")
+
+    def handle(self, *args, **options):
+        suffix = str(int(time.time() * 1000))
+        vendor = User.objects.create_user(f"flash-vendor-{suffix}")
+        # bulk_create skips post_save and password hashing for the fixtures.
+        buyers = User.objects.bulk_create(
+            User(username=f"flash-buyer-{suffix}-{i}") for i in range(options["buyers"])
+        )
+        store = Store.objects.bulk_create([Store(name="Flash sale", vendor=vendor)])[0]
+        product = Product.objects.bulk_create([
+            Product(store=store, name="Flash item", description="", price=Decimal("9.99"),
+                    stock=options["stock"])
+        ])[0]
+
+        queue = iter(buyers)
+        lock = threading.Lock()
+        results = {"ok": 0, "rejected_at_add": 0, "rejected_at_checkout": 0, "errors": 0}
+        checkout_times, loser_waits = [], []
+
+        def shop(buyer):
+            started = time.perf_counter()
+            if options["late"]:
+                cart = {product.pk: 1}
+            else:
+                try:
+                    add_item(buyer, product, 1)
+                except OutOfStock:
+                    return "rejected_at_add", started, None
+                cart = load_cart(buyer)
+            time.sleep(options["think"] / 1000)
+            checkout_started = time.perf_counter()
+            try:
+                checkout_cart(buyer, cart)
+                if not options["late"]:
+                    clear_cart(buyer)
+            except OutOfStock:
+                return "rejected_at_checkout", started, checkout_started
+            return "ok", started, checkout_started
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        buyer = next(queue, None)
+                    if buyer is None:
+                        return
+                    try:
+                        outcome, started, checkout_started = shop(buyer)
+                    except OperationalError:
+                        outcome, started, checkout_started = "errors", time.perf_counter(), None
+                    finished = time.perf_counter()
+                    with lock:
+                        results[outcome] += 1
+                        if checkout_started is not None:
+                            checkout_times.append((finished - checkout_started) * 1000)
+                        if outcome.startswith("rejected"):
+                            loser_waits.append((finished - started) * 1000)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sold = Purchase.objects.filter(product=product).aggregate(n=Sum("quantity"))["n"] or 0
+        left = Product.objects.get(pk=product.pk).stock
+        oversold = max(0, sold - options["stock"])
+
+        self.stdout.write(
+            f"{'late check' if options['late'] else 'reservations'}: "
+            f"{results['ok']} orders, {results['rejected_at_add']} turned away at add, "
+            f"{results['rejected_at_checkout']} failed at checkout, {results['errors']} errors "
+            f"in {elapsed:.2f}s ({results['ok'] / elapsed:.1f} orders/sec)"
+        )
+        self.stdout.write(
+            f"checkout p50 {percentile(checkout_times, 0.5):.1f} ms, "
+            f"p99 {percentile(checkout_times, 0.99):.1f} ms; "
+            f"losers waited p50 {percentile(loser_waits, 0.5):.1f} ms; "
+            f"{left} left in stock, oversold units: {oversold}"
+        )
+
+        vendor.delete()
+        User.objects.filter(pk__in=[buyer.pk for buyer in buyers]).delete()
@@ -0,0 +1,114 @@
+"""
+Compare the API's list serialization through the ModelSerializers with the
+.values() fast path (see rows.py), in rows per second.
+
+Stores, products and reviews are generated inside a transaction that is
+rolled back at the end, so the database is left untouched. Each list is
+serialized and rendered to JSON both ways, from the same queryset the
+viewset uses; the output of the two must be byte for byte the same.
+
+    python manage.py bench_rows --rows 20000
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from ecommerce.models import Store, Product, Review
+from ecommerce.rows import RowJSONRenderer, orjson
+from ecommerce.serializers import (
+    PRODUCT_ROWS, REVIEW_ROWS, STORE_ROWS, ProductSerializer, ReviewSerializer, StoreSerializer,
+)
+from ecommerce.views import review_queryset
+
+WORDS = ["red", "vintage", "wireless", "leather", "lamp", "chair", "kettle", "camera",
+         "durable", "handmade", "gift", "quality", "café", "naïve"]
+
+
+class Command(BaseCommand):
+    help = "Benchmark list serialization: ModelSerializer vs the .values() row plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000, help="Stores, products and reviews each.")
+        parser.add_argument("--users", type=int, default=200, help="Vendors and reviewers.")
+        parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1 or options["users"] < 1:
+            raise CommandError("--rows and --users must be at least 1.")
+        rng = random.Random(options["seed"])
+        rows = options["rows"]
+        self.stdout.write(f"Renderer: {'orjson' if orjson else 'json (orjson is not installed)'}")
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                User(username=f"bench-rows-{i}") for i in range(options["users"])
+            )
+            stores = Store.objects.bulk_create(
+                Store(name=f"Store {i}", description=" ".join(rng.choices(WORDS, k=10)), vendor=rng.choice(users))
+                for i in range(rows)
+            )
+            products = Product.objects.bulk_create(
+                Product(
+                    store=rng.choice(stores), name=f"{rng.choice(WORDS)} {i}",
+                    description=" ".join(rng.choices(WORDS, k=12)),
+                    price=Decimal(rng.randint(100, 100000)) / 100, stock=rng.randint(0, 50),
+                )
+                for i in range(rows)
+            )
+            Review.objects.bulk_create(
+                Review(product=rng.choice(products), user=rng.choice(users), text=" ".join(rng.choices(WORDS, k=8)))
+                for _ in range(rows)
+            )
+
+            lists = [
+                ("stores", StoreSerializer, STORE_ROWS, Store.objects.filter(vendor__in=users).order_by("id")),
+                ("products", ProductSerializer, PRODUCT_ROWS, Product.objects.filter(store__in=stores).order_by("id")),
+                ("reviews", ReviewSerializer, REVIEW_ROWS,
+                 review_queryset().filter(product__in=products).order_by("-created_at", "-id")),
+            ]
+            context = {"request": RequestFactory().get("/api/")}
+            for name, serializer_class, plan, queryset in lists:
+                def serializer_path():
+                    data = serializer_class(queryset.all(), many=True, context=context).data
+                    return JSONRenderer().render(data)
+
+                def row_path():
+                    data = plan.serialize(plan.values(queryset.all()), serializer_class(context=context))
+                    return RowJSONRenderer().render(data)
+
+                slow, slow_queries, slow_output = self._time(serializer_path, options["repeat"])
+                fast, fast_queries, fast_output = self._time(row_path, options["repeat"])
+                if fast_output != slow_output:
+                    raise CommandError(f"{name}: the row plan's output differs from the serializer's.")
+                self.stdout.write(
+                    f"{name}: serializer {rows / slow:,.0f} rows/sec ({slow_queries} queries), "
+                    f"row plan {rows / fast:,.0f} rows/sec ({fast_queries} queries), "
+                    f"{slow / fast:.1f}x faster"
+                )
+            transaction.set_rollback(True)
+
+    def _time(self, run, repeat):
+        """(best seconds, queries, output) over repeat runs of run()."""
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        best = None
+        for _ in range(repeat):
+            queries = 0
+            with connection.execute_wrapper(count):
+                started = time.perf_counter()
+                output = run()
+                elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, queries, output
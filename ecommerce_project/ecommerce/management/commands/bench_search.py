@@ -0,0 +1,76 @@
+"""
+Compare the full-text search backend with an icontains scan.
+
+Generates synthetic products inside a transaction that is rolled back at the
+end, so the database is left untouched.
+
+    python manage.py bench_search --products 100000
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ecommerce.models import Store, Product
+from ecommerce.search import REBUILD_CHUNK_SIZE, ScanSearchBackend, get_backend
+
+ADJECTIVES = ["red", "blue", "vintage", "compact", "wireless", "leather", "wooden",
+              "electric", "organic", "premium", "portable", "classic", "smart", "silver"]
+NOUNS = ["lamp", "chair", "headphones", "kettle", "backpack", "watch", "camera",
+         "guitar", "blender", "jacket", "speaker", "notebook", "bicycle", "mug"]
+FILLER = ["durable", "handmade", "lightweight", "gift", "sale", "quality", "new",
+          "warranty", "eco", "design", "comfort", "fast", "shipping", "local"]
+QUERIES = ["lamp", "wireless head", "vintage leather jacket", "guitar 4242", "kettle 9999", "nonexistent"]
+
+
+class Command(BaseCommand):
+    help = "Benchmark full-text product search against an icontains scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--stores", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        backend = get_backend()
+        scan = ScanSearchBackend()
+
+        with transaction.atomic():
+            vendor = User.objects.create_user("bench-search-vendor")
+            stores = Store.objects.bulk_create(
+                Store(name=f"{rng.choice(ADJECTIVES).title()} Store {i}", vendor=vendor)
+                for i in range(options["stores"])
+            )
+            for start in range(0, options["products"], REBUILD_CHUNK_SIZE):
+                count = min(REBUILD_CHUNK_SIZE, options["products"] - start)
+                products = Product.objects.bulk_create(
+                    Product(
+                        store=rng.choice(stores),
+                        name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {start + i}",
+                        description=" ".join(rng.choices(FILLER + NOUNS, k=12)),
+                        price=Decimal(rng.randint(100, 100000)) / 100,
+                        stock=rng.randint(0, 50),
+                    )
+                    for i in range(count)
+                )
+                backend.index_products(products)
+            self.stdout.write(f"Generated {options['products']} products; "
+                              f"backend: {backend.__class__.__name__}")
+
+            for query in QUERIES:
+                timings = {}
+                for name, engine in (("index", backend), ("icontains", scan)):
+                    started = time.perf_counter()
+                    for _ in range(options["repeat"]):
+                        hits = engine.search(query)
+                    timings[name] = (time.perf_counter() - started) / options["repeat"] * 1000
+                self.stdout.write(
+                    f"{query!r:28} index {timings['index']:8.2f} ms   "
+                    f"icontains {timings['icontains']:8.2f} ms   ({len(hits)} hits)"
+                )
+            transaction.set_rollback(True)
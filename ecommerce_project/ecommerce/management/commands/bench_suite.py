@@ -0,0 +1,307 @@
+"""
+Benchmark the main pages and API endpoints in-process and save the results
+as JSON, so runs can be compared with each other.
+
+Each scenario sends --requests requests (after --warmup unrecorded ones)
+through Django's test client as an anonymous user, a buyer or a vendor from
+the existing data (see generate_data), and records throughput, latency
+percentiles and SQL queries per request. Everything runs in a transaction
+that is rolled back, so checkouts and cart changes leave no trace and every
+run starts from the same data.
+
+    python manage.py generate_data
+    python manage.py bench_suite --output before.json
+    python manage.py bench_suite --output after.json --compare before.json
+    python manage.py bench_suite --scenario checkout --scenario view_cart --requests 500
+
+--fail-on-regression PCT exits with an error if any scenario's throughput
+fell by more than PCT percent against --compare, or if it now runs more
+queries per request.
+"""
+import json
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ecommerce.caching import CATALOGUE, PRODUCTS, REVIEWS, STORES, bump_version, product_key
+from ecommerce.cart import OutOfStock, add_item, clear_cart
+from ecommerce.models import Store, Product, Review, Order, OrderLine
+from ecommerce.roles import BUYER, VENDOR
+
+SEARCH_TERMS = ["lamp", "wireless", "vintage chair", "kettle", "leather jac", "camera 12"]
+# Statuses a scenario may return without counting as an error.
+OK_STATUSES = {200, 302, 304}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Scenario:
+    """
+    One benchmarked request. request() returns (method, path, data) for the
+    next request; prepare() runs untimed before each one.
+    """
+
+    def __init__(self, name, client, request, prepare=None):
+        self.name = name
+        self.client = client
+        self.request = request
+        self.prepare = prepare
+
+
+class Command(BaseCommand):
+    help = "Benchmark the main URLs in-process and write throughput, latency and query counts to JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Recorded requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=20, help="Unrecorded requests per scenario first.")
+        parser.add_argument("--scenario", action="append", dest="scenarios",
+                            help="Run only this scenario (repeatable).")
+        parser.add_argument("--output", help="JSON file to write (default: bench-<timestamp>.json).")
+        parser.add_argument("--compare", help="Earlier results to compare against.")
+        parser.add_argument("--fail-on-regression", type=float, metavar="PCT",
+                            help="Fail if throughput drops by more than PCT%% or queries go up.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+        elif options["fail_on_regression"] is not None:
+            raise CommandError("--fail-on-regression needs --compare.")
+
+        self.rng = random.Random(options["seed"])
+        self.touched = set()
+        try:
+            # The test client sends Host: testserver.
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]), transaction.atomic():
+                scenarios = self._scenarios()
+                wanted = options["scenarios"]
+                if wanted:
+                    unknown = set(wanted) - {scenario.name for scenario in scenarios}
+                    if unknown:
+                        raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+                    scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+                results = {}
+                for scenario in scenarios:
+                    results[scenario.name] = self._run(scenario, options["requests"], options["warmup"])
+                    self._report(scenario.name, results[scenario.name])
+                transaction.set_rollback(True)
+        finally:
+            # Pages cached during the run may show rows that were rolled back.
+            bump_version(CATALOGUE, PRODUCTS, STORES, REVIEWS, *map(product_key, self.touched))
+
+        output = options["output"] or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, "w") as f:
+            json.dump({"meta": self._meta(options), "scenarios": results}, f, indent=2)
+        self.stdout.write(f"Wrote {output}")
+
+        if baseline is not None:
+            regressions = self._compare(baseline["scenarios"], results, options["fail_on_regression"])
+            if regressions:
+                raise CommandError("Regressions: " + "; ".join(regressions))
+
+    # ----------------------------
+    # Scenarios
+    # ----------------------------
+    def _scenarios(self):
+        buyer = (
+            User.objects.filter(groups__name=BUYER, orders__isnull=False).order_by("pk").first()
+            or User.objects.filter(groups__name=BUYER).order_by("pk").first()
+        )
+        vendor = User.objects.filter(groups__name=VENDOR, store__isnull=False).order_by("pk").first()
+        product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True)[:10_000])
+        if buyer is None or vendor is None or not product_ids:
+            raise CommandError("Needs a buyer, a vendor with a store and some products; run generate_data.")
+        store_ids = list(Store.objects.order_by("pk").values_list("pk", flat=True)[:1_000])
+        order_ids = list(Order.objects.filter(user=buyer).values_list("pk", flat=True)[:1_000])
+        in_stock = list(
+            Product.objects.filter(stock__gt=0).order_by("-stock").values_list("pk", flat=True)[:1_000]
+        )
+
+        anonymous = Client(raise_request_exception=False)
+        buyer_client = Client(raise_request_exception=False)
+        buyer_client.force_login(buyer)
+        vendor_client = Client(raise_request_exception=False)
+        vendor_client.force_login(vendor)
+        pick = self.rng.choice
+
+        def add_to_cart():
+            pk = pick(product_ids)
+            self.touched.add(pk)
+            return "post", reverse("ecommerce:add_to_cart", args=[pk]), {"quantity": 1}
+
+        def fill_cart():
+            clear_cart(buyer)
+            for pk in in_stock[:3]:
+                self._add(buyer, pk)
+
+        def one_item_cart():
+            clear_cart(buyer)
+            for pk in in_stock:
+                if self._add(buyer, pk):
+                    return
+
+        get = lambda name, *args, query="": lambda: ("get", reverse(f"ecommerce:{name}", args=args) + query, None)
+        scenarios = [
+            Scenario("product_list", buyer_client, get("product_list")),
+            Scenario("product_list_page", buyer_client,
+                     lambda: ("get", reverse("ecommerce:product_list") + f"?after={pick(product_ids)}", None)),
+            Scenario("search", anonymous,
+                     lambda: ("get", reverse("ecommerce:search") + f"?q={pick(SEARCH_TERMS)}", None)),
+            Scenario("product_detail", anonymous,
+                     lambda: ("get", reverse("ecommerce:product_detail", args=[pick(product_ids)]), None)),
+            Scenario("product_reviews", anonymous,
+                     lambda: ("get", reverse("ecommerce:product_reviews", args=[pick(product_ids)]), None)),
+            Scenario("store_detail", buyer_client,
+                     lambda: ("get", reverse("ecommerce:store_detail", args=[pick(store_ids)]), None)),
+            Scenario("buyer_dashboard", buyer_client, get("buyer_dashboard")),
+            Scenario("vendor_dashboard", vendor_client, get("vendor_dashboard")),
+            Scenario("view_cart", buyer_client, get("view_cart"), prepare=fill_cart),
+            Scenario("add_to_cart", buyer_client, add_to_cart, prepare=lambda: clear_cart(buyer)),
+            Scenario("checkout", buyer_client, lambda: ("post", reverse("ecommerce:checkout"), {}),
+                     prepare=one_item_cart),
+            Scenario("api_products", anonymous, get("product-list")),
+            Scenario("api_products_by_price", anonymous, get("product-list", query="?ordering=-price")),
+            Scenario("api_product_detail", anonymous,
+                     lambda: ("get", reverse("ecommerce:product-detail", args=[pick(product_ids)]), None)),
+            Scenario("api_stores", anonymous, get("store-list")),
+            Scenario("api_store_detail", anonymous,
+                     lambda: ("get", reverse("ecommerce:store-detail", args=[pick(store_ids)]), None)),
+            Scenario("api_reviews", anonymous, get("review-list")),
+            Scenario("api_sales_revenue", vendor_client, get("analytics-revenue")),
+        ]
+        if order_ids:
+            scenarios.insert(7, Scenario(
+                "order_detail", buyer_client,
+                lambda: ("get", reverse("ecommerce:order_detail", args=[pick(order_ids)]), None),
+            ))
+        return scenarios
+
+    def _add(self, user, pk):
+        try:
+            add_item(user, Product.objects.get(pk=pk), 1)
+        except OutOfStock:
+            return False
+        self.touched.add(pk)
+        return True
+
+    # ----------------------------
+    # Running and reporting
+    # ----------------------------
+    def _run(self, scenario, requests, warmup):
+        latencies, queries, db_seconds, errors = [], [], 0.0, 0
+        stats = {"queries": 0, "db_seconds": 0.0}
+
+        def track(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats["queries"] += 1
+                stats["db_seconds"] += time.perf_counter() - started
+
+        total = 0.0
+        for i in range(warmup + requests):
+            if scenario.prepare:
+                scenario.prepare()
+            method, path, data = scenario.request()
+            stats["queries"], stats["db_seconds"] = 0, 0.0
+            with connection.execute_wrapper(track):
+                started = time.perf_counter()
+                response = getattr(scenario.client, method)(path, data)
+                elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            total += elapsed
+            latencies.append(elapsed * 1000)
+            queries.append(stats["queries"])
+            db_seconds += stats["db_seconds"]
+            errors += response.status_code not in OK_STATUSES
+
+        return {
+            "requests": requests,
+            "errors": errors,
+            "seconds": round(total, 4),
+            "req_per_sec": round(requests / total, 1) if total else 0.0,
+            "latency_ms": {
+                name: round(percentile(latencies, fraction), 2)
+                for name, fraction in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]
+            },
+            "queries": {
+                "mean": round(sum(queries) / len(queries), 2) if queries else 0.0,
+                "max": max(queries, default=0),
+            },
+            "db_share": round(db_seconds / total, 3) if total else 0.0,
+        }
+
+    def _report(self, name, result):
+        latency = result["latency_ms"]
+        self.stdout.write(
+            f"{name:24} {result['req_per_sec']:8.1f} req/s  p50 {latency['p50']:7.2f} ms  "
+            f"p99 {latency['p99']:7.2f} ms  {result['queries']['mean']:5.1f} queries"
+            + (f"  {result['errors']} errors" if result["errors"] else "")
+        )
+
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=10,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "cache": settings.CACHES["default"]["BACKEND"],
+            "rows": {
+                "users": User.objects.count(),
+                "stores": Store.objects.count(),
+                "products": Product.objects.count(),
+                "reviews": Review.objects.count(),
+                "orders": Order.objects.count(),
+                "order_lines": OrderLine.objects.count(),
+            },
+            "options": {key: options[key] for key in ("requests", "warmup", "seed")},
+        }
+
+    def _compare(self, before, after, threshold):
+        """Print the change per scenario; returns the regressions past threshold."""
+        regressions = []
+        self.stdout.write(f"{'scenario':24} {'req/s':>18} {'p99 ms':>20} {'queries':>14}")
+        for name, new in after.items():
+            old = before.get(name)
+            if old is None:
+                continue
+            change = (new["req_per_sec"] - old["req_per_sec"]) / old["req_per_sec"] * 100 if old["req_per_sec"] else 0.0
+            self.stdout.write(
+                f"{name:24} {old['req_per_sec']:7.1f} → {new['req_per_sec']:7.1f} ({change:+4.0f}%) "
+                f"{old['latency_ms']['p99']:8.2f} → {new['latency_ms']['p99']:8.2f} "
+                f"{old['queries']['mean']:5.1f} → {new['queries']['mean']:5.1f}"
+            )
+            if threshold is None:
+                continue
+            if change < -threshold:
+                regressions.append(f"{name} throughput {change:+.0f}%")
+            if new["queries"]["mean"] > old["queries"]["mean"]:
+                regressions.append(f"{name} queries {old['queries']['mean']} → {new['queries']['mean']}")
+        return regressions
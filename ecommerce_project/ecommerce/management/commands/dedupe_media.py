@@ -0,0 +1,81 @@
+"""
+Move uploads saved before content-addressed storage into digest-named blobs,
+repoint the rows that use them and delete the duplicate originals. The
+blobs' image variants are built by the outbox worker (see images.py).
+
+    python manage.py dedupe_media --dry-run
+    python manage.py dedupe_media
+    python manage.py dedupe_media --delete-orphans   # also drop unreferenced uploads
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from ecommerce.caching import CATALOGUE, PRODUCTS, STORES, bump_version, product_key, store_key
+from ecommerce.models import MediaBlob, OutboxEvent, Product, Store
+from ecommerce.outbox import enqueue
+from ecommerce.storage import content_storage, delete_blob, is_blob_path
+
+UPLOAD_DIRS = ["product_images", "store_logos"]
+
+
+class Command(BaseCommand):
+    help = "Convert legacy uploads to content-addressed blobs and remove duplicates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--delete-orphans", action="store_true",
+                            help="Delete legacy upload files that no row references.")
+
+    def handle(self, *args, **options):
+        names = set(Product.objects.exclude(image="").exclude(image=None).values_list("image", flat=True))
+        names |= set(Store.objects.exclude(logo="").exclude(logo=None).values_list("logo", flat=True))
+        legacy = sorted(n for n in names if not is_blob_path(n) and content_storage.exists(n))
+
+        legacy_bytes, blobs = 0, set()
+        for name in legacy:
+            if options["dry_run"]:
+                self.stdout.write(f"Would convert {name}")
+                continue
+            legacy_bytes += content_storage.size(name)
+            with content_storage.open(name, "rb") as f:
+                blob = content_storage.save(name, f)
+            blobs.add(blob)
+            with transaction.atomic():
+                product_rows = list(Product.objects.filter(image=name).values_list("pk", "store_id"))
+                store_ids = list(Store.objects.filter(logo=name).values_list("pk", flat=True))
+                # The legacy file's variants go with it; the blob's are queued.
+                products = Product.objects.filter(pk__in=[pk for pk, _ in product_rows]).update(
+                    image=blob, image_variants_ready=False
+                )
+                stores = Store.objects.filter(pk__in=store_ids).update(logo=blob, logo_variants_ready=False)
+                if products or stores:
+                    enqueue(OutboxEvent.IMAGE_VARIANTS, {"name": blob})
+                    # update() sends no signals; cached pages still name the old file.
+                    bump_version(
+                        CATALOGUE, PRODUCTS, STORES, *(product_key(pk) for pk, _ in product_rows),
+                        *map(store_key, {store_id for _, store_id in product_rows} | set(store_ids)),
+                    )
+                MediaBlob.objects.get_or_create(name=blob)
+                MediaBlob.objects.filter(name=blob).update(refcount=F("refcount") + products + stores)
+                MediaBlob.objects.filter(name=name).delete()
+                transaction.on_commit(lambda name=name: delete_blob(name))
+            self.stdout.write(f"{name} -> {blob}")
+
+        if options["delete_orphans"]:
+            for directory in UPLOAD_DIRS:
+                if not content_storage.exists(directory):
+                    continue
+                for filename in content_storage.listdir(directory)[1]:
+                    path = f"{directory}/{filename}"
+                    if path in names:
+                        continue
+                    if options["dry_run"]:
+                        self.stdout.write(f"Would delete orphan {path}")
+                    else:
+                        legacy_bytes += content_storage.size(path)
+                        content_storage.delete(path)
+                        self.stdout.write(f"Deleted orphan {path}")
+
+        freed = legacy_bytes - sum(content_storage.size(blob) for blob in blobs)
+        self.stdout.write(f"Converted {len(legacy)} files into {len(blobs)} blobs, freed {freed // 1024} KB")
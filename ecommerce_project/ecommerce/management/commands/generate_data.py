@@ -0,0 +1,287 @@
+"""
+Fill the database with synthetic vendors, stores, products, buyers, orders
+and reviews, for load tests and benchmarks (see bench_suite).
+
+Rows are generated lazily and written with bulk_create in --chunk-size
+batches, one transaction per batch, so millions of rows need neither
+signals nor much memory; of the products only compact columns are kept, for
+the order lines. The data that signals would otherwise maintain is rebuilt
+at the end: review stats for the new stores, sales rollups for the days the
+orders fall on, and the search index. The same --seed always produces the
+same data.
+
+    python manage.py generate_data
+    python manage.py generate_data --products 1000000 --buyers 100000 --orders 2000000 --reviews 500000
+
+Every generated user has the password given by --password. Orders are spread
+over the last --days days; Purchase and Review timestamps are the time of
+the run (they are auto_now_add).
+"""
+import random
+import time
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ecommerce.analytics import rebuild_rollups
+from ecommerce.caching import CATALOGUE, PRODUCTS, REVIEWS, STORES, bump_version
+from ecommerce.models import Store, Product, Review, Purchase, Order, OrderLine
+from ecommerce.reviews import recompute_review_stats
+from ecommerce.roles import BUYER, VENDOR
+from ecommerce.search import get_backend
+
+ADJECTIVES = ["red", "blue", "vintage", "compact", "wireless", "leather", "wooden",
+              "electric", "organic", "premium", "portable", "classic", "smart", "silver"]
+NOUNS = ["lamp", "chair", "headphones", "kettle", "backpack", "watch", "camera",
+         "guitar", "blender", "jacket", "speaker", "notebook", "bicycle", "mug"]
+FILLER = ["durable", "handmade", "lightweight", "gift", "sale", "quality", "new",
+          "warranty", "eco", "design", "comfort", "fast", "shipping", "local"]
+REVIEW_TEXT = ["Great value.", "Works as described.", "Arrived quickly.", "Not what I expected.",
+               "Would buy again.", "Solid build quality.", "A bit overpriced.", "Five stars."]
+
+
+def batches(rows, size):
+    """Lists of up to size items from the iterable rows, which is read lazily."""
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic vendors, stores, products, orders and reviews with bulk_create."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vendors", type=int, default=20)
+        parser.add_argument("--stores", type=int, default=50)
+        parser.add_argument("--products", type=int, default=20_000)
+        parser.add_argument("--buyers", type=int, default=2_000)
+        parser.add_argument("--orders", type=int, default=20_000)
+        parser.add_argument("--max-lines", type=int, default=4, help="Most lines per order.")
+        parser.add_argument("--reviews", type=int, default=20_000)
+        parser.add_argument("--verified-share", type=float, default=0.7,
+                            help="Share of reviews written by a buyer of the product.")
+        parser.add_argument("--days", type=int, default=90, help="Spread orders over this many days.")
+        parser.add_argument("--chunk-size", type=int, default=5_000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", default="synth", help="Username prefix for generated users.")
+        parser.add_argument("--password", default="synth-pass-123")
+
+    def handle(self, *args, **options):
+        if options["vendors"] < 1 or options["stores"] < 1 or options["buyers"] < 1:
+            raise CommandError("--vendors, --stores and --buyers must be at least 1.")
+        if options["products"] < 1 and (options["orders"] or options["reviews"]):
+            raise CommandError("Orders and reviews need at least one product.")
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Users named {prefix}-* already exist; pass another --prefix.")
+
+        self.rng = random.Random(options["seed"])
+        self.verbosity = options["verbosity"]
+        self.chunk_size = options["chunk_size"]
+        started = time.perf_counter()
+
+        password = make_password(options["password"])
+        vendors = self._create_users(f"{prefix}-vendor", options["vendors"], password, VENDOR)
+        buyers = self._create_users(f"{prefix}-buyer", options["buyers"], password, BUYER)
+        stores = self._create_stores(vendors, options["stores"])
+        products = self._create_products(stores, options["products"])
+        purchased, days = self._create_orders(buyers, products, options)
+        self._create_reviews(buyers, products, purchased, options)
+        self._rebuild_derived(stores, days)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Generated {len(vendors)} vendors, {len(stores)} stores, {len(products['pk'])} products, "
+            f"{len(buyers)} buyers, {options['orders']} orders and {options['reviews']} reviews "
+            f"in {elapsed:.1f}s. Log in as {prefix}-vendor-0 or {prefix}-buyer-0 "
+            f"with password {options['password']!r}."
+        )
+
+    def _log(self, message):
+        if self.verbosity > 1:
+            self.stdout.write(message)
+
+    # ----------------------------
+    # Users, stores and products
+    # ----------------------------
+    def _create_users(self, name, count, password, group_name):
+        group, _ = Group.objects.get_or_create(name=group_name)
+        users = (
+            User(username=f"{name}-{i}", email=f"{name}-{i}@example.com", password=password)
+            for i in range(count)
+        )
+        pks = array("q")
+        for batch in batches(users, self.chunk_size):
+            with transaction.atomic():
+                User.objects.bulk_create(batch)
+                User.groups.through.objects.bulk_create(
+                    User.groups.through(user_id=user.pk, group_id=group.pk) for user in batch
+                )
+            pks.extend(user.pk for user in batch)
+        self._log(f"{count} {group_name.lower()}s")
+        return pks
+
+    def _create_stores(self, vendors, count):
+        stores = Store.objects.bulk_create(
+            (
+                Store(
+                    name=f"{self.rng.choice(ADJECTIVES).title()} {self.rng.choice(NOUNS).title()} Store {i}",
+                    description=" ".join(self.rng.choices(FILLER, k=8)),
+                    vendor_id=vendors[i % len(vendors)],
+                )
+                for i in range(count)
+            ),
+            batch_size=self.chunk_size,
+        )
+        self._log(f"{count} stores")
+        return [store.pk for store in stores]
+
+    def _create_products(self, stores, count):
+        """
+        Create products; returns their pk, store, price (in cents) and the
+        ADJECTIVES/NOUNS indexes of their name as parallel arrays (see
+        _product_name).
+        """
+        rng = self.rng
+        columns = {"pk": array("q"), "store": array("q"), "cents": array("q"),
+                   "adjective": array("B"), "noun": array("B")}
+
+        def rows():
+            for i in range(count):
+                adjective, noun = rng.randrange(len(ADJECTIVES)), rng.randrange(len(NOUNS))
+                yield Product(
+                    store_id=rng.choice(stores),
+                    name=f"{ADJECTIVES[adjective]} {NOUNS[noun]} {i}",
+                    description=" ".join(rng.choices(FILLER + NOUNS, k=12)),
+                    price=Decimal(rng.randint(100, 50_000)) / 100,
+                    stock=rng.randint(0, 500),
+                ), adjective, noun
+
+        done = 0
+        for batch in batches(rows(), self.chunk_size):
+            with transaction.atomic():
+                Product.objects.bulk_create(product for product, _, _ in batch)
+            for product, adjective, noun in batch:
+                columns["pk"].append(product.pk)
+                columns["store"].append(product.store_id)
+                columns["cents"].append(int(product.price * 100))
+                columns["adjective"].append(adjective)
+                columns["noun"].append(noun)
+            done += len(batch)
+            self._log(f"{done} products")
+        return columns
+
+    @staticmethod
+    def _product_name(products, i):
+        return f"{ADJECTIVES[products['adjective'][i]]} {NOUNS[products['noun'][i]]} {i}"
+
+    # ----------------------------
+    # Orders and reviews
+    # ----------------------------
+    def _create_orders(self, buyers, products, options):
+        """
+        Create orders with their lines and purchases. Returns a sample of
+        (buyer, product) pairs that were bought, for verified reviews, and
+        the (first, last) day the orders fall on (None without orders).
+        """
+        rng = self.rng
+        now = timezone.now()
+        window = options["days"] * 86400
+        wanted = int(options["reviews"] * options["verified_share"])
+        sample, seen = [], 0
+        first = last = None
+
+        def baskets():
+            for _ in range(options["orders"]):
+                lines = rng.randint(1, min(options["max_lines"], len(products["pk"])))
+                picks = rng.sample(range(len(products["pk"])), lines)
+                created_at = now - timedelta(seconds=rng.randint(0, window))
+                yield rng.choice(buyers), created_at, [(i, rng.randint(1, 3)) for i in picks]
+
+        def price(i):
+            return Decimal(products["cents"][i]) / 100
+
+        done = 0
+        for batch in batches(baskets(), self.chunk_size):
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(
+                    Order(
+                        user_id=buyer, created_at=created_at,
+                        item_count=sum(qty for _, qty in lines),
+                        total=sum(price(i) * qty for i, qty in lines),
+                    )
+                    for buyer, created_at, lines in batch
+                )
+                OrderLine.objects.bulk_create(
+                    (
+                        OrderLine(
+                            order_id=order.pk, product_id=products["pk"][i], store_id=products["store"][i],
+                            product_name=self._product_name(products, i), unit_price=price(i), quantity=qty,
+                            subtotal=price(i) * qty,
+                        )
+                        for order, (_, _, lines) in zip(orders, batch) for i, qty in lines
+                    ),
+                    batch_size=self.chunk_size,
+                )
+                Purchase.objects.bulk_create(
+                    (
+                        Purchase(user_id=buyer, product_id=products["pk"][i], quantity=qty)
+                        for buyer, _, lines in batch for i, qty in lines
+                    ),
+                    batch_size=self.chunk_size,
+                )
+            for buyer, created_at, lines in batch:
+                first = created_at if first is None else min(first, created_at)
+                last = created_at if last is None else max(last, created_at)
+                # Reservoir sample of bought pairs, so memory stays flat.
+                for i, _ in lines:
+                    seen += 1
+                    if len(sample) < wanted:
+                        sample.append((buyer, products["pk"][i]))
+                    elif wanted and rng.random() < wanted / seen:
+                        sample[rng.randrange(wanted)] = (buyer, products["pk"][i])
+            done += len(batch)
+            self._log(f"{done} orders")
+        days = (timezone.localdate(first), timezone.localdate(last)) if first else None
+        return sample, days
+
+    def _create_reviews(self, buyers, products, purchased, options):
+        rng = self.rng
+
+        def reviews():
+            for n in range(options["reviews"]):
+                if n < len(purchased):
+                    user, product, verified = *purchased[n], True
+                else:
+                    user, product, verified = rng.choice(buyers), rng.choice(products["pk"]), False
+                yield Review(product_id=product, user_id=user, text=rng.choice(REVIEW_TEXT), verified=verified)
+
+        done = 0
+        for batch in batches(reviews(), self.chunk_size):
+            with transaction.atomic():
+                Review.objects.bulk_create(batch)
+            done += len(batch)
+            self._log(f"{done} reviews")
+
+    # ----------------------------
+    # Derived data
+    # ----------------------------
+    def _rebuild_derived(self, stores, days):
+        """Everything signals and checkout would have kept up to date."""
+        with transaction.atomic():
+            # The products are new, so no page of theirs is cached yet.
+            recompute_review_stats(Product.objects.filter(store__in=stores), invalidate_rows=False)
+        if days:
+            rebuild_rollups(*days)
+        backend = get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        bump_version(CATALOGUE, PRODUCTS, STORES, REVIEWS)
+        self._log("review stats, sales rollups and search index rebuilt")
@@ -0,0 +1,50 @@
+"""
+Backfill resized JPEG/WebP variants for existing product images and store
+logos, spreading the work over a process pool, and mark the rows using them
+as having variants (uploads get theirs from the outbox worker).
+
+    python manage.py generate_image_variants --workers 4
+    python manage.py generate_image_variants --missing-only
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from ecommerce.images import generate_variants_safely, mark_variants_ready, variant_name
+from ecommerce.models import Store, Product
+
+
+def _setup_worker():
+    # Needed when the pool spawns fresh interpreters instead of forking.
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Generate image variants for all product images and store logos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--missing-only", action="store_true",
+                            help="Skip images whose variants already exist.")
+
+    def handle(self, *args, **options):
+        names = set(Product.objects.exclude(image="").exclude(image=None).values_list("image", flat=True))
+        names |= set(Store.objects.exclude(logo="").exclude(logo=None).values_list("logo", flat=True))
+        if options["missing_only"]:
+            existing = {n for n in names if default_storage.exists(variant_name(n, "thumb", "jpeg"))}
+            mark_variants_ready(existing)
+            names -= existing
+        names = sorted(n for n in names if default_storage.exists(n))
+
+        done = []
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=_setup_worker) as pool:
+            for name, written in zip(names, pool.map(generate_variants_safely, names, chunksize=4)):
+                if written:
+                    done.append(name)
+                else:
+                    self.stderr.write(f"Failed: {name}")
+        mark_variants_ready(done)
+        self.stdout.write(f"Generated variants for {len(done)} of {len(names)} images")
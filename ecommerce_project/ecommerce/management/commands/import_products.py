@@ -0,0 +1,54 @@
+"""
+Create or update products in bulk from a CSV or JSON Lines file.
+
+    python manage.py import_products products.csv --vendor alice
+
+Columns: id, store, name, description, price, stock. Rows with an id update
+that product; rows without one are created. See ecommerce/bulk.py.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.bulk import EXTENSIONS, format_for, import_products
+from ecommerce.models import Store
+
+
+class Command(BaseCommand):
+    help = "Bulk import products from a .csv or .jsonl file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=sorted(set(EXTENSIONS.values())),
+            help="File format (default: from the file extension).",
+        )
+        parser.add_argument("--vendor", help="Only allow rows for this vendor's stores.")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or format_for(options["path"])
+        if fmt is None:
+            raise CommandError("Cannot tell the format from the file name; pass --format.")
+
+        store_ids = None
+        if options["vendor"]:
+            try:
+                vendor = User.objects.get(username=options["vendor"])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['vendor']!r}")
+            store_ids = Store.objects.filter(vendor=vendor).values_list("pk", flat=True)
+
+        try:
+            stream = open(options["path"], "rb")
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with stream:
+            result = import_products(stream, fmt, store_ids)
+
+        for error in result["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if result["error_count"] > len(result["errors"]):
+            self.stderr.write(f"... and {result['error_count'] - len(result['errors'])} more errors")
+        self.stdout.write(
+            f"Created {result['created']}, updated {result['updated']}, "
+            f"skipped {result['error_count']} invalid rows"
+        )
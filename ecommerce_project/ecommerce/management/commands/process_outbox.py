@@ -0,0 +1,35 @@
+"""
+Deliver queued tweets and emails from the outbox.
+
+    python manage.py process_outbox            # drain what is due, then exit
+    python manage.py process_outbox --loop     # keep polling
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.outbox import MAX_ATTEMPTS, process_batch
+
+
+class Command(BaseCommand):
+    help = "Send pending outbox events (tweets, invoice emails) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+        parser.add_argument("--loop", action="store_true", help="Poll forever.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls.")
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                claimed = process_batch(options["batch_size"], options["max_attempts"])
+                total += claimed
+                if claimed < options["batch_size"]:
+                    break
+            if total:
+                self.stdout.write(f"Processed {total} outbox events")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,32 @@
+"""
+Delete expired password reset tokens in batches.
+
+    python manage.py purge_reset_tokens            # purge once, then exit
+    python manage.py purge_reset_tokens --loop     # keep purging
+
+Expired tokens are already rejected; this only keeps the table small.
+Schedule it (e.g. hourly from cron) or run it with --loop.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.tokens import PURGE_BATCH_SIZE, purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired password reset tokens in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Purge forever.")
+        parser.add_argument("--interval", type=float, default=3600.0, help="Seconds between purges.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = purge_expired_tokens(options["batch_size"])
+            if deleted:
+                self.stdout.write(f"Deleted {deleted} expired reset tokens")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
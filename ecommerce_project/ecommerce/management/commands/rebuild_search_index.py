@@ -0,0 +1,19 @@
+"""
+Repopulate the product search table from scratch.
+
+    python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ecommerce.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(f"Rebuilt search index with {backend.__class__.__name__}")
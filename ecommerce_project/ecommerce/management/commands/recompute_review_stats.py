@@ -0,0 +1,28 @@
+"""
+Rebuild Product.review_count / verified_review_count / last_reviewed_at from
+the Review table, in primary-key batches so no single UPDATE runs for long.
+
+    python manage.py recompute_review_stats --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from ecommerce.models import Product
+from ecommerce.reviews import recompute_review_stats
+
+
+class Command(BaseCommand):
+    help = "Repair drift in the denormalized product review stats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        size = options["batch_size"]
+        last_pk = Product.objects.aggregate(last=Max("pk"))["last"] or 0
+        updated = 0
+        for start in range(0, last_pk, size):
+            updated += recompute_review_stats(
+                Product.objects.filter(pk__gt=start, pk__lte=start + size)
+            )
+        self.stdout.write(f"Recomputed review stats for {updated} products")
@@ -0,0 +1,39 @@
+"""
+Rebuild and compact the daily sales rollups behind the vendor analytics API.
+
+    python manage.py rollup_sales                              # every day with orders
+    python manage.py rollup_sales --from 2025-01-01 --to 2025-01-31
+    python manage.py rollup_sales --compact-only
+
+Checkout keeps the rollups current, so this is only needed for a backfill
+or to repair them. Each day is rebuilt in its own short transaction.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.analytics import compact_rollups, order_days, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute daily sales rollups from order lines, then compact them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="first", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--to", dest="last", help="Last day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--compact-only", action="store_true", help="Skip the rebuild.")
+
+    def handle(self, *args, **options):
+        if not options["compact_only"]:
+            bounds = order_days()
+            try:
+                first = date.fromisoformat(options["first"]) if options["first"] else bounds and bounds[0]
+                last = date.fromisoformat(options["last"]) if options["last"] else bounds and bounds[1]
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            if first and last:
+                written = rebuild_rollups(first, last)
+                self.stdout.write(f"Rebuilt {first} to {last}: {written} rollup rows")
+            else:
+                self.stdout.write("No orders to roll up")
+        self.stdout.write(f"Compacted {compact_rollups()} rollup rows")
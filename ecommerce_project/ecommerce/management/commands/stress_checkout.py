@@ -0,0 +1,113 @@
+"""
+Multi-threaded checkout stress test.
+
+Runs many concurrent checkouts against a handful of hot products on the
+configured database (SQLite or MariaDB), then checks that the stock that
+was decremented matches the quantity that was purchased, i.e. nothing was
+oversold. There is less stock than orders by default, so the last checkouts
+race for the last units and must be turned away; the atomic checkout fails
+the command unless every product ends at 0 with nothing oversold. Pass
+--legacy to run the old per-line read/modify/save loop for comparison.
+
+    python manage.py stress_checkout --threads 8 --orders 400
+    python manage.py stress_checkout --threads 8 --orders 400 --legacy
+"""
+import itertools
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from ecommerce.cart import OutOfStock, checkout_cart
+from ecommerce.models import Store, Product, Purchase
+
+
+def legacy_checkout(user, cart):
+    """The pre-transaction checkout loop, kept only as a baseline."""
+    for pid, qty in cart.items():
+        product = Product.objects.get(pk=int(pid))
+        if product.stock < qty:
+            raise OutOfStock(product)
+        product.stock -= qty
+        product.save()
+        Purchase.objects.create(user=user, product=product, quantity=qty)
+
+
+class Command(BaseCommand):
+    help = "Hammer checkout from several threads and verify stock is never oversold."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--orders", type=int, default=400, help="Total checkouts to attempt.")
+        parser.add_argument("--products", type=int, default=3, help="Hot products per cart.")
+        parser.add_argument("--stock", type=int, default=300,
+                            help="Starting stock per product (keep it below --orders to sell out).")
+        parser.add_argument("--legacy", action="store_true", help="Use the old non-atomic checkout.")
+
+    def handle(self, *args, **options):
+        checkout = legacy_checkout if options["legacy"] else checkout_cart
+        suffix = str(int(time.time() * 1000))
+        vendor = User.objects.create_user(f"stress-vendor-{suffix}")
+        buyer = User.objects.create_user(f"stress-buyer-{suffix}")
+        # bulk_create skips post_save, so no tweets are queued for fixtures.
+        store = Store.objects.bulk_create([Store(name="Stress store", vendor=vendor)])[0]
+        products = Product.objects.bulk_create(
+            Product(store=store, name=f"Hot {i}", description="", price=Decimal("9.99"),
+                    stock=options["stock"])
+            for i in range(options["products"])
+        )
+        cart = {str(p.pk): 1 for p in products}
+
+        counter = itertools.count()
+        results = {"ok": 0, "out_of_stock": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while next(counter) < options["orders"]:
+                    try:
+                        checkout(buyer, cart)
+                        outcome = "ok"
+                    except OutOfStock:
+                        outcome = "out_of_stock"
+                    except OperationalError:
+                        outcome = "errors"
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        oversold, left = 0, 0
+        for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+            sold = Purchase.objects.filter(product=product).aggregate(n=Sum("quantity"))["n"] or 0
+            oversold += max(0, sold - (options["stock"] - product.stock))
+            left += product.stock
+
+        self.stdout.write(
+            f"{'legacy' if options['legacy'] else 'atomic'} checkout: "
+            f"{results['ok']} orders, {results['out_of_stock']} out of stock, "
+            f"{results['errors']} errors in {elapsed:.2f}s "
+            f"({results['ok'] / elapsed:.1f} orders/sec), oversold units: {oversold}, units left: {left}"
+        )
+
+        vendor.delete()
+        buyer.delete()
+        if options["legacy"]:
+            return
+        if oversold:
+            raise CommandError(f"Oversold {oversold} units.")
+        # Every checkout that wasn't an error either took one of each or found one short.
+        if options["orders"] - results["errors"] >= options["stock"] and left:
+            raise CommandError(f"{left} units left after {results['ok']} orders; expected to sell out.")
@@ -0,0 +1,32 @@
+"""
+Delete expired stock reservations (cart holds) in batches.
+
+    python manage.py sweep_reservations            # sweep once, then exit
+    python manage.py sweep_reservations --loop     # keep sweeping
+
+Expired holds already stop counting against available stock; this only
+keeps the table small. Run it from cron or alongside process_outbox.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.cart import SWEEP_BATCH_SIZE, sweep_reservations
+
+
+class Command(BaseCommand):
+    help = "Delete expired stock reservations in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Sweep forever.")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between sweeps.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep_reservations(options["batch_size"])
+            if deleted:
+                self.stdout.write(f"Deleted {deleted} expired reservations")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,78 @@
+"""
+Per-view request metrics and query budgets.
+
+ViewMetricsMiddleware records, for every request, the number of SQL queries,
+the time spent in the database and the rest of the request's wall time
+(middleware, view code, templates and serialization: everything but the
+queries themselves), keyed by the resolved URL name. Totals are kept in
+process memory and exposed in Prometheus text format at /metrics.
+
+QUERY_BUDGETS maps URL names to the most queries a GET request to that view
+may run. Going over budget logs a warning, or raises QueryBudgetExceeded when
+QUERY_BUDGET_STRICT is on (the test runner turns it on). Requests that fail
+are not checked, so their own error is what gets reported.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_totals = defaultdict(lambda: {"requests": 0, "queries": 0, "db_seconds": 0.0, "non_db_seconds": 0.0})
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def record(view_name, queries, db_seconds, total_seconds):
+    with _lock:
+        totals = _totals[view_name]
+        totals["requests"] += 1
+        totals["queries"] += queries
+        totals["db_seconds"] += db_seconds
+        totals["non_db_seconds"] += max(total_seconds - db_seconds, 0.0)
+
+
+def check_budget(view_name, queries):
+    budget = getattr(settings, "QUERY_BUDGETS", {}).get(view_name)
+    if budget is None or queries <= budget:
+        return
+    message = f"{view_name} ran {queries} queries (budget {budget})"
+    if getattr(settings, "QUERY_BUDGET_STRICT", False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def snapshot():
+    with _lock:
+        return {name: dict(values) for name, values in _totals.items()}
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+METRICS = [
+    ("requests", "ecommerce_view_requests_total", "counter", "Requests handled per view."),
+    ("queries", "ecommerce_view_queries_total", "counter", "SQL queries run per view."),
+    ("db_seconds", "ecommerce_view_db_seconds_total", "counter", "Seconds spent in the database per view."),
+    ("non_db_seconds", "ecommerce_view_non_db_seconds_total", "counter",
+     "Seconds of request time not spent running queries (middleware, view code, templates) per view."),
+]
+
+
+def render_prometheus():
+    data = snapshot()
+    lines = []
+    for key, metric, kind, help_text in METRICS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for view_name in sorted(data):
+            label = view_name.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{metric}{{view="{label}"}} {data[view_name][key]}')
+    return "\n".join(lines) + "\n"
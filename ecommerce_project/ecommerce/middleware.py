@@ -0,0 +1,72 @@
+"""
+Request instrumentation middleware (see metrics.py).
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+
+from . import metrics
+
+
+class ViewMetricsMiddleware:
+    """
+    Count queries and time spent in the database for each request and record
+    them against the resolved URL name. Put it first in MIDDLEWARE so session
+    and auth queries are included.
+
+    Works in both sync and async stacks, so under ASGI async views are not
+    forced back into a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, track = self._tracker()
+        started = time.perf_counter()
+        with connection.execute_wrapper(track):
+            response = self.get_response(request)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # The ORM runs in the request's sync thread, which has its own
+        # connection, so the wrapper is installed there.
+        stats, track = self._tracker()
+        started = time.perf_counter()
+        await sync_to_async(lambda: connection.execute_wrappers.append(track))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(track))()
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _tracker(self):
+        stats = {"queries": 0, "db_seconds": 0.0}
+
+        def track(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats["queries"] += 1
+                stats["db_seconds"] += time.perf_counter() - started
+
+        return stats, track
+
+    def _record(self, request, response, stats, total_seconds):
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else "unresolved"
+        metrics.record(view_name, stats["queries"], stats["db_seconds"], total_seconds)
+        # An error response's queries say little about the view, and raising
+        # here would hide the error itself.
+        if request.method in ("GET", "HEAD") and response.status_code < 400:
+            metrics.check_budget(view_name, stats["queries"])
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+SEARCH_TABLE = "ecommerce_product_search"
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            f"name, description, store_name, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, store_name) VALUES (%s, %s, %s, %s)"
+    elif vendor == "mysql":
+        schema_editor.execute(
+            f"CREATE TABLE {SEARCH_TABLE} ("
+            f"product_id bigint NOT NULL PRIMARY KEY, "
+            f"name varchar(255) NOT NULL, "
+            f"description longtext NOT NULL, "
+            f"store_name varchar(100) NOT NULL, "
+            f"FULLTEXT KEY {SEARCH_TABLE}_fulltext (name, description, store_name)"
+            f") ENGINE=InnoDB"
+        )
+        insert = f"INSERT INTO {SEARCH_TABLE} (product_id, name, description, store_name) VALUES (%s, %s, %s, %s)"
+    else:
+        return
+
+    Product = apps.get_model("ecommerce", "Product")
+    rows = list(Product.objects.values_list("pk", "name", "description", "store__name"))
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, rows)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "mysql"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0006_outboxevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
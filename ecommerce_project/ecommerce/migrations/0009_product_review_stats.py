@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:06
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_review_stats(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    Review = apps.get_model('ecommerce', 'Review')
+
+    def review_count(**filters):
+        counts = (
+            Review.objects.filter(product=OuterRef('pk'), **filters)
+            .order_by().values('product').annotate(n=Count('pk')).values('n')
+        )
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Product.objects.update(
+        review_count=review_count(),
+        verified_review_count=review_count(verified=True),
+        last_reviewed_at=Subquery(
+            Review.objects.filter(product=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0008_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='last_reviewed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='verified_review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:13
+
+import ecommerce.storage
+from django.db import migrations, models
+
+
+def count_existing_references(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    Store = apps.get_model('ecommerce', 'Store')
+    MediaBlob = apps.get_model('ecommerce', 'MediaBlob')
+
+    counts = {}
+    names = list(Product.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+    names += list(Store.objects.exclude(logo='').exclude(logo=None).values_list('logo', flat=True))
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    MediaBlob.objects.bulk_create(MediaBlob(name=name, refcount=n) for name, n in counts.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0010_review_product_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=ecommerce.storage.ContentAddressedStorage(), upload_to='product_images/'),
+        ),
+        migrations.AlterField(
+            model_name='store',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=ecommerce.storage.ContentAddressedStorage(), upload_to='store_logos/'),
+        ),
+        migrations.RunPython(count_existing_references, migrations.RunPython.noop),
+    ]
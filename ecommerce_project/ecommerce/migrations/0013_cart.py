@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def carts_from_sessions(apps, schema_editor):
+    """Copy the JSON carts of unexpired sessions into Cart/CartItem rows."""
+    from django.contrib.sessions.backends.db import SessionStore
+
+    Session = apps.get_model('sessions', 'Session')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Product = apps.get_model('ecommerce', 'Product')
+    Cart = apps.get_model('ecommerce', 'Cart')
+    CartItem = apps.get_model('ecommerce', 'CartItem')
+
+    store = SessionStore()
+    sessions = Session.objects.filter(expire_date__gt=timezone.now()).order_by('expire_date')
+    for session in sessions.iterator():
+        data = store.decode(session.session_data)
+        cart = data.get('cart')
+        user_id = data.get('_auth_user_id')
+        if not cart or not user_id or not User.objects.filter(pk=user_id).exists():
+            continue
+        quantities = {}
+        for pid, qty in cart.items():
+            try:
+                pid, qty = int(pid), int(qty)
+            except (TypeError, ValueError):
+                continue
+            if qty > 0:
+                quantities[pid] = quantities.get(pid, 0) + qty
+        products = set(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+        if not products:
+            continue
+        user_cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        for pid in products:
+            updated = CartItem.objects.filter(cart=user_cart, product_id=pid).update(
+                quantity=F('quantity') + quantities[pid], updated_at=timezone.now()
+            )
+            if not updated:
+                CartItem.objects.create(cart=user_cart, product_id=pid, quantity=quantities[pid])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0012_updated_at'),
+        ('sessions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cart', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='ecommerce.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ecommerce.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product')],
+            },
+        ),
+        migrations.RunPython(carts_from_sessions, migrations.RunPython.noop),
+    ]
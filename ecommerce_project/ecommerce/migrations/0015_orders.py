@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def orders_from_purchases(apps, schema_editor):
+    """
+    Group existing purchases into orders: one per user and checkout, taken
+    as purchases made within a second of each other. Their prices were
+    never recorded, so the current product price is used.
+    """
+    Purchase = apps.get_model('ecommerce', 'Purchase')
+    Order = apps.get_model('ecommerce', 'Order')
+    OrderLine = apps.get_model('ecommerce', 'OrderLine')
+
+    def flush(group):
+        lines = [
+            OrderLine(product=p.product, product_name=p.product.name, unit_price=p.product.price,
+                      quantity=p.quantity, subtotal=p.product.price * p.quantity)
+            for p in group
+        ]
+        order = Order.objects.create(
+            user_id=group[0].user_id,
+            created_at=group[0].purchased_at,
+            item_count=sum(line.quantity for line in lines),
+            total=sum(line.subtotal for line in lines),
+        )
+        for line in lines:
+            line.order = order
+        OrderLine.objects.bulk_create(lines)
+
+    purchases = Purchase.objects.select_related('product').order_by('user_id', 'purchased_at', 'pk')
+    group = []
+    for purchase in purchases.iterator(chunk_size=2000):
+        if group and (purchase.user_id != group[0].user_id
+                      or purchase.purchased_at - group[-1].purchased_at > timedelta(seconds=1)):
+            flush(group)
+            group = []
+        group.append(purchase)
+    if group:
+        flush(group)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0014_stock_reservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_name', models.CharField(max_length=255)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity', models.PositiveIntegerField()),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='ecommerce.order')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_lines', to='ecommerce.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='ecommerce_o_user_id_cb1717_idx'),
+        ),
+        migrations.RunPython(orders_from_purchases, migrations.RunPython.noop),
+    ]
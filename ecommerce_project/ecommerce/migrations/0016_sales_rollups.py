@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_stores_and_rollups(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    OrderLine = apps.get_model('ecommerce', 'OrderLine')
+    SalesDailyRollup = apps.get_model('ecommerce', 'SalesDailyRollup')
+
+    OrderLine.objects.filter(store=None, product__isnull=False).update(
+        store=Subquery(Product.objects.filter(pk=OuterRef('product')).values('store')[:1])
+    )
+    totals = (
+        OrderLine.objects.filter(store__isnull=False)
+        .values('store', 'product', day=TruncDate('order__created_at'))
+        .annotate(units=Sum('quantity'), revenue=Sum('subtotal'))
+        .order_by()
+    )
+    SalesDailyRollup.objects.bulk_create(
+        (SalesDailyRollup(store_id=row['store'], product_id=row['product'], day=row['day'],
+                          units=row['units'], revenue=row['revenue'])
+         for row in totals.iterator(chunk_size=2000)),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0015_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderline',
+            name='store',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_lines', to='ecommerce.store'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_rollups', to='ecommerce.product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='ecommerce.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['store', 'day'], name='ecommerce_s_store_i_06e95b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('store', 'product', 'day'), name='unique_store_product_day')],
+            },
+        ),
+        migrations.RunPython(fill_stores_and_rollups, migrations.RunPython.noop),
+    ]
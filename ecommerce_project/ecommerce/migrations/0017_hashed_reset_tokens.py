@@ -0,0 +1,36 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    ResetToken = apps.get_model('ecommerce', 'ResetToken')
+    for token in ResetToken.objects.all():
+        token.token_hash = hashlib.sha256(token.token_hash.encode()).hexdigest()
+        token.save(update_fields=['token_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0016_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='resettoken',
+            old_name='token',
+            new_name='token_hash',
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='resettoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='resettoken',
+            name='expiry_date',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from ecommerce.images import variant_name
+
+
+def mark_existing_variants(apps, schema_editor):
+    # One storage check per stored image, so readers never need to make one.
+    Product = apps.get_model('ecommerce', 'Product')
+    Store = apps.get_model('ecommerce', 'Store')
+    for model, field in ((Product, 'image'), (Store, 'logo')):
+        names = set(model.objects.exclude(**{field: ''}).exclude(**{field: None}).values_list(field, flat=True))
+        ready = [n for n in names if default_storage.exists(variant_name(n, 'thumb', 'jpeg'))]
+        model.objects.filter(**{f'{field}__in': ready}).update(**{f'{field}_variants_ready': True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0017_hashed_reset_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='logo_variants_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='kind',
+            field=models.CharField(choices=[('tweet', 'Tweet'), ('email', 'Email'), ('image_variants', 'Image variants')], max_length=20),
+        ),
+        migrations.RunPython(mark_existing_variants, migrations.RunPython.noop),
+    ]
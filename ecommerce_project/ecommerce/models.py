@@ -1,75 +1,255 @@
-from django.db import models
-from django.contrib.auth.models import User
-from django.conf import settings
-from django.utils import timezone
-
-
-# ----------------------------
-# Stores
-# ----------------------------
-class Store(models.Model):
-    name = models.CharField(max_length=100)
-    description = models.TextField(blank=True)
-    logo = models.ImageField(upload_to="store_logos/", blank=True, null=True)
-    vendor = models.ForeignKey(User, on_delete=models.CASCADE)
-
-    def __str__(self):
-        return self.name
-
-# ----------------------------
-# Products
-# ----------------------------
-class Product(models.Model):
-    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='products')
-    name = models.CharField(max_length=255)
-    description = models.TextField()
-    price = models.DecimalField(max_digits=10, decimal_places=2)
-    stock = models.PositiveIntegerField(default=0)
-    image = models.ImageField(upload_to='product_images/', blank=True, null=True)
-
-    def __str__(self):
-        return f"{self.name} - {self.store.name}"
-
-
-# ----------------------------
-# Reviews
-# ----------------------------
-class Review(models.Model):
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    text = models.TextField()
-    verified = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return f"Review by {self.user.username} on {self.product.name}"
-
-
-# ----------------------------
-# Purchases
-# ----------------------------
-class Purchase(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField(default=1)
-    purchased_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return f"{self.quantity} x {self.product.name} by {self.user.username}"
-
-
-# ----------------------------
-# Password Reset Tokens
-# ----------------------------
-class ResetToken(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    token = models.CharField(max_length=500, unique=True)
-    expiry_date = models.DateTimeField()
-    used = models.BooleanField(default=False)
-
-    def is_expired(self):
-        return timezone.now() > self.expiry_date
-
-    def __str__(self):
-        return f"{self.user.username} - {self.token[:8]}"
-
+from django.db import models
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.utils import timezone
+
+from .storage import content_storage
+
+
+# ----------------------------
+# Stores
+# ----------------------------
+class Store(models.Model):
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    logo = models.ImageField(upload_to="store_logos/", storage=content_storage, blank=True, null=True)
+    # Set by the outbox worker once the logo's variants are written (images.py)
+    logo_variants_ready = models.BooleanField(default=False)
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.name
+
+# ----------------------------
+# Products
+# ----------------------------
+class Product(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='products')
+    name = models.CharField(max_length=255)
+    description = models.TextField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0)
+    image = models.ImageField(upload_to='product_images/', storage=content_storage, blank=True, null=True)
+    # Set by the outbox worker once the image's variants are written (images.py)
+    image_variants_ready = models.BooleanField(default=False)
+
+    # Denormalized review stats, maintained by signals.py
+    # (repair with `manage.py recompute_review_stats`)
+    review_count = models.PositiveIntegerField(default=0)
+    verified_review_count = models.PositiveIntegerField(default=0)
+    last_reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    # Bumped on every change, including the queryset updates that bypass
+    # save() (checkout, review stats, bulk writes); the API's ETags use it.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["store", "price"]),
+            models.Index(fields=["stock"]),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.store.name}"
+
+
+# ----------------------------
+# Reviews
+# ----------------------------
+class Review(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    text = models.TextField()
+    verified = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "created_at"])]
+
+    def __str__(self):
+        return f"Review by {self.user.username} on {self.product.name}"
+
+
+# ----------------------------
+# Purchases
+# ----------------------------
+class Purchase(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    purchased_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} by {self.user.username}"
+
+
+# ----------------------------
+# Orders
+# ----------------------------
+# One checkout. Prices and totals are captured when the order is placed, so
+# order history and invoices don't change when products do.
+class Order(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    item_count = models.PositiveIntegerField(default=0)  # units, across all lines
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.pk} by {self.user.username}"
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    # Kept (with the name and price below) if the product is deleted later.
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name="order_lines")
+    store = models.ForeignKey(Store, on_delete=models.SET_NULL, null=True, blank=True, related_name="order_lines")
+    product_name = models.CharField(max_length=255)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} in order #{self.order_id}"
+
+
+# Units and revenue per store, product and day, kept up to date at checkout
+# (see analytics.py) so sales reports never scan OrderLine or Purchase.
+# Rebuild or compact with `manage.py rollup_sales`.
+class SalesDailyRollup(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="sales_rollups")
+    # NULL once the product is deleted; its sales still count for the store.
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name="sales_rollups")
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["store", "product", "day"], name="unique_store_product_day"),
+        ]
+        indexes = [
+            models.Index(fields=["store", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.units} x {self.product_id} from {self.store_id} on {self.day}"
+
+
+# ----------------------------
+# Carts
+# ----------------------------
+class Cart(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="cart")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Cart of {self.user.username}"
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    added_at = models.DateTimeField(auto_now_add=True)
+    # Last change, for finding abandoned carts.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "product"], name="unique_cart_product"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} in {self.cart}"
+
+
+# Stock held for one buyer's cart line until expires_at (see cart.py).
+# Available stock is stock minus the unexpired holds of other buyers;
+# `manage.py sweep_reservations` deletes expired rows.
+class StockReservation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="unique_user_product_reservation"),
+        ]
+        indexes = [
+            models.Index(fields=["product", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for {self.user_id} until {self.expires_at}"
+
+
+# ----------------------------
+# Password Reset Tokens
+# ----------------------------
+# Only the SHA-256 of each token is stored; the token itself is only in the
+# emailed link (see tokens.py). `manage.py purge_reset_tokens` deletes
+# expired rows.
+class ResetToken(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    token_hash = models.CharField(max_length=64, unique=True)
+    expiry_date = models.DateTimeField(db_index=True)
+    used = models.BooleanField(default=False)
+
+    def is_expired(self):
+        return timezone.now() > self.expiry_date
+
+    def __str__(self):
+        return f"{self.user.username} - {self.token_hash[:8]}"
+
+
+
+# ----------------------------
+# Outbox (tweets, emails)
+# ----------------------------
+class OutboxEvent(models.Model):
+    TWEET = "tweet"
+    EMAIL = "email"
+    IMAGE_VARIANTS = "image_variants"
+    KIND_CHOICES = [(TWEET, "Tweet"), (EMAIL, "Email"), (IMAGE_VARIANTS, "Image variants")]
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (SENT, "Sent"), (FAILED, "Failed")]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    dedup_key = models.CharField(max_length=255, unique=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.dedup_key} ({self.status})"
+
+
+# ----------------------------
+# Uploaded media blobs
+# ----------------------------
+class MediaBlob(models.Model):
+    """Reference count for a content-addressed upload (see storage.py)."""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
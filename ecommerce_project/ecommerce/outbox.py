@@ -0,0 +1,180 @@
+"""
+Durable outbox for outbound side effects (tweets, emails) and slow work that
+should not hold up a request (image variants).
+
+Request handlers only call enqueue(); the process_outbox management command
+claims due events in batches, hands each batch to the handler for its kind
+and reschedules failures with exponential backoff.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import generate_variants, mark_variants_ready
+from .models import OutboxEvent
+from .twitter_client import get_twitter_client
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed event stays invisible to other workers.
+LEASE = timedelta(minutes=5)
+BACKOFF_BASE = timedelta(seconds=30)
+MAX_ATTEMPTS = 5
+
+
+def enqueue(kind, payload, dedup_key=None):
+    """
+    Record an outbound event. Enqueuing the same dedup_key twice is a no-op,
+    so callers can safely enqueue from signals that may fire more than once.
+    """
+    event, _ = OutboxEvent.objects.get_or_create(
+        dedup_key=dedup_key or f"{kind}:{uuid.uuid4()}",
+        defaults={"kind": kind, "payload": payload},
+    )
+    return event
+
+
+# ----------------------------
+# Handlers
+# ----------------------------
+# Each handler receives a batch of events of one kind and returns a list of
+# error strings aligned with the batch (None for events that went out).
+# Handlers whose deliveries can't be taken back mark each event sent as soon
+# as it goes out, so a crash later in the batch doesn't send it again.
+
+def send_tweets(events):
+    client = get_twitter_client()
+    if not client:
+        # Not delivered: they back off and are retried, then end up failed
+        # with this error if Twitter stays unconfigured.
+        return ["Twitter is not configured"] * len(events)
+
+    errors = []
+    for event in events:
+        try:
+            client.create_tweet(text=event.payload["text"][:280])  # 280 char limit
+        except Exception as e:
+            errors.append(str(e) or e.__class__.__name__)
+        else:
+            mark_sent([event.pk])
+            errors.append(None)
+    return errors
+
+
+def send_emails(events):
+    # One backend connection for the batch, but each email is sent and
+    # marked on its own, so one failure doesn't resend the ones before it.
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        return [str(e) or e.__class__.__name__] * len(events)
+
+    errors = []
+    try:
+        for event in events:
+            payload = event.payload
+            message = EmailMultiAlternatives(
+                subject=payload["subject"],
+                body=payload["message"],
+                from_email=payload.get("from_email"),
+                to=payload["recipient_list"],
+                connection=connection,
+            )
+            if payload.get("html_message"):
+                message.attach_alternative(payload["html_message"], "text/html")
+            try:
+                message.send()
+            except Exception as e:
+                errors.append(str(e) or e.__class__.__name__)
+            else:
+                mark_sent([event.pk])
+                errors.append(None)
+    finally:
+        connection.close()
+    return errors
+
+
+def build_image_variants(events):
+    errors = []
+    for event in events:
+        name = event.payload["name"]
+        try:
+            # Skip uploads whose last reference was dropped before we got here.
+            if default_storage.exists(name):
+                generate_variants(name)
+                mark_variants_ready([name])
+            errors.append(None)
+        except Exception as e:
+            errors.append(str(e) or e.__class__.__name__)
+    return errors
+
+
+HANDLERS = {
+    OutboxEvent.TWEET: send_tweets,
+    OutboxEvent.EMAIL: send_emails,
+    OutboxEvent.IMAGE_VARIANTS: build_image_variants,
+}
+
+
+# ----------------------------
+# Worker
+# ----------------------------
+def mark_sent(pks):
+    OutboxEvent.objects.filter(pk__in=pks).update(
+        status=OutboxEvent.SENT, sent_at=timezone.now(), last_error=""
+    )
+
+
+def claim_batch(batch_size):
+    """
+    Lease up to batch_size due events to this worker. Leased events are
+    pushed forward by LEASE so a crashed worker's batch is retried later.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEvent.PENDING, available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+            available_at=now + LEASE, attempts=F("attempts") + 1
+        )
+    for event in events:
+        event.attempts += 1
+    return events
+
+
+def process_batch(batch_size=50, max_attempts=MAX_ATTEMPTS):
+    """Claim and deliver one batch of due events. Returns the number claimed."""
+    events = claim_batch(batch_size)
+    by_kind = {}
+    for event in events:
+        by_kind.setdefault(event.kind, []).append(event)
+
+    for kind, batch in by_kind.items():
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            errors = [f"No handler for {kind!r}"] * len(batch)
+        else:
+            errors = handler(batch)
+
+        now = timezone.now()
+        mark_sent([event.pk for event, error in zip(batch, errors) if error is None])
+        for event, error in zip(batch, errors):
+            if error is None:
+                continue
+            logger.warning("Outbox %s failed (attempt %d): %s", event, event.attempts, error)
+            if event.attempts >= max_attempts:
+                changes = {"status": OutboxEvent.FAILED}
+            else:
+                changes = {"available_at": now + BACKOFF_BASE * 2 ** (event.attempts - 1)}
+            OutboxEvent.objects.filter(pk=event.pk).update(last_error=error, **changes)
+    return len(events)
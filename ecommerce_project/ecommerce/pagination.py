@@ -0,0 +1,107 @@
+"""
+Keyset (cursor) pagination for the HTML catalogue and the REST API.
+"""
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+
+CATALOGUE_PAGE_SIZE = 20
+REVIEW_PAGE_SIZE = 10
+ORDER_PAGE_SIZE = 10
+
+
+def parse_cursor(value):
+    """Return value as a positive int primary key, or None if it isn't one."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+class KeysetPage:
+    """
+    One page of a queryset, ordered by primary key.
+
+    Pages are addressed by the pk of the last row before them (after=) or the
+    first row after them (before=) instead of an OFFSET, so every page costs
+    the same single indexed query. Rows are fetched lazily on first access,
+    which lets a cached template fragment skip the query entirely.
+    """
+
+    def __init__(self, queryset, after=None, before=None, page_size=CATALOGUE_PAGE_SIZE):
+        self.queryset = queryset
+        self.after = after
+        self.before = before if after is None else None
+        self.page_size = page_size
+
+    @cached_property
+    def _page(self):
+        size = self.page_size
+        if self.before is not None:
+            rows = list(self.queryset.filter(pk__lt=self.before).order_by("-pk")[:size + 1])
+            has_previous, has_next = len(rows) > size, True
+            rows = rows[:size][::-1]
+        else:
+            queryset = self.queryset
+            if self.after is not None:
+                queryset = queryset.filter(pk__gt=self.after)
+            rows = list(queryset.order_by("pk")[:size + 1])
+            has_previous, has_next = self.after is not None, len(rows) > size
+            rows = rows[:size]
+        return rows, has_previous, has_next
+
+    @property
+    def object_list(self):
+        return self._page[0]
+
+    @property
+    def next_cursor(self):
+        rows, _, has_next = self._page
+        return rows[-1].pk if rows and has_next else None
+
+    @property
+    def previous_cursor(self):
+        rows, has_previous, _ = self._page
+        return rows[0].pk if rows and has_previous else None
+
+
+class ProductCursorPagination(CursorPagination):
+    page_size = CATALOGUE_PAGE_SIZE
+    ordering = "id"
+
+
+class ReviewCursorPagination(CursorPagination):
+    page_size = REVIEW_PAGE_SIZE
+    ordering = ("-created_at", "-id")
+
+
+class OrderCursorPagination(CursorPagination):
+    page_size = ORDER_PAGE_SIZE
+    ordering = ("-created_at", "-id")
+
+
+def _paginate(paginator, request, queryset, base_url):
+    rows = paginator.paginate_queryset(queryset, Request(request))
+    paginator.base_url = request.build_absolute_uri(base_url)
+    return rows
+
+
+def paginate_reviews(request, queryset, base_url):
+    """
+    One page of reviews for a plain Django view, with the same cursors as the
+    reviews API. Returns (reviews, next_url) where next_url points at base_url.
+    """
+    paginator = ReviewCursorPagination()
+    reviews = _paginate(paginator, request, queryset, base_url)
+    return reviews, paginator.get_next_link()
+
+
+def paginate_orders(request, queryset, base_url):
+    """
+    One page of orders, newest first, for the order history. Returns
+    (orders, next_url, previous_url).
+    """
+    paginator = OrderCursorPagination()
+    orders = _paginate(paginator, request, queryset, base_url)
+    return orders, paginator.get_next_link(), paginator.get_previous_link()
@@ -3,6 +3,8 @@ Custom DRF permissions for role-based access control.
 """
 from rest_framework import permissions
 
+from .roles import is_vendor
+
 
 class IsVendorOrReadOnly(permissions.BasePermission):
     """
@@ -15,7 +17,7 @@ class IsVendorOrReadOnly(permissions.BasePermission):
             return True
         
         # Write permissions only for authenticated vendors
-        return request.user.is_authenticated and request.user.groups.filter(name='Vendor').exists()
+        return is_vendor(request.user)
     
     def has_object_permission(self, request, view, obj):
         # Read permissions for anyone
@@ -56,7 +58,4 @@ class IsAuthenticatedVendor(permissions.BasePermission):
     Permission for vendor-only actions.
     """
     def has_permission(self, request, view):
-        return (
-            request.user.is_authenticated and
-            request.user.groups.filter(name='Vendor').exists()
-        )
+        return is_vendor(request.user)
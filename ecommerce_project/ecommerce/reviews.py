@@ -0,0 +1,99 @@
+"""
+Upkeep of the denormalized review stats on Product.
+
+signals.py applies an F() delta whenever a Review is created, deleted or has
+its verified flag flipped, whichever path did it (add_review, the API or the
+admin). Reviews deleted in a cascade (a user or product going away) are
+instead gathered up and their products recomputed once, on commit.
+recompute_review_stats() rebuilds the numbers from the Review table.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+
+from .caching import PRODUCTS, REVIEWS, bump_version, product_key
+from .models import Product, Review
+
+
+def _latest_review_at():
+    return Subquery(
+        Review.objects.filter(product=OuterRef("pk"))
+        .order_by("-created_at")
+        .values("created_at")[:1]
+    )
+
+
+def _review_count(**filters):
+    counts = (
+        Review.objects.filter(product=OuterRef("pk"), **filters)
+        .order_by()
+        .values("product")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def review_added(review):
+    Product.objects.filter(pk=review.product_id).update(
+        review_count=F("review_count") + 1,
+        verified_review_count=F("verified_review_count") + int(review.verified),
+        last_reviewed_at=Coalesce(
+            Greatest("last_reviewed_at", Value(review.created_at)), Value(review.created_at)
+        ),
+        updated_at=Now(),
+    )
+
+
+def review_removed(review):
+    Product.objects.filter(pk=review.product_id).update(
+        review_count=F("review_count") - 1,
+        verified_review_count=F("verified_review_count") - int(review.verified),
+        last_reviewed_at=_latest_review_at(),
+        updated_at=Now(),
+    )
+
+
+def review_removed_in_cascade(review, origin):
+    """
+    review was deleted along with origin (the object or queryset whose
+    delete() cascaded to it). The products involved are recomputed once
+    after the delete commits, rather than updated once per review.
+    """
+    pending = origin.__dict__.setdefault("_review_stats_products", set())
+    if not pending:
+        transaction.on_commit(lambda: _recompute_after_cascade(origin))
+    pending.add(review.product_id)
+
+
+def _recompute_after_cascade(origin):
+    product_ids = origin.__dict__.pop("_review_stats_products", set())
+    bump_version(REVIEWS)
+    # Products deleted in the same cascade simply match nothing.
+    recompute_review_stats(Product.objects.filter(pk__in=product_ids))
+
+
+def review_verified_changed(review):
+    delta = 1 if review.verified else -1
+    Product.objects.filter(pk=review.product_id).update(
+        verified_review_count=F("verified_review_count") + delta,
+        updated_at=Now(),
+    )
+
+
+def recompute_review_stats(products=None, invalidate_rows=True):
+    """
+    Recompute stats for products (a queryset; all products by default).
+    Pass invalidate_rows=False for products that cannot have been cached
+    yet (just created), to skip bumping one cache version per product.
+    """
+    if products is None:
+        products = Product.objects.all()
+    rows = products.values_list("pk", flat=True) if invalidate_rows else []
+    bump_version(PRODUCTS, *map(product_key, rows))
+    return products.update(
+        review_count=_review_count(),
+        verified_review_count=_review_count(verified=True),
+        last_reviewed_at=_latest_review_at(),
+        updated_at=Now(),
+    )
@@ -0,0 +1,80 @@
+"""
+Role resolution (Vendor / Buyer) shared by views, permissions and templates.
+
+A user's group names are fetched with one query, memoized on the user object
+for the rest of the request and kept in the cache backend for
+ROLE_CACHE_TIMEOUT seconds (0 disables the cache). signals.py invalidates the
+cached entry whenever User.groups changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VENDOR = "Vendor"
+BUYER = "Buyer"
+
+
+def _cache_key(user_id):
+    return f"ecommerce:roles:{user_id}"
+
+
+def get_roles(user):
+    """Return the set of group names for user (empty for anonymous users)."""
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, "_ecommerce_roles", None)
+    if roles is None:
+        timeout = getattr(settings, "ROLE_CACHE_TIMEOUT", 300)
+        names = cache.get(_cache_key(user.pk)) if timeout else None
+        if names is None:
+            names = list(user.groups.values_list("name", flat=True))
+            if timeout:
+                cache.set(_cache_key(user.pk), names, timeout)
+        roles = frozenset(names)
+        user._ecommerce_roles = roles
+    return roles
+
+
+async def aget_roles(user):
+    """get_roles() for async views, using the async cache and ORM APIs."""
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, "_ecommerce_roles", None)
+    if roles is None:
+        timeout = getattr(settings, "ROLE_CACHE_TIMEOUT", 300)
+        names = await cache.aget(_cache_key(user.pk)) if timeout else None
+        if names is None:
+            names = [name async for name in user.groups.values_list("name", flat=True)]
+            if timeout:
+                await cache.aset(_cache_key(user.pk), names, timeout)
+        roles = frozenset(names)
+        user._ecommerce_roles = roles
+    return roles
+
+
+def invalidate_roles(*user_ids):
+    """
+    Drop the cached roles of these users: now, and again when the current
+    transaction commits, in case another request re-cached the old groups in
+    between.
+    """
+    if not user_ids:
+        return
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def is_vendor(user):
+    return VENDOR in get_roles(user)
+
+
+async def ais_vendor(user):
+    return VENDOR in await aget_roles(user)
+
+
+def is_buyer(user):
+    return BUYER in get_roles(user)
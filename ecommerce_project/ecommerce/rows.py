@@ -0,0 +1,167 @@
+"""
+Read-only fast path for the API's list actions.
+
+A list normally builds a model instance per row and runs it through the
+ModelSerializer field by field. RowListMixin instead fetches .values()
+rows, with related usernames joined in the same query, and turns them into
+the serializer's output with a RowPlan: the lookups and conversions worked
+out once from the serializer's fields. The output is the same as the
+serializer's (tests compare the bytes), and is rendered with orjson when it
+is installed.
+"""
+from operator import itemgetter
+
+from django.db.models import FileField
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields whose to_representation() leaves a .values() value as it is.
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField, serializers.CharField, serializers.IntegerField,
+    serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField,
+)
+
+
+class RowPlan:
+    """
+    A serializer's output, built from .values() rows.
+
+    Each field is read from the lookup its source names ("vendor.username"
+    becomes "vendor__username", a foreign key gives its id). Values that need
+    converting (dates, decimals, files) go through the serializer's own bound
+    field, so they come out exactly as before. A SerializerMethodField needs
+    an entry in computed: name -> (lookup, function(value, serializer)); the
+    lookup may be a tuple of lookups, and value is then the tuple of their
+    values (never None). As in the serializer, a None value is output as null, and so is a file
+    field with no file.
+    """
+
+    def __init__(self, serializer_class, computed=None):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+
+    @cached_property
+    def _fields(self):
+        """[(name, lookup)] in output order."""
+        fields = []
+        for name, field in self.serializer_class().fields.items():
+            if name in self.computed:
+                lookup = self.computed[name][0]
+            elif isinstance(field, serializers.SerializerMethodField):
+                raise ValueError(f"{self.serializer_class.__name__}.{name} needs an entry in computed.")
+            else:
+                lookup = field.source.replace(".", "__")
+            fields.append((name, lookup))
+        return fields
+
+    @cached_property
+    def lookups(self):
+        lookups = []
+        for _, lookup in self._fields:
+            lookups.extend(lookup if isinstance(lookup, tuple) else [lookup])
+        return list(dict.fromkeys(lookups))
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def _converters(self, serializer):
+        """[(index, function)] for the fields whose values need converting."""
+        model = self.serializer_class.Meta.model
+        converters = []
+        for index, (name, lookup) in enumerate(self._fields):
+            if name in self.computed:
+                function = self.computed[name][1]
+                convert = lambda value, function=function: function(value, serializer)
+            else:
+                field = serializer.fields[name]
+                if isinstance(field, PASSTHROUGH_FIELDS):
+                    continue
+                if isinstance(field, serializers.DateTimeField) and not hasattr(field, "timezone"):
+                    # Look the current time zone up once, not once per row.
+                    field.timezone = field.default_timezone()
+                convert = field.to_representation
+            is_plain = isinstance(lookup, str) and "__" not in lookup
+            if is_plain and isinstance(model._meta.get_field(lookup), FileField):
+                convert = self._with_field_file(model._meta.get_field(lookup), convert)
+            converters.append((index, convert))
+        return converters
+
+    @staticmethod
+    def _with_field_file(model_field, convert):
+        # .values() gives a file's name; serializers expect a FieldFile.
+        return lambda name: convert(model_field.attr_class(None, model_field, name)) if name else None
+
+    def serialize(self, rows, serializer):
+        """
+        Output for rows from values(), converted with the fields of
+        serializer (an instance of serializer_class, with the request's
+        context).
+        """
+        names = [name for name, _ in self._fields]
+        getter = itemgetter(*(lookup for _, lookup in self._fields if not isinstance(lookup, tuple)))
+        combined = [
+            (index, itemgetter(*lookup)) for index, (_, lookup) in enumerate(self._fields)
+            if isinstance(lookup, tuple)
+        ]
+        converters = self._converters(serializer)
+        data = []
+        for row in rows:
+            values = list(getter(row))
+            for index, get in combined:
+                values.insert(index, get(row))
+            for index, convert in converters:
+                if values[index] is not None:
+                    values[index] = convert(values[index])
+            data.append(dict(zip(names, values)))
+        return data
+
+
+class RowJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson. Only used for RowPlan output,
+    which holds nothing but dicts, lists, strings, ints, bools and None, so
+    the bytes are the same as JSONRenderer's. Anything else (indented output,
+    types orjson rejects) is left to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these so the output is also valid JavaScript.
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+
+
+class RowListMixin:
+    """
+    ViewSet mixin: list serializes with row_plan (a RowPlan for the list's
+    serializer class) and renders with RowJSONRenderer. The queryset's
+    filtering, ordering and pagination are unchanged.
+    """
+    row_plan = None
+
+    def get_renderers(self):
+        if self.action == "list" and self.row_plan is not None:
+            return [RowJSONRenderer()]
+        return super().get_renderers()
+
+    def list(self, request, *args, **kwargs):
+        if self.row_plan is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.row_plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = self.row_plan.serialize(rows, self.get_serializer())
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,185 @@
+"""
+Full-text product search.
+
+Products are mirrored into a search table (ecommerce_product_search, created
+by migration 0007) holding the product name, description and store name.
+The backend is picked from the database vendor:
+
+- SQLite: an FTS5 virtual table ranked with bm25()
+- MySQL/MariaDB: an InnoDB table with a FULLTEXT index (boolean mode)
+- anything else: a plain icontains scan
+
+signals.py keeps the table in sync; rebuild_search_index repopulates it.
+Set SEARCH_BACKEND to a dotted class path to override the choice.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+SEARCH_TABLE = "ecommerce_product_search"
+MAX_RESULTS = 50
+REBUILD_CHUNK_SIZE = 2000
+
+
+def tokenize(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _index_rows(products):
+    """(id, name, description, store name) tuples for products."""
+    return [(p.pk, p.name, p.description or "", p.store.name) for p in products]
+
+
+class ScanSearchBackend:
+    """Fallback: AND of icontains matches over the indexed fields. No ranking."""
+
+    def search(self, query, limit=MAX_RESULTS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        queryset = Product.objects.all()
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term) | Q(store__name__icontains=term)
+            )
+        return list(queryset.order_by("pk").values_list("pk", flat=True)[:limit])
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rename_store(self, store):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class TableSearchBackend(ScanSearchBackend):
+    """Shared upkeep for backends that mirror products into SEARCH_TABLE."""
+
+    key_column = None
+    insert_sql = None
+
+    def index_products(self, products):
+        self.write_rows(_index_rows(products))
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, [row[0] for row in rows])
+            cursor.executemany(self.insert_sql, rows)
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            self._delete(cursor, list(product_ids))
+
+    def _delete(self, cursor, product_ids):
+        if product_ids:
+            placeholders = ", ".join(["%s"] * len(product_ids))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE {self.key_column} IN ({placeholders})",
+                product_ids,
+            )
+
+    def rename_store(self, store):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {SEARCH_TABLE} SET store_name = %s WHERE {self.key_column} IN "
+                f"(SELECT id FROM ecommerce_product WHERE store_id = %s)",
+                [store.name, store.pk],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        rows = (
+            Product.objects.order_by()
+            .values_list("pk", "name", "description", "store__name")
+            .iterator(chunk_size=REBUILD_CHUNK_SIZE)
+        )
+        for chunk in _chunks(rows, REBUILD_CHUNK_SIZE):
+            with connection.cursor() as cursor:
+                cursor.executemany(self.insert_sql, chunk)
+
+
+class SQLiteFTSBackend(TableSearchBackend):
+    key_column = "rowid"
+    insert_sql = (
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, store_name) VALUES (%s, %s, %s, %s)"
+    )
+
+    def search(self, query, limit=MAX_RESULTS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Every term must match; the last one may be a prefix ("lam" -> "lamp").
+        match = " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0) LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class MySQLFullTextBackend(TableSearchBackend):
+    key_column = "product_id"
+    insert_sql = (
+        f"INSERT INTO {SEARCH_TABLE} (product_id, name, description, store_name) VALUES (%s, %s, %s, %s)"
+    )
+
+    def search(self, query, limit=MAX_RESULTS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Boolean mode: every term required, the last one as a prefix.
+        against = " ".join(f"+{term}" for term in terms[:-1]) + f" +{terms[-1]}*"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id, MATCH(name, description, store_name) AGAINST (%s IN BOOLEAN MODE) AS score "
+                f"FROM {SEARCH_TABLE} WHERE MATCH(name, description, store_name) AGAINST (%s IN BOOLEAN MODE) "
+                f"ORDER BY score DESC LIMIT %s",
+                [against, against, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "mysql": MySQLFullTextBackend,
+}
+
+
+def get_backend():
+    backend_path = getattr(settings, "SEARCH_BACKEND", None)
+    if backend_path:
+        return import_string(backend_path)()
+    return BACKENDS.get(connection.vendor, ScanSearchBackend)()
+
+
+def search_products(query, limit=MAX_RESULTS):
+    """Products matching query, best match first."""
+    ids = get_backend().search(query, limit)
+    products = Product.objects.select_related("store").in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
@@ -1,35 +1,193 @@
-from rest_framework import serializers
-from .models import Store, Product, Review
-
-# Compact Store serializer with vendor username
-class StoreSerializer(serializers.ModelSerializer):
-    vendor = serializers.ReadOnlyField(source="vendor.username")
-
-    class Meta:
-        model = Store
-        fields = ["id", "name", "description", "vendor"]
-
-
-# Full Store serializer with all fields
-class StoreDetailSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Store
-        fields = "__all__"
-
-
-# Product serializer
-class ProductSerializer(serializers.ModelSerializer):
-    store = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all())
-
-    class Meta:
-        model = Product
-        fields = ["id", "name", "description", "price", "stock", "store", "image"]
-
-
-# Review serializer
-class ReviewSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source="user.username")
-
-    class Meta:
-        model = Review
-        fields = ["id", "product", "user", "text", "verified", "created_at"]
+from django.utils import timezone
+from rest_framework import serializers
+from .models import Store, Product, Review
+from .images import variant_urls
+from .caching import CATALOGUE, PRODUCTS, bump_version, product_key, store_key
+from .search import get_backend as get_search_backend
+from .rows import RowPlan
+
+# Most items one bulk request may carry.
+BULK_MAX_ITEMS = 5000
+
+# Compact Store serializer with vendor username
+class StoreSerializer(serializers.ModelSerializer):
+    vendor = serializers.ReadOnlyField(source="vendor.username")
+
+    class Meta:
+        model = Store
+        fields = ["id", "name", "description", "vendor"]
+
+
+# Plans for the list endpoints' fast path (see rows.py); they follow the
+# serializers' fields, so keep computed in step with any method fields.
+STORE_ROWS = RowPlan(StoreSerializer)
+
+
+# Full Store serializer with all fields
+class StoreDetailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Store
+        fields = "__all__"
+
+
+# Store pk that is looked up in the batch's preloaded context["stores"] when
+# a bulk request set one, instead of one query per item.
+class ProductStoreField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        stores = self.context.get("stores")
+        if stores is None:
+            return super().to_internal_value(data)
+        try:
+            return stores[int(data)]
+        except (KeyError, TypeError, ValueError):
+            self.fail("does_not_exist", pk_value=data)
+
+
+# many=True Product serializer for the bulk endpoints. The stores a batch names
+# are fetched (and ownership checked) in one query, and writes go through
+# bulk_create()/bulk_update(). Product instances are matched to items by "id".
+class ProductBulkSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            store_ids = {str(item.get("store")) for item in data if isinstance(item, dict)}
+            self._context["stores"] = Store.objects.filter(
+                vendor=self.context["request"].user
+            ).in_bulk([int(pk) for pk in store_ids if pk.isdigit()])
+        if self.instance is not None:
+            self._instances = {p.pk: p for p in self.instance}
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            pk = data.get("id") if isinstance(data, dict) else None
+            instance = self._instances.get(pk) if isinstance(pk, int) else None
+            if instance is None:
+                raise serializers.ValidationError({"id": ["No product with this id in your stores."]})
+            self.child.instance = instance
+            self.child.initial_data = data
+        attrs = super().run_child_validation(data)
+        if attrs.get("image"):
+            raise serializers.ValidationError({"image": ["Images cannot be set in bulk."]})
+        if self.instance is not None:
+            attrs["id"] = data["id"]
+        return attrs
+
+    def create(self, validated_data):
+        products = Product.objects.bulk_create(Product(**attrs) for attrs in validated_data)
+        self._changed(products, {p.store_id for p in products})
+        return products
+
+    def update(self, instances, validated_data):
+        by_id = {p.pk: p for p in instances}
+        products, supplied = [], {}
+        store_ids = {p.store_id for p in instances}
+        for attrs in validated_data:
+            product = by_id[attrs.pop("id")]
+            for name, value in attrs.items():
+                setattr(product, name, value)
+            supplied.setdefault(product.pk, set()).update(attrs)
+            products.append(product)
+        # One bulk_update() per set of fields, so each row only gets the
+        # columns its items supplied (not, say, a stale stock).
+        groups = {}
+        for pk, fields in supplied.items():
+            if fields:
+                groups.setdefault(tuple(sorted(fields)), []).append(by_id[pk])
+        now = timezone.now()
+        for fields, group in groups.items():
+            # bulk_update() skips auto_now, so stamp the changed rows here.
+            for product in group:
+                product.updated_at = now
+            Product.objects.bulk_update(group, [*fields, "updated_at"])
+        self._changed(products, store_ids | {p.store_id for p in products})
+        return products
+
+    def _changed(self, products, store_ids):
+        # bulk_create()/bulk_update() send no signals; do their upkeep once.
+        get_search_backend().index_products(products)
+        bump_version(
+            CATALOGUE, PRODUCTS, *(product_key(p.pk) for p in products), *map(store_key, store_ids)
+        )
+
+
+# Product serializer
+class ProductSerializer(serializers.ModelSerializer):
+    store = ProductStoreField(queryset=Store.objects.all())
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = [
+            "id", "name", "description", "price", "stock", "store", "image",
+            "review_count", "verified_review_count", "last_reviewed_at", "image_variants",
+        ]
+        read_only_fields = ["review_count", "verified_review_count", "last_reviewed_at"]
+        list_serializer_class = ProductBulkSerializer
+
+    def get_image_variants(self, obj):
+        """{"thumb"|"card"|"detail": {"jpeg": url, "webp": url}}, or null"""
+        return image_variants((obj.image.name, obj.image_variants_ready), self)
+
+
+def image_variants(image, serializer):
+    """image is (stored name, variants ready)."""
+    urls = variant_urls(*image)
+    request = serializer.context.get("request")
+    if urls and request:
+        urls = {variant: {fmt: request.build_absolute_uri(url) for fmt, url in formats.items()}
+                for variant, formats in urls.items()}
+    return urls
+
+
+PRODUCT_ROWS = RowPlan(ProductSerializer, computed={"image_variants": (("image", "image_variants_ready"), image_variants)})
+
+
+# One row of a bulk product import (see bulk.py). Stores are checked against
+# context["store_ids"] instead of a query per row.
+class ProductImportSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False, min_value=1)
+    store = serializers.IntegerField()
+
+    class Meta:
+        model = Product
+        fields = ["id", "store", "name", "description", "price", "stock"]
+
+    def validate_store(self, value):
+        if value not in self.context["store_ids"]:
+            raise serializers.ValidationError(f'Invalid pk "{value}" - object does not exist.')
+        return value
+
+
+# Review serializer
+class ReviewSerializer(serializers.ModelSerializer):
+    user = serializers.ReadOnlyField(source="user.username")
+
+    class Meta:
+        model = Review
+        fields = ["id", "product", "user", "text", "verified", "created_at"]
+
+
+REVIEW_ROWS = RowPlan(ReviewSerializer)
+
+
+# Read-only rows of the vendor sales reports (see analytics.py)
+class RevenueDaySerializer(serializers.Serializer):
+    day = serializers.DateField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class TopProductSerializer(serializers.Serializer):
+    product = serializers.IntegerField(allow_null=True)
+    name = serializers.CharField(allow_null=True)
+    store = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SellThroughSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    units = serializers.IntegerField()
+    stock = serializers.IntegerField()
+    sell_through = serializers.FloatField()
@@ -1,24 +1,170 @@
-# ecommerce/signals.py
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Store, Product
-from .twitter_client import post_tweet
-
-@receiver(post_save, sender=Store)
-def tweet_on_new_store(sender, instance, created, **kwargs):
-    if not created:
-        return
-    name = instance.name
-    desc = (instance.description or "").strip()
-    message = f"🛍️ New Store: {name}\n{desc}" if desc else f"🛍️ New Store: {name}"
-    image = instance.logo if getattr(instance, 'logo', None) else None
-    post_tweet(message, image_field=image)
-
-@receiver(post_save, sender=Product)
-def tweet_on_new_product(sender, instance, created, **kwargs):
-    if not created:
-        return
-    store_name = instance.store.name
-    message = f"🆕 New Product from {store_name}\n{instance.name}\n{(instance.description or '')}"
-    image = instance.image if getattr(instance, 'image', None) else None
-    post_tweet(message, image_field=image)
+# ecommerce/signals.py
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Store, Product, Review, OutboxEvent
+from . import reviews
+from . import storage
+from .outbox import enqueue
+from .roles import invalidate_roles
+from .caching import CATALOGUE, PRODUCTS, REVIEWS, STORES, bump_version, product_key, store_key
+from .search import get_backend as get_search_backend
+
+@receiver(post_save, sender=Store)
+def tweet_on_new_store(sender, instance, created, **kwargs):
+    if not created:
+        return
+    name = instance.name
+    desc = (instance.description or "").strip()
+    message = f"🛍️ New Store: {name}\n{desc}" if desc else f"🛍️ New Store: {name}"
+    enqueue(OutboxEvent.TWEET, {"text": message}, dedup_key=f"tweet:store:{instance.pk}")
+
+@receiver(post_save, sender=Product)
+def tweet_on_new_product(sender, instance, created, **kwargs):
+    if not created:
+        return
+    store_name = instance.store.name
+    message = f"🆕 New Product from {store_name}\n{instance.name}\n{(instance.description or '')}"
+    enqueue(OutboxEvent.TWEET, {"text": message}, dedup_key=f"tweet:product:{instance.pk}")
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_group_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # Invalidate after the rows change, so a request can't re-cache the old
+    # groups between the invalidation and the write.
+    if reverse and action == "pre_clear":
+        # instance is the Group; clear() gives no pk_set, and afterwards the
+        # users are gone from user_set.
+        instance._cleared_user_ids = list(instance.user_set.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        # instance is the User
+        instance.__dict__.pop("_ecommerce_roles", None)
+        invalidate_roles(instance.pk)
+    elif action == "post_clear":
+        invalidate_roles(*instance.__dict__.pop("_cleared_user_ids", []))
+    else:
+        invalidate_roles(*pk_set)
+
+@receiver(post_init, sender=Product)
+def remember_store(sender, instance, **kwargs):
+    instance._stored_store_id = instance.__dict__.get("store_id")
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    store_ids = {instance.store_id, getattr(instance, "_stored_store_id", None)} - {None}
+    bump_version(CATALOGUE, PRODUCTS, product_key(instance.pk), *map(store_key, store_ids))
+    instance._stored_store_id = instance.store_id
+
+@receiver(post_save, sender=Store)
+def invalidate_store_caches(sender, instance, created, **kwargs):
+    # Product pages depend on store_key too (they show the store name).
+    bump_version(CATALOGUE, STORES, store_key(instance.pk))
+
+@receiver(post_delete, sender=Store)
+def invalidate_deleted_store_caches(sender, instance, **kwargs):
+    bump_version(CATALOGUE, STORES, store_key(instance.pk))
+
+def _cascaded(origin):
+    """Whether a Review is being deleted because something it belongs to is."""
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not Review
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_caches(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin):
+        return  # bumped once by reviews.review_removed_in_cascade()
+    bump_version(REVIEWS, PRODUCTS, product_key(instance.product_id))
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index_products([instance])
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+@receiver(post_save, sender=Store)
+def reindex_store_products(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().rename_store(instance)
+
+@receiver(post_init, sender=Review)
+def remember_review_verified(sender, instance, **kwargs):
+    instance._stored_verified = instance.__dict__.get("verified") if instance.pk is not None else None
+
+@receiver(post_save, sender=Review)
+def update_review_stats_on_save(sender, instance, created, update_fields, **kwargs):
+    verified = instance.__dict__.get("verified")
+    if created:
+        reviews.review_added(instance)
+    elif verified is None or (update_fields is not None and "verified" not in update_fields):
+        return
+    elif instance._stored_verified is None:
+        # verified was deferred when the review was loaded; the old value is unknown.
+        reviews.recompute_review_stats(Product.objects.filter(pk=instance.product_id))
+    elif instance._stored_verified != verified:
+        reviews.review_verified_changed(instance)
+    instance._stored_verified = verified
+
+@receiver(post_delete, sender=Review)
+def update_review_stats_on_delete(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin):
+        reviews.review_removed_in_cascade(instance, origin)
+    else:
+        reviews.review_removed(instance)
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Store)
+def note_new_image(sender, instance, **kwargs):
+    # A fresh upload still has its original name here; storage renames it.
+    name = _image_name(instance)
+    instance._new_image = name is not None and name != instance._stored_image
+    if instance._new_image:
+        setattr(instance, "image_variants_ready" if sender is Product else "logo_variants_ready", False)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Store)
+def queue_image_variants(sender, instance, **kwargs):
+    if getattr(instance, "_new_image", False):
+        instance._new_image = False
+        name = _image_name(instance)
+        if name:
+            enqueue(OutboxEvent.IMAGE_VARIANTS, {"name": name})
+
+def _image_name(instance):
+    """Stored image name, "" if empty, or None if the field was deferred."""
+    attname = "image" if isinstance(instance, Product) else "logo"
+    if attname not in instance.__dict__:
+        return None
+    value = instance.__dict__[attname]
+    return getattr(value, "name", value) or ""
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=Store)
+def remember_stored_image(sender, instance, **kwargs):
+    instance._stored_image = _image_name(instance) if instance.pk is not None else ""
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Store)
+def track_image_references(sender, instance, **kwargs):
+    old, new = instance._stored_image, _image_name(instance)
+    if old is None or new is None or old == new:
+        return
+    if new:
+        storage.acquire(new)
+    if old:
+        storage.release(old)
+    instance._stored_image = new
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Store)
+def release_image(sender, instance, **kwargs):
+    if instance._stored_image:
+        storage.release(instance._stored_image)
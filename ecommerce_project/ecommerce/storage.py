@@ -0,0 +1,102 @@
+"""
+Content-addressed storage for uploaded images.
+
+Uploads are hashed (SHA-256, streamed chunk by chunk) and stored once under
+their digest, e.g. product_images/3f/3fa9...c1.jpg, so the same file uploaded
+twice is kept once and its URL never changes content. MediaBlob counts the
+rows that reference each blob; signals.py calls acquire()/release() as
+Product.image and Store.logo change, and a blob (with its variants) is
+deleted after the commit that drops its last reference, unless a new
+upload of the same content has taken a reference since.
+"""
+import hashlib
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .images import FORMATS, VARIANTS, variant_name
+
+# Blob URLs never change content, so browsers and CDNs may keep them forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+BLOB_PATH = re.compile(r"^[\w-]+/[0-9a-f]{2}/(variants/)?[0-9a-f]{64}[.\w]*$")
+
+
+def is_blob_path(path):
+    return bool(BLOB_PATH.match(path))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        hexdigest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name), hexdigest[:2], hexdigest + extension)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def acquire(name):
+    """Record one more reference to the blob `name`."""
+    from .models import MediaBlob
+
+    with transaction.atomic():
+        # The row lock orders this against release() and delete_unused_blob().
+        if MediaBlob.objects.select_for_update().filter(name=name).update(refcount=F("refcount") + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, refcount=1)
+        except IntegrityError:
+            MediaBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+
+def release(name):
+    """
+    Drop one reference to `name`. Once nothing uses it the row stays at 0
+    and the blob is deleted after commit, unless acquire() has taken a new
+    reference by then.
+    """
+    from .models import MediaBlob
+
+    with transaction.atomic():
+        blobs = MediaBlob.objects.select_for_update().filter(name=name)
+        blobs.update(refcount=F("refcount") - 1)
+        if blobs.filter(refcount__lte=0).exists():
+            transaction.on_commit(lambda: delete_unused_blob(name))
+
+
+def delete_unused_blob(name):
+    """Delete the blob and its row if its refcount is still 0."""
+    from .models import MediaBlob
+
+    with transaction.atomic():
+        unused = list(MediaBlob.objects.select_for_update().filter(name=name, refcount__lte=0))
+        if unused:
+            delete_blob(name)
+            MediaBlob.objects.filter(pk=unused[0].pk).delete()
+
+
+def delete_blob(name):
+    content_storage.delete(name)
+    for variant in VARIANTS:
+        for fmt in FORMATS:
+            default_storage.delete(variant_name(name, variant, fmt))
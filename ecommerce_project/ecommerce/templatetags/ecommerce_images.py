@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html
+
+from ecommerce.images import VARIANTS, variant_urls, variants_ready
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, alt="", sizes="150px", css_class="product-image"):
+    """
+    <picture> with WebP and JPEG srcsets built from the image's variants.
+    Falls back to the original upload until variants have been generated.
+    """
+    if not field_file:
+        return ""
+    urls = variant_urls(field_file.name, variants_ready(field_file))
+    if urls is None:
+        return format_html('<img class="{}" src="{}" alt="{}">', css_class, field_file.url, alt)
+
+    def srcset(fmt):
+        return ", ".join(f"{urls[variant][fmt]} {width}w" for variant, width in VARIANTS.items())
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img class="{}" src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy">'
+        '</picture>',
+        srcset("webp"), sizes, css_class, urls["card"]["jpeg"], srcset("jpeg"), sizes, alt,
+    )
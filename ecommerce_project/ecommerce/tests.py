@@ -1,3 +1,1616 @@
-from django.test import TestCase
-
-# Create your tests here.
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, override_settings
+from unittest import mock, skipUnless
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import iscoroutinefunction
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .analytics import compact_rollups, rebuild_rollups
+from .caching import CATALOGUE, STORES, bump_version, cached, get_versions, product_key, store_key
+from .cart import (
+    EmptyCart, OutOfStock, add_item, cart_size, checkout_cart, load_cart, price_cart, reserve, sweep_reservations,
+)
+from .images import VARIANTS, FORMATS, variant_name
+from .storage import content_storage
+from .models import Store, Product, Purchase, Order, OrderLine, SalesDailyRollup, Review, OutboxEvent, MediaBlob, Cart, CartItem, StockReservation, ResetToken
+from .outbox import enqueue, process_batch
+from .pagination import CATALOGUE_PAGE_SIZE, REVIEW_PAGE_SIZE
+from .reviews import recompute_review_stats
+from .rows import RowJSONRenderer
+from .roles import is_buyer, is_vendor
+from .search import search_products
+from .serializers import ProductBulkSerializer
+from .tokens import consume_token, hash_token, issue_token, purge_expired_tokens
+from .twitter_client import FakeTwitterClient
+from .views import ProductViewSet, ReviewViewSet, StoreViewSet
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def make_user(username, group=None):
+    user = User.objects.create_user(username, f"{username}@example.com", "pass12345")
+    if group:
+        user.groups.add(Group.objects.get_or_create(name=group)[0])
+    return user
+
+
+def make_products(store, count, price="10.00", stock=100):
+    return Product.objects.bulk_create(
+        Product(store=store, name=f"Product {i}", description="", price=Decimal(price), stock=stock)
+        for i in range(count)
+    )
+
+
+# ----------------------------
+# Cart pricing
+# ----------------------------
+class CartPricingTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+
+    def _cart(self, products, qty=2):
+        return {str(p.pk): qty for p in products}
+
+    def test_price_cart_totals_and_skips_missing(self):
+        products = make_products(self.store, 3, price="2.50")
+        cart = self._cart(products)
+        cart["999999"] = 1
+        with self.assertNumQueries(1):
+            items, total = price_cart(cart)
+        self.assertEqual(len(items), 3)
+        self.assertEqual(total, Decimal("15.00"))
+
+    def test_view_cart_query_count_is_constant(self):
+        self.client.force_login(self.buyer)
+        self.client.get(reverse("ecommerce:view_cart"))  # warm the role cache
+        counts = []
+        for size in (1, 40):
+            for product in make_products(self.store, size):
+                add_item(self.buyer, product, 2)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("ecommerce:view_cart"))
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+# ----------------------------
+# Checkout
+# ----------------------------
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+
+    def test_checkout_decrements_stock_and_bulk_creates_purchases(self):
+        first, second = make_products(self.store, 2, stock=5)
+        order, items = checkout_cart(self.buyer, {str(first.pk): 2, str(second.pk): 5})
+        self.assertEqual(order.total, Decimal("70.00"))
+        self.assertEqual(Product.objects.get(pk=first.pk).stock, 3)
+        self.assertEqual(Product.objects.get(pk=second.pk).stock, 0)
+        self.assertEqual(Purchase.objects.filter(user=self.buyer).count(), 2)
+
+    def test_short_line_rolls_back_whole_cart(self):
+        first, second = make_products(self.store, 2, stock=5)
+        with self.assertRaises(OutOfStock):
+            checkout_cart(self.buyer, {str(first.pk): 1, str(second.pk): 6})
+        self.assertEqual(Product.objects.get(pk=first.pk).stock, 5)
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_checkout_view_reports_short_stock(self):
+        product = make_products(self.store, 1, stock=2)[0]
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, product, 2)
+        Product.objects.filter(pk=product.pk).update(stock=1)
+        response = self.client.post(reverse("ecommerce:checkout"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 1)
+        self.assertEqual(load_cart(self.buyer), {product.pk: 2})
+
+    def test_checkout_view_empties_cart(self):
+        product = make_products(self.store, 1, stock=5)[0]
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, product, 2)
+        self.client.post(reverse("ecommerce:checkout"))
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 3)
+        self.assertEqual(load_cart(self.buyer), {})
+
+    def test_cart_of_deleted_products_creates_no_order(self):
+        product = make_products(self.store, 1)[0]
+        with self.assertRaises(EmptyCart):
+            checkout_cart(self.buyer, {product.pk + 1: 1})
+        self.client.force_login(self.buyer)
+        with mock.patch("ecommerce.views.load_cart", return_value={product.pk + 1: 1}):
+            response = self.client.post(reverse("ecommerce:checkout"))
+        self.assertRedirects(response, reverse("ecommerce:view_cart"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OutboxEvent.objects.filter(kind=OutboxEvent.EMAIL).exists())
+
+
+# ----------------------------
+# Orders
+# ----------------------------
+class OrderTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+
+    def test_checkout_captures_prices_and_totals(self):
+        first, second = make_products(self.store, 2, price="4.00")
+        order, _ = checkout_cart(self.buyer, {first.pk: 2, second.pk: 1})
+        Product.objects.filter(pk=first.pk).update(price=Decimal("99.00"))
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((order.item_count, order.total), (3, Decimal("12.00")))
+        self.assertEqual(
+            sorted(order.lines.values_list("unit_price", "quantity", "subtotal")),
+            [(Decimal("4.00"), 1, Decimal("4.00")), (Decimal("4.00"), 2, Decimal("8.00"))],
+        )
+
+    def test_checkout_view_links_order_and_queues_one_invoice(self):
+        product = make_products(self.store, 1)[0]
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, product, 2)
+        response = self.client.post(reverse("ecommerce:checkout"))
+        order = Order.objects.get(user=self.buyer)
+        self.assertContains(response, reverse("ecommerce:order_detail", args=[order.pk]))
+        event = OutboxEvent.objects.get(kind=OutboxEvent.EMAIL)
+        self.assertEqual(event.dedup_key, f"invoice:order:{order.pk}")
+        self.assertIn("Invoice #%d" % order.pk, event.payload["html_message"])
+
+    def test_order_detail_is_private(self):
+        order, _ = checkout_cart(self.buyer, {make_products(self.store, 1)[0].pk: 1})
+        self.client.force_login(make_user("other", "Buyer"))
+        response = self.client.get(reverse("ecommerce:order_detail", args=[order.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_buyer_dashboard_pages_orders_in_constant_queries(self):
+        self.client.force_login(self.buyer)
+        url = reverse("ecommerce:buyer_dashboard")
+        self.client.get(url)  # warm the role cache
+        products = make_products(self.store, 3)
+        counts = []
+        for _ in range(2):
+            for _ in range(6):
+                checkout_cart(self.buyer, {p.pk: 1 for p in products})
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        orders = list(response.context["orders"])
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(orders[0].pk, Order.objects.latest("created_at", "pk").pk)
+        response = self.client.get(response.context["next_url"])
+        self.assertEqual(len(response.context["orders"]), 2)
+
+    def test_migration_groups_purchases_into_orders(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        migration = import_module("ecommerce.migrations.0015_orders")
+        first, second = make_products(self.store, 2, price="3.00")
+        Purchase.objects.bulk_create([
+            Purchase(user=self.buyer, product=first, quantity=2),
+            Purchase(user=self.buyer, product=second, quantity=1),
+        ])
+        later = Purchase.objects.create(user=self.buyer, product=first, quantity=1)
+        Purchase.objects.filter(pk=later.pk).update(purchased_at=timezone.now() + timedelta(hours=1))
+        migration.orders_from_purchases(apps, None)
+        self.assertEqual(
+            list(Order.objects.order_by("created_at").values_list("item_count", "total")),
+            [(3, Decimal("9.00")), (1, Decimal("3.00"))],
+        )
+
+
+# ----------------------------
+# Sales analytics
+# ----------------------------
+class SalesAnalyticsTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.lamp, self.desk = make_products(self.store, 2, price="5.00", stock=10)
+        other_store = Store.objects.create(name="Other", vendor=make_user("other", "Vendor"))
+        checkout_cart(self.buyer, {make_products(other_store, 1)[0].pk: 1})
+        checkout_cart(self.buyer, {self.lamp.pk: 2, self.desk.pk: 1})
+        checkout_cart(self.buyer, {self.lamp.pk: 3})
+        self.client.force_login(self.vendor)
+
+    def _rows(self):
+        return sorted(SalesDailyRollup.objects.values_list("store", "product", "day", "units", "revenue"))
+
+    def test_checkout_updates_rollups_in_place(self):
+        lamp = SalesDailyRollup.objects.get(product=self.lamp)
+        self.assertEqual((lamp.units, lamp.revenue), (5, Decimal("25.00")))
+        self.assertEqual(SalesDailyRollup.objects.count(), 3)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        before = self._rows()
+        SalesDailyRollup.objects.all().delete()
+        today = timezone.localdate()
+        self.assertEqual(rebuild_rollups(today, today), 3)
+        self.assertEqual(self._rows(), before)
+
+    def test_rebuild_reads_totals_after_locking_the_products(self):
+        from . import analytics
+
+        lock_products = analytics._lock_products
+
+        def checkout_then_lock(product_ids):
+            # A checkout that commits while the rebuild waits for its locks.
+            checkout_cart(self.buyer, {self.lamp.pk: 1})
+            return lock_products(product_ids)
+
+        expected = self._rows()
+        today = timezone.localdate()
+        with mock.patch.object(analytics, "_lock_products", side_effect=checkout_then_lock):
+            rebuild_rollups(today, today)
+        lamp = SalesDailyRollup.objects.get(product=self.lamp)
+        self.assertEqual((lamp.units, lamp.revenue), (6, Decimal("30.00")))
+        self.assertEqual(len(self._rows()), len(expected))
+
+    def test_compact_merges_rows_of_deleted_products(self):
+        self.lamp.delete()
+        self.desk.delete()
+        self.assertEqual(compact_rollups(), 1)
+        merged = SalesDailyRollup.objects.get(store=self.store)
+        self.assertEqual((merged.product, merged.units, merged.revenue), (None, 6, Decimal("30.00")))
+
+    def test_reports_read_only_rollups_for_own_stores(self):
+        with CaptureQueriesContext(connection) as ctx:
+            revenue = self.client.get("/api/analytics/revenue/").json()
+            top = self.client.get("/api/analytics/top-products/", {"limit": 1}).json()
+            rates = self.client.get("/api/analytics/sell-through/").json()
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("ecommerce_orderline", sql)
+        self.assertNotIn("ecommerce_purchase", sql)
+        self.assertEqual(revenue, [{"day": str(timezone.localdate()), "units": 6, "revenue": "30.00"}])
+        self.assertEqual([(row["product"], row["units"]) for row in top], [(self.lamp.pk, 5)])
+        self.assertEqual(rates[0]["product"], self.lamp.pk)
+        self.assertAlmostEqual(rates[0]["sell_through"], 5 / 10)
+
+    def test_reports_validate_params_and_require_vendor(self):
+        self.assertEqual(self.client.get("/api/analytics/revenue/", {"from": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/analytics/top-products/", {"limit": 0}).status_code, 400)
+        earlier = timezone.localdate() - timedelta(days=400)
+        response = self.client.get("/api/analytics/revenue/", {"from": earlier, "to": earlier})
+        self.assertEqual(response.json(), [])
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get("/api/analytics/revenue/").status_code, 403)
+
+
+# ----------------------------
+# Vendor dashboard
+# ----------------------------
+class VendorDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.shop = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.annex = Store.objects.create(name="Annex", vendor=self.vendor)
+        self.rival = Store.objects.create(name="Rival", vendor=make_user("rival", "Vendor"))
+        self.lamp, self.desk = make_products(self.shop, 2, price="5.00", stock=10)
+        make_products(self.rival, 3)
+        checkout_cart(self.buyer, {self.lamp.pk: 2, self.desk.pk: 1})
+        self.client.force_login(self.vendor)
+        self.url = reverse("ecommerce:vendor_dashboard")
+
+    def _get(self, query=""):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_per_store_stats(self):
+        response, _ = self._get()
+        shop, annex = response.context["stores"]
+        self.assertEqual((shop.product_count, shop.total_stock, shop.units_sold, shop.revenue),
+                         (2, 17, 3, Decimal("15.00")))
+        self.assertEqual((annex.product_count, annex.total_stock, annex.units_sold, annex.revenue),
+                         (0, 0, 0, Decimal("0.00")))
+        self.assertEqual(response.context["totals"]["revenue"], Decimal("15.00"))
+        self.assertNotContains(response, "Rival")
+
+    def test_products_are_paginated_per_store(self):
+        make_products(self.annex, CATALOGUE_PAGE_SIZE + 5)
+        response, _ = self._get(f"?store={self.annex.pk}")
+        page = response.context["page"]
+        self.assertEqual(len(page.object_list), CATALOGUE_PAGE_SIZE)
+        self.assertContains(response, f"?store={self.annex.pk}&amp;after={page.next_cursor}")
+        response, _ = self._get(f"?store={self.annex.pk}&after={page.next_cursor}")
+        self.assertEqual(len(response.context["page"].object_list), 5)
+        # Another vendor's store falls back to the first of this vendor's.
+        response, _ = self._get(f"?store={self.rival.pk}")
+        self.assertEqual(response.context["selected"], self.shop)
+
+    def test_query_count_is_flat_as_catalogue_grows(self):
+        self._get()  # fill the role and cart-size caches
+        _, before = self._get()
+        for store in (self.shop, self.annex):
+            products = make_products(store, 60)
+            for product in products[:10]:
+                checkout_cart(self.buyer, {product.pk: 1})
+        _, after = self._get()
+        self.assertEqual(after, before)
+
+
+
+# ----------------------------
+# Persistent cart
+# ----------------------------
+class CartTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.products = make_products(self.store, 2)
+
+    def test_adding_twice_increments_one_row(self):
+        add_item(self.buyer, self.products[0], 2)
+        add_item(self.buyer, self.products[0], 3)
+        self.assertEqual(CartItem.objects.count(), 1)
+        self.assertEqual(load_cart(self.buyer), {self.products[0].pk: 5})
+
+    def test_add_and_remove_views_do_not_touch_the_session(self):
+        self.client.force_login(self.buyer)
+        session_key = self.client.session.session_key
+        self.client.post(reverse("ecommerce:add_to_cart", args=[self.products[0].pk]), {"quantity": 2})
+        self.client.post(reverse("ecommerce:add_to_cart", args=[self.products[1].pk]))
+        self.assertEqual(cart_size(self.buyer), 2)
+        self.client.post(reverse("ecommerce:remove_from_cart", args=[self.products[1].pk]))
+        self.assertEqual(load_cart(self.buyer), {self.products[0].pk: 2})
+        self.assertEqual(self.client.session.session_key, session_key)
+        self.assertNotIn("cart", self.client.session)
+
+    def test_header_shows_cart_size(self):
+        self.client.force_login(self.buyer)
+        add_item(self.buyer, self.products[0])
+        self.assertContains(self.client.get(reverse("ecommerce:product_list")), "View Cart (1)")
+
+    def test_migration_copies_session_carts(self):
+        from importlib import import_module
+        from django.apps import apps
+        from django.contrib.sessions.backends.db import SessionStore
+
+        migration = import_module("ecommerce.migrations.0013_cart")
+        add_item(self.buyer, self.products[0], 1)
+        session = SessionStore()
+        session["_auth_user_id"] = str(self.buyer.pk)
+        session["cart"] = {str(self.products[0].pk): 2, str(self.products[1].pk): 1, "999999": 4}
+        session.create()
+        migration.carts_from_sessions(apps, None)
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(load_cart(self.buyer), {self.products[0].pk: 3, self.products[1].pk: 1})
+
+
+# ----------------------------
+# Stock reservations
+# ----------------------------
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.rival = make_user("rival", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.product = make_products(self.store, 1, stock=3)[0]
+
+    def test_add_holds_stock_and_rejects_beyond_available(self):
+        add_item(self.buyer, self.product, 2)
+        with self.assertRaises(OutOfStock):
+            add_item(self.rival, self.product, 2)
+        self.assertEqual(load_cart(self.rival), {})
+        add_item(self.rival, self.product, 1)
+        self.assertEqual(StockReservation.objects.get(user=self.buyer).quantity, 2)
+
+    def test_add_view_reports_unavailable_stock(self):
+        add_item(self.rival, self.product, 3)
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse("ecommerce:add_to_cart", args=[self.product.pk]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_holds_do_not_count_and_are_swept(self):
+        add_item(self.rival, self.product, 3)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        add_item(self.buyer, self.product, 3)
+        self.assertEqual(sweep_reservations(batch_size=1), 1)
+        self.assertEqual(list(StockReservation.objects.values_list("user", flat=True)), [self.buyer.pk])
+
+    def test_checkout_converts_holds(self):
+        add_item(self.buyer, self.product, 2)
+        checkout_cart(self.buyer, load_cart(self.buyer))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_of_lapsed_hold_respects_other_holds(self):
+        reserve(self.buyer, self.product, 2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        add_item(self.rival, self.product, 2)
+        with self.assertRaises(OutOfStock):
+            checkout_cart(self.buyer, {self.product.pk: 2})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 3)
+
+    def test_stock_lowered_below_hold_fails_checkout(self):
+        add_item(self.buyer, self.product, 3)
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        with self.assertRaises(OutOfStock):
+            checkout_cart(self.buyer, load_cart(self.buyer))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 1)
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_stock_back_by_the_reread_still_fails_with_out_of_stock(self):
+        add_item(self.buyer, self.product, 2)
+        # The conditional UPDATE misses, but the stock is back when re-read.
+        with mock.patch("django.db.models.query.QuerySet.update", return_value=0):
+            with self.assertRaises(OutOfStock) as raised:
+                checkout_cart(self.buyer, load_cart(self.buyer))
+        self.assertEqual(raised.exception.product.pk, self.product.pk)
+
+
+# ----------------------------
+# Password reset tokens
+# ----------------------------
+class ResetTokenTests(TestCase):
+    def setUp(self):
+        self.user = make_user("buyer", "Buyer")
+
+    def test_only_the_hash_is_stored(self):
+        token = issue_token(self.user)
+        row = ResetToken.objects.get()
+        self.assertEqual(row.token_hash, hash_token(token))
+        self.assertNotIn(token, row.token_hash)
+
+    def test_link_resets_password_once(self):
+        link = f"/reset-password/{issue_token(self.user)}/"
+        response = self.client.post(link, {"new_password": "n3w-pass!", "confirm_password": "n3w-pass!"})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("n3w-pass!"))
+        self.assertEqual(self.client.post(link, {"password": "again"}).status_code, 400)
+        self.assertEqual(self.client.get(link).status_code, 400)
+
+    def test_expired_token_is_rejected_and_purged(self):
+        token = issue_token(self.user)
+        issue_token(self.user)
+        ResetToken.objects.filter(token_hash=hash_token(token)).update(
+            expiry_date=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertIsNone(consume_token(token))
+        self.assertEqual(purge_expired_tokens(batch_size=1), 1)
+        self.assertEqual(ResetToken.objects.count(), 1)
+
+
+# ----------------------------
+# Outbox
+# ----------------------------
+@override_settings(TWITTER_FAKE=True)
+class OutboxTests(TestCase):
+    def setUp(self):
+        FakeTwitterClient.sent_tweets.clear()
+        self.vendor = make_user("vendor", "Vendor")
+
+    def test_new_store_and_product_enqueue_one_tweet_each(self):
+        store = Store.objects.create(name="Shop", vendor=self.vendor)
+        Product.objects.create(store=store, name="Lamp", description="", price=1, stock=1)
+        store.save()
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.TWEET).count(), 2)
+        self.assertEqual(FakeTwitterClient.sent_tweets, [])
+
+    def test_dedup_key_is_enqueued_once(self):
+        enqueue(OutboxEvent.TWEET, {"text": "hi"}, dedup_key="same")
+        enqueue(OutboxEvent.TWEET, {"text": "hi"}, dedup_key="same")
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_process_batch_delivers_tweets_and_emails(self):
+        enqueue(OutboxEvent.TWEET, {"text": "hello"})
+        for i in range(3):
+            enqueue(OutboxEvent.EMAIL, {
+                "subject": "Invoice", "message": "Thanks", "from_email": "shop@example.com",
+                "recipient_list": [f"buyer{i}@example.com"], "html_message": "<p>Thanks</p>",
+            })
+        self.assertEqual(process_batch(), 4)
+        self.assertEqual(FakeTwitterClient.sent_tweets, ["hello"])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboxEvent.objects.exclude(status=OutboxEvent.SENT).exists())
+
+    def _emails(self, n):
+        return [
+            enqueue(OutboxEvent.EMAIL, {
+                "subject": "Invoice", "message": "Thanks", "recipient_list": [f"buyer{i}@example.com"],
+            })
+            for i in range(n)
+        ]
+
+    def test_one_failed_email_does_not_resend_the_others(self):
+        first, second, third = self._emails(3)
+        with mock.patch("ecommerce.outbox.EmailMultiAlternatives.send", side_effect=[1, OSError("refused"), 1]):
+            with self.assertLogs("ecommerce.outbox", "WARNING"):
+                process_batch()
+        statuses = dict(OutboxEvent.objects.values_list("pk", "status"))
+        self.assertEqual(
+            [statuses[e.pk] for e in (first, second, third)],
+            [OutboxEvent.SENT, OutboxEvent.PENDING, OutboxEvent.SENT],
+        )
+
+    def test_emails_are_marked_sent_as_they_go_out(self):
+        first, second = self._emails(2)
+        with mock.patch("ecommerce.outbox.EmailMultiAlternatives.send", side_effect=[1, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                process_batch()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (OutboxEvent.SENT, OutboxEvent.PENDING))
+
+    def test_tweets_are_marked_sent_as_they_go_out(self):
+        first = enqueue(OutboxEvent.TWEET, {"text": "one"})
+        second = enqueue(OutboxEvent.TWEET, {"text": "two"})
+        with mock.patch.object(FakeTwitterClient, "create_tweet", side_effect=[{}, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                process_batch()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (OutboxEvent.SENT, OutboxEvent.PENDING))
+
+    @override_settings(TWITTER_FAKE=False)
+    def test_tweets_stay_pending_while_twitter_is_not_configured(self):
+        event = enqueue(OutboxEvent.TWEET, {"text": "hello"})
+        with self.assertLogs("ecommerce.outbox", "WARNING"):
+            process_batch()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.last_error), (OutboxEvent.PENDING, "Twitter is not configured"))
+
+    def test_failures_back_off_then_fail(self):
+        event = enqueue("unknown", {})
+        with self.assertLogs("ecommerce.outbox", "WARNING"):
+            process_batch(max_attempts=2)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.PENDING, 1))
+        self.assertEqual(process_batch(max_attempts=2), 0)  # not due yet
+        OutboxEvent.objects.update(available_at=event.created_at)
+        with self.assertLogs("ecommerce.outbox", "WARNING"):
+            process_batch(max_attempts=2)
+        event.refresh_from_db()
+        self.assertEqual(event.status, OutboxEvent.FAILED)
+
+
+# ----------------------------
+# Roles
+# ----------------------------
+class RoleResolutionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = make_user("vendor", "Vendor")
+
+    def test_roles_are_memoized_and_cached(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(is_vendor(self.vendor))
+            self.assertFalse(is_buyer(self.vendor))
+            self.assertTrue(is_vendor(self.vendor))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_vendor(User(pk=self.vendor.pk)))
+
+    def test_group_change_invalidates_cache(self):
+        self.assertFalse(is_buyer(self.vendor))
+        self.vendor.groups.add(Group.objects.get_or_create(name="Buyer")[0])
+        self.assertTrue(is_buyer(self.vendor))
+        Group.objects.get(name="Buyer").user_set.remove(self.vendor)
+        self.assertFalse(is_buyer(User.objects.get(pk=self.vendor.pk)))
+
+    def test_clearing_a_group_invalidates_after_the_write_and_on_commit(self):
+        vendors = Group.objects.get(name="Vendor")
+        self.assertTrue(is_vendor(self.vendor))  # warm the shared cache
+        with self.captureOnCommitCallbacks(execute=True):
+            vendors.user_set.clear()
+            self.assertFalse(is_vendor(User.objects.get(pk=self.vendor.pk)))
+            # Another request caching the old groups before this commits.
+            cache.set(f"ecommerce:roles:{self.vendor.pk}", ["Vendor"])
+        self.assertFalse(is_vendor(User.objects.get(pk=self.vendor.pk)))
+
+    def test_api_write_checks_role_once(self):
+        self.client.force_login(self.vendor)
+        is_vendor(self.vendor)  # warm the shared cache
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("ecommerce:store-list"), {"name": "Shop"})
+        group_queries = [q for q in ctx.captured_queries if "auth_group" in q["sql"]]
+        self.assertEqual(group_queries, [])
+
+
+# ----------------------------
+# Catalogue pagination
+# ----------------------------
+class CataloguePaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=make_user("vendor", "Vendor"))
+        self.products = make_products(self.store, CATALOGUE_PAGE_SIZE + 5)
+        self.client.force_login(self.buyer)
+
+    def _product_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [q for q in ctx.captured_queries if "ecommerce_product" in q["sql"]]
+
+    def test_keyset_pages_walk_the_catalogue(self):
+        response = self.client.get(reverse("ecommerce:product_list"))
+        page = response.context["page"]
+        self.assertEqual(len(page.object_list), CATALOGUE_PAGE_SIZE)
+        response = self.client.get(reverse("ecommerce:product_list"), {"after": page.next_cursor})
+        page = response.context["page"]
+        self.assertEqual([p.pk for p in page.object_list], [p.pk for p in self.products[-5:]])
+        self.assertIsNone(page.next_cursor)
+        self.assertEqual(page.previous_cursor, self.products[-5].pk)
+
+    def test_page_fragment_is_cached_until_products_change(self):
+        url = reverse("ecommerce:product_list")
+        _, queries = self._product_queries(url)
+        self.assertEqual(len(queries), 1)
+        _, queries = self._product_queries(url)
+        self.assertEqual(queries, [])
+
+        Product.objects.filter(pk=self.products[0].pk).update(name="Renamed")
+        self.products[0].save()
+        response, queries = self._product_queries(url)
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, self.products[0].name)
+
+    def test_catalogue_add_to_cart_reads_row_quantity(self):
+        product = self.products[0]
+        self.client.post(
+            reverse("ecommerce:add_to_cart", args=[product.pk]),
+            {f"quantity-{product.pk}": 3, f"quantity-{self.products[1].pk}": 1},
+        )
+        self.assertEqual(load_cart(self.buyer), {product.pk: 3})
+
+    def test_product_api_uses_cursor_pagination(self):
+        response = self.client.get(reverse("ecommerce:product-list"))
+        self.assertEqual(len(response.json()["results"]), CATALOGUE_PAGE_SIZE)
+        response = self.client.get(response.json()["next"])
+        self.assertEqual(len(response.json()["results"]), 5)
+
+
+# ----------------------------
+# Search
+# ----------------------------
+class SearchTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Garden Centre", vendor=make_user("vendor", "Vendor"))
+        self.lamp = Product.objects.create(
+            store=self.store, name="Desk lamp", description="Warm light", price=20, stock=3)
+        self.bulb = Product.objects.create(
+            store=self.store, name="Bulb", description="Spare bulb for any lamp", price=2, stock=9)
+
+    def test_ranks_name_matches_first_and_matches_prefixes(self):
+        self.assertEqual(search_products("lamp"), [self.lamp, self.bulb])
+        self.assertEqual(search_products("desk la"), [self.lamp])
+        self.assertEqual(len(search_products("garden")), 2)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.lamp.name = "Floor lantern"
+        self.lamp.save()
+        self.assertEqual(search_products("lantern"), [self.lamp])
+        self.store.name = "Hardware Hub"
+        self.store.save()
+        self.assertEqual(len(search_products("hardware")), 2)
+        self.bulb.delete()
+        self.assertEqual(search_products("spare"), [])
+
+    def test_search_view_and_api(self):
+        response = self.client.get(reverse("ecommerce:search"), {"q": "desk"})
+        self.assertEqual(list(response.context["products"]), [self.lamp])
+        response = self.client.get(reverse("ecommerce:product-search"), {"q": "bulb"})
+        self.assertEqual([p["id"] for p in response.json()], [self.bulb.pk])
+
+
+# ----------------------------
+# Product filters and facets
+# ----------------------------
+class ProductFilterTests(TestCase):
+    def setUp(self):
+        vendor = make_user("vendor", "Vendor")
+        self.shop = Store.objects.create(name="Shop", vendor=vendor)
+        self.other = Store.objects.create(name="Other", vendor=vendor)
+        self.cheap = Product.objects.create(store=self.shop, name="Cheap", description="", price=5, stock=0)
+        self.mid = Product.objects.create(store=self.shop, name="Mid", description="", price=75, stock=2)
+        self.dear = Product.objects.create(store=self.other, name="Dear", description="", price=1500, stock=1)
+
+    def _ids(self, **params):
+        response = self.client.get(reverse("ecommerce:product-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return [p["id"] for p in response.json()["results"]]
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self._ids(store=self.shop.pk), [self.cheap.pk, self.mid.pk])
+        self.assertEqual(self._ids(min_price=10, max_price=100), [self.mid.pk])
+        self.assertEqual(self._ids(in_stock="true", ordering="-price"), [self.dear.pk, self.mid.pk])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(reverse("ecommerce:product-list"), {"min_price": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_finite_prices_and_out_of_range_ids_are_rejected(self):
+        bad = [
+            {"min_price": "NaN"}, {"max_price": "Infinity"}, {"min_price": "sNaN"},
+            {"store": "99999999999999999999999"}, {"store": f"{self.shop.pk},-1"},
+        ]
+        for url in (reverse("ecommerce:product-list"), reverse("ecommerce:product-facets")):
+            for params in bad:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn(next(iter(params)), response.json())
+
+    def test_facets_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                reverse("ecommerce:product-facets"), {"store": self.shop.pk, "in_stock": "1"}
+            )
+        self.assertEqual(len([q for q in ctx.captured_queries if "ecommerce_product" in q["sql"]]), 1)
+        facets = response.json()
+        # The store facet ignores the store filter; price buckets respect it.
+        self.assertEqual({s["name"]: s["count"] for s in facets["stores"]}, {"Shop": 1, "Other": 1})
+        self.assertEqual({b["range"]: b["count"] for b in facets["price"]}["50-100"], 1)
+        self.assertEqual({b["range"]: b["count"] for b in facets["price"]}["1000+"], 0)
+
+
+# ----------------------------
+# Review stats
+# ----------------------------
+class ReviewStatsTests(TestCase):
+    def setUp(self):
+        self.buyer = make_user("buyer", "Buyer")
+        store = Store.objects.create(name="Shop", vendor=make_user("vendor", "Vendor"))
+        self.product = make_products(store, 1)[0]
+
+    def _stats(self):
+        self.product.refresh_from_db()
+        return self.product.review_count, self.product.verified_review_count
+
+    def test_add_review_view_increments(self):
+        Purchase.objects.create(user=self.buyer, product=self.product)
+        self.client.force_login(self.buyer)
+        self.client.post(reverse("ecommerce:add_review", args=[self.product.pk]), {"text": "Great"})
+        self.assertEqual(self._stats(), (1, 1))
+        self.assertIsNotNone(self.product.last_reviewed_at)
+
+    def test_api_create_verify_and_delete(self):
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse("ecommerce:review-list"), {"product": self.product.pk, "text": "Ok"})
+        self.assertEqual(self._stats(), (1, 0))
+        review = Review.objects.get(pk=response.json()["id"])
+        review.verified = True
+        review.save()  # as the admin would
+        self.assertEqual(self._stats(), (1, 1))
+        self.client.delete(reverse("ecommerce:review-detail", args=[review.pk]))
+        self.assertEqual(self._stats(), (0, 0))
+        self.assertIsNone(self.product.last_reviewed_at)
+
+    def test_saving_a_review_does_not_reread_it(self):
+        review = Review.objects.create(product=self.product, user=self.buyer, text="Hi")
+        review.verified = True
+        with CaptureQueriesContext(connection) as queries:
+            review.save()
+        self.assertFalse([q for q in queries if q["sql"].startswith("SELECT")])
+        self.assertEqual(self._stats(), (1, 1))
+
+        deferred = Review.objects.defer("verified").get(pk=review.pk)
+        deferred.verified = False
+        deferred.save()
+        self.assertEqual(self._stats(), (1, 0))
+
+    def test_deleting_a_user_recomputes_each_product_once(self):
+        other = make_products(self.product.store, 1)[0]
+        author = make_user("author", "Buyer")
+        for product in (self.product, self.product, other):
+            Review.objects.create(product=product, user=author, text="Hi", verified=True)
+        Review.objects.create(product=self.product, user=self.buyer, text="Stays")
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                author.delete()
+        updates = [q for q in queries if q["sql"].startswith('UPDATE "ecommerce_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self._stats(), (1, 0))
+        other.refresh_from_db()
+        self.assertEqual((other.review_count, other.last_reviewed_at), (0, None))
+
+    def test_recompute_repairs_drift(self):
+        Review.objects.create(product=self.product, user=self.buyer, text="Hi", verified=True)
+        Product.objects.update(review_count=42, verified_review_count=0)
+        recompute_review_stats()
+        self.assertEqual(self._stats(), (1, 1))
+
+
+# ----------------------------
+# Review pagination
+# ----------------------------
+class ReviewPaginationTests(TestCase):
+    def setUp(self):
+        self.buyer = make_user("buyer", "Buyer")
+        store = Store.objects.create(name="Shop", vendor=make_user("vendor", "Vendor"))
+        self.product, self.other = make_products(store, 2)
+        Review.objects.bulk_create(
+            Review(product=self.product, user=self.buyer, text=f"Review {i}")
+            for i in range(REVIEW_PAGE_SIZE + 3)
+        )
+        Review.objects.create(product=self.other, user=self.buyer, text="Elsewhere")
+
+    def test_detail_shows_first_page_and_fragment_loads_the_rest(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("ecommerce:product_detail", args=[self.product.pk]))
+        self.assertEqual(len(response.context["reviews"]), REVIEW_PAGE_SIZE)
+        user_sql = [q["sql"] for q in ctx.captured_queries if "auth_user" in q["sql"]]
+        self.assertTrue(user_sql)
+        self.assertFalse(any('"auth_user"."password"' in sql for sql in user_sql))
+
+        next_url = response.context["next_reviews_url"]
+        self.assertIn(reverse("ecommerce:product_reviews", args=[self.product.pk]), next_url)
+        response = self.client.get(next_url)
+        self.assertEqual(len(response.context["reviews"]), 3)
+        self.assertIsNone(response.context["next_reviews_url"])
+
+    def test_api_filters_by_product_with_cursor(self):
+        url = reverse("ecommerce:review-list")
+        response = self.client.get(url, {"product": self.product.pk}).json()
+        self.assertEqual(len(response["results"]), REVIEW_PAGE_SIZE)
+        response = self.client.get(response["next"]).json()
+        self.assertEqual(len(response["results"]), 3)
+        self.assertEqual(self.client.get(url, {"product": "x"}).status_code, 400)
+
+
+# ----------------------------
+# Metrics and query budgets
+# ----------------------------
+class ViewMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.vendor = make_user("vendor", "Vendor")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        make_products(self.store, 30)
+        self.client.force_login(self.vendor)
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.get(reverse("ecommerce:vendor_dashboard"))
+        self.client.get(reverse("ecommerce:store_detail", args=[self.store.pk]))
+        data = metrics.snapshot()
+        self.assertEqual(data["ecommerce:vendor_dashboard"]["requests"], 1)
+        self.assertGreater(data["ecommerce:store_detail"]["queries"], 0)
+        self.assertIn("non_db_seconds", data["ecommerce:store_detail"])
+
+        User.objects.filter(pk=self.vendor.pk).update(is_staff=True)
+        response = self.client.get(reverse("ecommerce:metrics"))
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+        self.assertIn('ecommerce_view_queries_total{view="ecommerce:vendor_dashboard"}', response.content.decode())
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("ecommerce:metrics")).status_code, 401)
+        response = self.client.get(reverse("ecommerce:metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERY_BUDGETS={"ecommerce:vendor_dashboard": 1}, QUERY_BUDGET_STRICT=True)
+    def test_strict_mode_fails_over_budget_views(self):
+        with self.assertRaises(metrics.QueryBudgetExceeded):
+            self.client.get(reverse("ecommerce:vendor_dashboard"))
+
+    def test_metrics_are_staff_or_internal_only_without_a_token(self):
+        url = reverse("ecommerce:metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(INTERNAL_IPS=["127.0.0.1"]):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(QUERY_BUDGETS={"ecommerce:vendor_dashboard": 1})
+    def test_failing_requests_report_their_own_error(self):
+        with mock.patch("ecommerce.views.render", side_effect=RuntimeError("boom")):
+            with self.assertRaisesMessage(RuntimeError, "boom"):
+                self.client.get(reverse("ecommerce:vendor_dashboard"))
+
+    def test_test_runner_turns_strict_mode_on(self):
+        self.assertIs(settings.QUERY_BUDGET_STRICT, True)
+
+
+# ----------------------------
+# Image variants
+# ----------------------------
+def make_upload(name="photo.png", size=(1600, 1200)):
+    buffer = BytesIO()
+    Image.new("RGBA", size, (200, 30, 30, 255)).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.vendor = make_user("vendor", "Vendor")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.client.force_login(self.vendor)
+
+    def test_product_form_upload_generates_variants(self):
+        self.client.post(reverse("ecommerce:add_product"), {
+            "store": self.store.pk, "name": "Car", "description": "Fast",
+            "price": "10.00", "stock": 1, "image": make_upload(),
+        })
+        product = Product.objects.get(name="Car")
+        # The request only queues the work.
+        self.assertFalse(product.image_variants_ready)
+        self.assertFalse(default_storage.exists(variant_name(product.image.name, "thumb", "jpeg")))
+        data = self.client.get(reverse("ecommerce:product-detail", args=[product.pk])).json()
+        self.assertIsNone(data["image_variants"])
+
+        process_batch()
+        product.refresh_from_db()
+        self.assertTrue(product.image_variants_ready)
+        for variant, size in VARIANTS.items():
+            for fmt in FORMATS:
+                with default_storage.open(variant_name(product.image.name, variant, fmt)) as f:
+                    self.assertLessEqual(max(Image.open(f).size), size)
+
+        response = self.client.get(reverse("ecommerce:product_detail", args=[product.pk]))
+        self.assertContains(response, 'type="image/webp"')
+        data = self.client.get(reverse("ecommerce:product-detail", args=[product.pk])).json()
+        self.assertTrue(data["image_variants"]["card"]["webp"].endswith(".card.webp"))
+
+    def test_store_logo_upload_generates_variants(self):
+        self.client.post(reverse("ecommerce:edit_store", args=[self.store.pk]), {
+            "name": "Shop", "description": "", "logo": make_upload("logo.png", (300, 300)),
+        })
+        process_batch()
+        self.store.refresh_from_db()
+        self.assertTrue(self.store.logo_variants_ready)
+        self.assertTrue(default_storage.exists(variant_name(self.store.logo.name, "thumb", "webp")))
+
+    def test_listing_products_does_not_check_the_storage(self):
+        make_products(self.store, 3)
+        for product in Product.objects.all():
+            product.image = make_upload()
+            product.save()
+        process_batch()
+        with mock.patch("django.core.files.storage.FileSystemStorage.exists") as exists:
+            data = self.client.get(reverse("ecommerce:product-list")).json()
+            self.client.get(reverse("ecommerce:product-detail", args=[data["results"][0]["id"]]))
+        exists.assert_not_called()
+        self.assertTrue(all(row["image_variants"] for row in data["results"]))
+
+    def test_replacing_an_image_hides_the_old_variants_until_regenerated(self):
+        product = Product.objects.create(store=self.store, name="Car", description="", price=1, image=make_upload())
+        process_batch()
+        product.refresh_from_db()
+        product.image = make_upload("other.png", (80, 40))
+        product.save()
+        product.refresh_from_db()
+        self.assertFalse(product.image_variants_ready)
+        process_batch()
+        product.refresh_from_db()
+        self.assertTrue(product.image_variants_ready)
+
+
+# ----------------------------
+# Content-addressed media
+# ----------------------------
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.store = Store.objects.create(name="Shop", vendor=make_user("vendor", "Vendor"))
+
+    def _product(self, upload):
+        return Product.objects.create(store=self.store, name="Car", description="", price=1, image=upload)
+
+    def test_same_upload_is_stored_once_and_freed_with_last_reference(self):
+        first = self._product(make_upload("a.png"))
+        second = self._product(make_upload("b.png"))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(content_storage.listdir(first.image.name.rsplit("/", 1)[0])[1]), 1)
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+
+        name = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(content_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(content_storage.exists(variant_name(name, "card", "webp")))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replacing_an_image_releases_the_old_blob(self):
+        product = self._product(make_upload("a.png"))
+        old = product.image.name
+        product = Product.objects.get(pk=product.pk)
+        product.image = make_upload("c.png", size=(50, 50))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(content_storage.exists(old))
+        self.assertEqual(MediaBlob.objects.get().name, product.image.name)
+
+    def test_reupload_before_the_delete_runs_keeps_the_blob(self):
+        first = self._product(make_upload("a.png"))
+        name = first.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        # The same content is uploaded again before the deletion runs.
+        second = self._product(make_upload("b.png"))
+        self.assertEqual(second.image.name, name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(content_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+    def _legacy_product(self):
+        legacy = content_storage._save("product_images/legacy.png", make_upload("legacy.png"))
+        product = self._product(None)
+        Product.objects.filter(pk=product.pk).update(image=legacy, image_variants_ready=True)
+        return product, legacy
+
+    def test_dedupe_media_rebuilds_the_blob_variants(self):
+        product, legacy = self._legacy_product()
+        versions = get_versions(CATALOGUE, product_key(product.pk), store_key(self.store.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("dedupe_media", stdout=StringIO())
+        new_versions = get_versions(CATALOGUE, product_key(product.pk), store_key(self.store.pk))
+        self.assertTrue(all(a != b for a, b in zip(versions, new_versions)))
+        product.refresh_from_db()
+        self.assertNotEqual(product.image.name, legacy)
+        self.assertFalse(content_storage.exists(legacy))
+        self.assertFalse(product.image_variants_ready)
+        process_batch()
+        product.refresh_from_db()
+        self.assertTrue(product.image_variants_ready)
+        self.assertTrue(default_storage.exists(variant_name(product.image.name, "card", "webp")))
+
+    @override_settings(DEBUG=True)
+    def test_blobs_are_served_as_immutable(self):
+        from .views import serve_media
+        product = self._product(make_upload("a.png"))
+        response = serve_media(RequestFactory().get("/"), product.image.name)
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+# ----------------------------
+# Bulk import / export
+# ----------------------------
+class BulkProductTests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.rival = Store.objects.create(name="Rival", vendor=make_user("rival", "Vendor"))
+        self.lamp = Product.objects.create(store=self.store, name="Lamp", description="Desk", price=20, stock=1)
+        self.theirs = Product.objects.create(store=self.rival, name="Vase", description="Blue", price=9, stock=1)
+        OutboxEvent.objects.all().delete()
+        self.client.force_login(self.vendor)
+
+    def _import(self, name, content):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse("ecommerce:product-bulk-import"), {"file": upload})
+
+    def test_csv_import_upserts_valid_rows_and_reports_the_rest(self):
+        response = self._import("products.csv", (
+            "id,store,name,description,price,stock\n"
+            f"{self.lamp.pk},{self.store.pk},Lamp,Brass desk lamp,25.00,4\n"
+            f",{self.store.pk},Rug,Wool rug,80,\n"
+            f",{self.rival.pk},Chair,Oak,10,1\n"
+            f"{self.theirs.pk},{self.store.pk},Vase,Mine now,1,1\n"
+            f",{self.store.pk},Mug,Tea,cheap,1\n"
+        ))
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result["created"], result["updated"], result["error_count"]), (1, 1, 3))
+        self.assertEqual([e["line"] for e in result["errors"]], [4, 5, 6])
+        self.assertIn("store", result["errors"][0]["errors"])
+        self.assertIn("id", result["errors"][1]["errors"])
+        self.assertIn("price", result["errors"][2]["errors"])
+
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.description, self.lamp.price, self.lamp.stock), ("Brass desk lamp", 25, 4))
+        self.assertEqual(Product.objects.get(name="Rug").stock, 0)
+        self.assertEqual(Product.objects.get(pk=self.theirs.pk).store, self.rival)
+        self.assertEqual([p.name for p in search_products("wool")], ["Rug"])
+        # No per-row side effects.
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_update_rows_only_change_the_columns_they_supply(self):
+        Product.objects.filter(pk=self.lamp.pk).update(stock=30)
+        result = self._import("products.csv", (
+            "id,store,name,price\n"
+            f"{self.lamp.pk},{self.store.pk},Brass lamp,25.00\n"
+        )).json()
+        self.assertEqual((result["updated"], result["error_count"]), (1, 0))
+        result = self._import("products.jsonl", json.dumps({"id": self.lamp.pk, "stock": ""})).json()
+        self.assertEqual((result["updated"], result["error_count"]), (1, 0))
+        self.lamp.refresh_from_db()
+        self.assertEqual(
+            (self.lamp.name, self.lamp.price, self.lamp.stock, self.lamp.description),
+            ("Brass lamp", 25, 30, "Desk"),
+        )
+        self.assertEqual([p.name for p in search_products("brass")], ["Brass lamp"])
+
+    def test_jsonl_import_reports_malformed_lines(self):
+        lines = [
+            json.dumps({"store": self.store.pk, "name": "Rug", "description": "Wool", "price": "80"}),
+            "{not json",
+            "[1, 2]",
+        ]
+        result = self._import("products.jsonl", "\n".join(lines)).json()
+        self.assertEqual((result["created"], result["error_count"]), (1, 2))
+
+    def test_export_streams_the_vendors_products_and_round_trips(self):
+        response = self.client.get(reverse("ecommerce:product-export"))
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(body.splitlines(), [
+            "id,store,name,description,price,stock",
+            f"{self.lamp.pk},{self.store.pk},Lamp,Desk,20.00,1",
+        ])
+        result = self._import("products.csv", body).json()
+        self.assertEqual((result["created"], result["updated"], result["error_count"]), (0, 1, 0))
+
+        response = self.client.get(reverse("ecommerce:product-export"), {"as": "jsonl"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0]["name"], "Lamp")
+
+    def test_export_is_for_vendors_only(self):
+        self.client.force_login(make_user("buyer", "Buyer"))
+        response = self.client.get(reverse("ecommerce:product-export"))
+        self.assertEqual(response.status_code, 403)
+
+
+# ----------------------------
+# Bulk API writes
+# ----------------------------
+class BulkProductAPITests(TestCase):
+    def setUp(self):
+        self.vendor = make_user("vendor", "Vendor")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.rival = Store.objects.create(name="Rival", vendor=make_user("rival", "Vendor"))
+        self.url = reverse("ecommerce:product-bulk")
+        OutboxEvent.objects.all().delete()
+        self.client.force_login(self.vendor)
+
+    def _send(self, method, payload):
+        return getattr(self.client, method)(self.url, payload, content_type="application/json")
+
+    def test_create_returns_one_result_per_item(self):
+        response = self._send("post", [
+            {"store": self.store.pk, "name": "Rug", "description": "Wool", "price": "80.00"},
+            {"store": self.store.pk, "name": "Mug", "description": "Tea", "price": "4.50", "stock": 3},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([p["name"] for p in response.json()], ["Rug", "Mug"])
+        self.assertTrue(all(p["id"] for p in response.json()))
+        self.assertEqual([p.name for p in search_products("wool")], ["Rug"])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_stock_sync_runs_a_constant_number_of_queries(self):
+        def sync(products, stock):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self._send("patch", [{"id": p.pk, "stock": stock} for p in products])
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        small, large = make_products(self.store, 5), make_products(self.store, 50)
+        sync(small, 1)  # warm the role cache
+        self.assertEqual(sync(small, 7), sync(large, 9))
+        self.assertEqual(set(Product.objects.filter(pk__in=[p.pk for p in large]).values_list("stock", flat=True)), {9})
+
+    def test_each_item_only_writes_the_fields_it_sent(self):
+        lamp, desk = make_products(self.store, 2, price="5.00", stock=10)
+        update = ProductBulkSerializer.update
+
+        def checkout_then_update(serializer, instances, validated_data):
+            # Stock that changed after the rows were read must survive.
+            Product.objects.filter(pk=lamp.pk).update(stock=4)
+            return update(serializer, instances, validated_data)
+
+        with mock.patch.object(ProductBulkSerializer, "update", checkout_then_update):
+            response = self._send("patch", [{"id": lamp.pk, "price": "6.00"}, {"id": desk.pk, "stock": 2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("price", "stock")),
+            [(Decimal("6.00"), 4), (Decimal("5.00"), 2)],
+        )
+
+    def test_invalid_item_rejects_the_whole_batch(self):
+        mine = make_products(self.store, 2)
+        theirs = make_products(self.rival, 1)
+        response = self._send("patch", [
+            {"id": mine[0].pk, "stock": 1},
+            {"id": theirs[0].pk, "stock": 1},
+            {"id": mine[1].pk, "store": self.rival.pk},
+            {"id": mine[1].pk, "price": "free"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"1", "2", "3"})
+        self.assertIn("store", response.json()["2"])
+        self.assertEqual(Product.objects.get(pk=mine[0].pk).stock, 100)
+
+    def test_delete_checks_ownership_of_every_id(self):
+        mine = make_products(self.store, 2)
+        theirs = make_products(self.rival, 1)
+        response = self._send("delete", {"ids": [mine[0].pk, theirs[0].pk]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.count(), 3)
+
+        response = self._send("delete", {"ids": [p.pk for p in mine]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"id": p.pk, "deleted": True} for p in mine])
+        self.assertEqual(list(Product.objects.all()), theirs)
+
+
+# ----------------------------
+# Shared cache
+# ----------------------------
+class SharedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.product = Product.objects.create(store=self.store, name="Lamp", description="", price=20, stock=5)
+        self.url = reverse("ecommerce:product-detail", args=[self.product.pk])
+
+    def _product_queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, **headers)
+        return response, len([q for q in ctx.captured_queries if "ecommerce_product" in q["sql"]])
+
+    def test_api_reads_are_cached_with_etags(self):
+        first, queries = self._product_queries(self.url)
+        self.assertEqual(queries, 3)  # COUNT and MAX(updated_at) for the ETag, then the row
+        second, queries = self._product_queries(self.url)
+        self.assertEqual(queries, 0)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["ETag"], first["ETag"])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        self.product.name = "Brass lamp"
+        self.product.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "Brass lamp")
+
+    def test_reviews_and_checkout_invalidate_product_data(self):
+        self.client.get(self.url)
+        Review.objects.create(product=self.product, user=self.buyer, text="Nice")
+        self.assertEqual(self.client.get(self.url).json()["review_count"], 1)
+        checkout_cart(self.buyer, {str(self.product.pk): 2})
+        self.assertEqual(self.client.get(self.url).json()["stock"], 3)
+
+        self.client.force_login(self.buyer)
+        detail = reverse("ecommerce:product_detail", args=[self.product.pk])
+        self.assertContains(self.client.get(detail), "Stock: 3")
+        _, queries = self._product_queries(detail)
+        self.assertEqual(queries, 0)
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+        bump_version(product_key(self.product.pk))
+        self.assertContains(self.client.get(detail), "Out of stock")
+
+    def test_store_page_is_cached_until_its_products_change(self):
+        self.client.force_login(self.vendor)
+        url = reverse("ecommerce:store_detail", args=[self.store.pk])
+        self.assertContains(self.client.get(url), "Lamp")
+        _, queries = self._product_queries(url)
+        self.assertEqual(queries, 0)
+        Product.objects.create(store=self.store, name="Rug", description="", price=80)
+        self.assertContains(self.client.get(url), "Rug")
+
+    def test_store_rename_bumps_one_key_and_refreshes_product_pages(self):
+        make_products(self.store, 50)
+        detail = reverse("ecommerce:product_detail", args=[self.product.pk])
+        self.assertContains(self.client.get(detail), "Store: Shop")
+        _, queries = self._product_queries(detail)
+        self.assertEqual(queries, 0)
+        with mock.patch("ecommerce.signals.bump_version", wraps=bump_version) as bump:
+            self.store.name = "Bazaar"
+            self.store.save()
+        bump.assert_called_once_with(CATALOGUE, STORES, store_key(self.store.pk))
+        self.assertContains(self.client.get(detail), "Store: Bazaar")
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_redis_backend(self):
+        redis = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://fake:6379/0",
+            "OPTIONS": {"connection_class": fakeredis.FakeConnection},
+        }
+        with override_settings(CACHES={"default": redis}):
+            calls = []
+            compute = lambda: calls.append(1) or len(calls)
+            self.assertEqual(cached("test", ["a"], ["x"], compute), 1)
+            self.assertEqual(cached("test", ["a"], ["x"], compute), 1)
+            # Another connection (as another worker would) sees the same versions.
+            other = caches.create_connection("default")
+            self.assertEqual(other.get("ecommerce:version:x"), get_versions("x")[0])
+            bump_version("x")
+            self.assertEqual(cached("test", ["a"], ["x"], compute), 2)
+
+
+# ----------------------------
+# ASGI
+# ----------------------------
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.vendor = make_user("vendor", "Vendor")
+        self.rival = make_user("rival", "Vendor")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        Store.objects.create(name="Other shop", vendor=self.rival)
+        self.product = Product.objects.create(store=self.store, name="Lamp", description="", price=20, stock=5)
+
+    async def test_catalogue_pages_run_as_async_views(self):
+        await self.async_client.aforce_login(self.vendor)
+        for url, text in [
+            (reverse("ecommerce:product_list"), "Lamp"),
+            (reverse("ecommerce:product_detail", args=[self.product.pk]), "Lamp"),
+            (reverse("ecommerce:store_detail", args=[self.store.pk]), "Shop"),
+        ]:
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+            response = await self.async_client.get(url)
+            self.assertContains(response, text)
+        self.assertEqual((await self.async_client.get("/products/999999/")).status_code, 404)
+
+    async def test_cached_api_reads_skip_the_drf_view(self):
+        url = reverse("ecommerce:product-detail", args=[self.product.pk])
+        self.assertTrue(iscoroutinefunction(resolve(url).func))
+        first = await self.async_client.get(url)
+        with mock.patch.object(ProductViewSet, "retrieve", side_effect=AssertionError):
+            second = await self.async_client.get(url)
+        self.assertEqual(second.content, first.content)
+        for header in ("Content-Type", "Allow", "ETag", "Last-Modified", "Cache-Control"):
+            self.assertEqual(second[header], first[header])
+        # COUNT and MAX(updated_at) for the ETag, then the row; all on the first request.
+        self.assertEqual(metrics.snapshot()["ecommerce:product-detail"]["queries"], 3)
+        response = await self.async_client.get(url, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_cart_and_checkout_stay_sync_and_transactional(self):
+        buyer = await User.objects.acreate_user("buyer", "buyer@example.com", "pass12345")
+        await buyer.groups.aadd((await Group.objects.aget_or_create(name="Buyer"))[0])
+        await self.async_client.aforce_login(buyer)
+        await self.async_client.post(reverse("ecommerce:add_to_cart", args=[self.product.pk]), {"quantity": 2})
+        response = await self.async_client.post(reverse("ecommerce:checkout"))
+        self.assertEqual(response.status_code, 200)
+        order = await Order.objects.aget(user=buyer)
+        self.assertEqual(order.item_count, 2)
+        self.assertEqual((await Product.objects.aget(pk=self.product.pk)).stock, 3)
+        self.assertFalse(await CartItem.objects.filter(cart__user=buyer).aexists())
+        self.assertFalse(await StockReservation.objects.filter(user=buyer).aexists())
+
+    async def test_vendor_store_lists_stay_separate(self):
+        url = reverse("ecommerce:store-list")
+        await self.async_client.aforce_login(self.vendor)
+        await self.async_client.get(url)
+        mine = await self.async_client.get(url)
+        await self.async_client.aforce_login(self.rival)
+        theirs = await self.async_client.get(url)
+        self.assertEqual([store["name"] for store in mine.json()["results"]], ["Shop"])
+        self.assertEqual([store["name"] for store in theirs.json()["results"]], ["Other shop"])
+
+
+# ----------------------------
+# Conditional GET
+# ----------------------------
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("buyer", "Buyer")
+        self.store = Store.objects.create(name="Shop", vendor=self.vendor)
+        self.products = make_products(self.store, 3)
+
+    def test_etags_survive_a_cache_flush_and_skip_serializing(self):
+        url = reverse("ecommerce:product-list")
+        etag = self.client.get(url)["ETag"]
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        product_queries = [q["sql"] for q in ctx.captured_queries if "ecommerce_product" in q["sql"]]
+        self.assertEqual(len(product_queries), 2)
+        self.assertTrue(all("COUNT" in sql or "MAX" in sql for sql in product_queries))
+
+    def test_writes_that_bypass_save_change_the_etag(self):
+        url = reverse("ecommerce:product-detail", args=[self.products[0].pk])
+        etags = [self.client.get(url)["ETag"]]
+        checkout_cart(self.buyer, {str(self.products[0].pk): 1})
+        etags.append(self.client.get(url)["ETag"])
+        Review.objects.create(product=self.products[0], user=self.buyer, text="Nice")
+        etags.append(self.client.get(url)["ETag"])
+        self.assertEqual(len(set(etags)), 3)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1]).status_code, 304)
+
+    def test_if_modified_since_on_stores_and_reviews(self):
+        Review.objects.create(product=self.products[0], user=self.buyer, text="Nice")
+        for url in (reverse("ecommerce:review-list"), reverse("ecommerce:store-list")):
+            last_modified = self.client.get(url)["Last-Modified"]
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # A store changed a second later is newer than the client's copy.
+        Store.objects.filter(pk=self.store.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        cache.clear()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+
+# ----------------------------
+# List fast path
+# ----------------------------
+class RowListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.vendor = make_user("vendor", "Vendor")
+        self.buyer = make_user("büyer", "Buyer")
+        self.store = Store.objects.create(name='Café "Ünïcode" \u2028 😀', description="Line\nbreak", vendor=self.vendor)
+        self.products = make_products(self.store, CATALOGUE_PAGE_SIZE + 3, price="1234.50")
+        self.products[0].image = make_upload()
+        self.products[0].save()
+        process_batch()
+        Review.objects.create(product=self.products[0], user=self.buyer, text="Great \u2029 value")
+        Review.objects.create(product=self.products[1], user=self.vendor, text="", verified=True)
+
+    def _compare(self, viewset, url):
+        cache.clear()
+        fast = self.client.get(url)
+        self.assertEqual(fast.status_code, 200)
+        # A cache hit is rendered the same way.
+        self.assertEqual(self.client.get(url).content, fast.content)
+        cache.clear()
+        with mock.patch.object(viewset, "row_plan", None):
+            slow = self.client.get(url)
+        self.assertEqual(fast.content, slow.content)
+        return fast.json()
+
+    def test_list_output_matches_the_serializers(self):
+        self._compare(StoreViewSet, reverse("ecommerce:store-list"))
+        data = self._compare(ProductViewSet, reverse("ecommerce:product-list"))
+        self.assertTrue(data["results"][0]["image"].startswith("http://testserver/"))
+        self.assertTrue(data["results"][0]["image_variants"]["thumb"]["webp"].startswith("http://testserver/"))
+        self.assertEqual(data["results"][0]["price"], "1234.50")
+        self._compare(ProductViewSet, data["next"])
+        self._compare(ProductViewSet, reverse("ecommerce:product-list") + "?ordering=-price&in_stock=1")
+        data = self._compare(ReviewViewSet, reverse("ecommerce:review-list"))
+        self.assertEqual([review["user"] for review in data["results"]], ["vendor", "büyer"])
+        self.client.force_login(self.vendor)
+        self._compare(StoreViewSet, reverse("ecommerce:store-list"))
+        with mock.patch("ecommerce.rows.orjson", None):
+            self._compare(ReviewViewSet, reverse("ecommerce:review-list") + f"?product={self.products[0].pk}")
+
+    def test_renderer_falls_back_for_other_data(self):
+        data = {"price": Decimal("1.50"), "text": "a\u2028b"}
+        self.assertEqual(RowJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            RowJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        def count(url):
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(ctx.captured_queries)
+
+        urls = [reverse("ecommerce:store-list"), reverse("ecommerce:review-list")]
+        before = [count(url) for url in urls]
+        for i in range(8):
+            user = make_user(f"user{i}", "Vendor")
+            Store.objects.create(name=f"Store {i}", vendor=user)
+            Review.objects.create(product=self.products[i], user=user, text="Fine")
+        self.assertEqual([count(url) for url in urls], before)
+
+    def test_bench_rows_command(self):
+        out = StringIO()
+        call_command("bench_rows", rows=30, users=3, repeat=1, stdout=out)
+        self.assertEqual(out.getvalue().count("rows/sec"), 6)
+        self.assertFalse(User.objects.filter(username__startswith="bench-rows-").exists())
+
+
+# ----------------------------
+# Synthetic data and benchmarks
+# ----------------------------
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            "generate_data", vendors=2, stores=3, products=40, buyers=4, orders=25, reviews=30,
+            chunk_size=10, stdout=StringIO(),
+        )
+
+    def test_generated_data_is_consistent(self):
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Order.objects.count(), 25)
+        self.assertEqual(Review.objects.filter(verified=True).count(), 21)
+        self.assertEqual(sum(Product.objects.values_list("review_count", flat=True)), 30)
+        sold = OrderLine.objects.aggregate(n=Sum("quantity"))["n"]
+        self.assertEqual(SalesDailyRollup.objects.aggregate(n=Sum("units"))["n"], sold)
+        self.assertTrue(is_vendor(User.objects.get(username="synth-vendor-0")))
+        self.assertTrue(self.client.login(username="synth-buyer-3", password="synth-pass-123"))
+        with self.assertRaises(CommandError):
+            call_command("generate_data", stdout=StringIO())
+
+    def test_only_the_generated_days_are_rebuilt(self):
+        line = OrderLine.objects.select_related("product").first()
+        self.assertEqual(line.product_name, line.product.name)
+        old_day = timezone.localdate() - timedelta(days=400)
+        SalesDailyRollup.objects.create(store=line.product.store, product=line.product, day=old_day, units=7)
+        with mock.patch("ecommerce.management.commands.generate_data.rebuild_rollups",
+                        wraps=rebuild_rollups) as rebuild:
+            call_command(
+                "generate_data", vendors=1, stores=1, products=5, buyers=1, orders=5, reviews=0, days=1,
+                prefix="again", stdout=StringIO(),
+            )
+        first, last = rebuild.call_args.args
+        self.assertGreaterEqual(first, timezone.localdate() - timedelta(days=1))
+        self.assertEqual(last, timezone.localdate())
+        self.assertEqual(SalesDailyRollup.objects.get(day=old_day).units, 7)
+
+    def test_bench_suite_writes_results_and_rolls_back(self):
+        path = f"{tempfile.mkdtemp()}/bench.json"
+        self.addCleanup(shutil.rmtree, path.rsplit("/", 1)[0])
+        scenarios = ["product_list", "view_cart", "checkout", "api_products"]
+        call_command("bench_suite", requests=3, warmup=1, scenarios=scenarios, output=path, stdout=StringIO())
+        with open(path) as f:
+            results = json.load(f)
+        self.assertEqual(results["meta"]["rows"]["orders"], 25)
+        self.assertEqual(list(results["scenarios"]), scenarios)
+        for result in results["scenarios"].values():
+            self.assertEqual(result["errors"], 0)
+            self.assertGreater(result["req_per_sec"], 0)
+        self.assertGreater(results["scenarios"]["checkout"]["queries"]["mean"], 0)
+        self.assertEqual(Order.objects.count(), 25)
+        self.assertFalse(CartItem.objects.exists())
+
+        results["scenarios"]["api_products"]["queries"]["mean"] = -1
+        with open(path, "w") as f:
+            json.dump(results, f)
+        with self.assertRaisesMessage(CommandError, "api_products queries"):
+            call_command(
+                "bench_suite", requests=1, warmup=0, scenarios=["api_products"], output=path,
+                compare=path, fail_on_regression=50, stdout=StringIO(),
+            )
@@ -0,0 +1,63 @@
+"""
+Single-use password reset tokens, stored in ResetToken.
+
+Only a token's SHA-256 is stored, looked up through the unique index on
+token_hash, so every worker sees the same tokens and a copy of the table
+cannot be used to reset passwords. consume() marks a token used with one
+conditional UPDATE, so a link works once even if it is submitted twice at
+the same time.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import ResetToken
+
+RESET_TOKEN_TTL = timedelta(hours=1)
+PURGE_BATCH_SIZE = 1000
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user):
+    """Create a reset token for user and return it (to be emailed)."""
+    token = secrets.token_urlsafe(32)
+    ResetToken.objects.create(
+        user=user, token_hash=hash_token(token), expiry_date=timezone.now() + RESET_TOKEN_TTL
+    )
+    return token
+
+
+def _usable(token):
+    return ResetToken.objects.filter(token_hash=hash_token(token), used=False, expiry_date__gt=timezone.now())
+
+
+def token_is_valid(token):
+    return _usable(token).exists()
+
+
+def consume_token(token):
+    """Mark token used if it is still valid. Returns its user's id, or None."""
+    if not _usable(token).update(used=True):
+        return None
+    return ResetToken.objects.filter(token_hash=hash_token(token)).values_list("user_id", flat=True).first()
+
+
+def purge_expired_tokens(batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete expired tokens, batch_size rows per statement (found through the
+    expiry_date index) so no long lock is held. Returns the number deleted.
+    """
+    total = 0
+    while True:
+        now = timezone.now()
+        expired = ResetToken.objects.filter(expiry_date__lte=now).order_by("expiry_date")
+        pks = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return total
+        deleted, _ = ResetToken.objects.filter(pk__in=pks).delete()
+        total += deleted
@@ -7,8 +7,22 @@ from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+class FakeTwitterClient:
+    """
+    Local stand-in for tweepy.Client, enabled with TWITTER_FAKE = True.
+    Tweets are recorded in FakeTwitterClient.sent_tweets instead of posted.
+    """
+    sent_tweets = []
+
+    def create_tweet(self, text, **kwargs):
+        self.sent_tweets.append(text)
+        return {"data": {"id": str(len(self.sent_tweets)), "text": text}}
+
+
 def get_twitter_client():
     """Get Twitter API v2 Client"""
+    if getattr(settings, 'TWITTER_FAKE', False):
+        return FakeTwitterClient()
     if not hasattr(settings, 'TWITTER_API_KEY'):
         return None
     
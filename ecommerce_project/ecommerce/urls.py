@@ -11,6 +11,7 @@ router = routers.DefaultRouter()
 router.register(r"stores", views.StoreViewSet, basename="store")
 router.register(r"products", views.ProductViewSet, basename="product")
 router.register(r"reviews", views.ReviewViewSet, basename="review")
+router.register(r"analytics", views.SalesAnalyticsViewSet, basename="analytics")
 
 # ----------------------------
 # URL patterns
@@ -31,7 +32,9 @@ urlpatterns = [
 
     # Products
     path("", views.product_list, name="product_list"),  # homepage → product list
+    path("search/", views.search, name="search"),
     path("products/<int:pk>/", views.product_detail, name="product_detail"),
+    path("products/<int:pk>/reviews/", views.product_reviews, name="product_reviews"),
     path("products/add/", views.add_product, name="add_product"),
     path("products/<int:pk>/edit/", views.edit_product, name="edit_product"),
     path("products/<int:pk>/delete/", views.delete_product, name="delete_product"),
@@ -43,6 +46,7 @@ urlpatterns = [
 
     # Checkout
     path("checkout/", views.checkout, name="checkout"),
+    path("orders/<int:pk>/", views.order_detail, name="order_detail"),
 
     # Reviews
     path("products/<int:pk>/review/", views.add_review, name="add_review"),
@@ -51,6 +55,9 @@ urlpatterns = [
     path("stores/create/", views.create_store, name="create_store"),
     path("stores/<int:pk>/delete/", views.delete_store, name="delete_store"),
 
+    # Metrics (Prometheus text format)
+    path("metrics", views.metrics_view, name="metrics"),
+
     # Password reset
     path("send-password-reset/", views.send_password_reset, name="send_password_reset"),
     path("reset-password/<str:token>/", views.reset_password, name="reset_password"),
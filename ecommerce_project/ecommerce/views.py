@@ -1,42 +1,79 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import Group, User
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.views.static import serve as static_serve
 
-import secrets
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 
-from .models import Store, Product, Review, Purchase
+from .models import Store, Product, Review, Purchase, Order, OrderLine, SalesDailyRollup, OutboxEvent
 from .forms import UserRegisterForm, ProductForm, StoreForm, ReviewForm
-from ecommerce.utils.twitter_api import tweet_store, tweet_product
+from .cart import (
+    EmptyCart, OutOfStock, add_item, checkout_cart, clear_cart, load_cart, price_cart, remove_item, render_invoice,
+)
+from .outbox import enqueue
+from .tokens import consume_token, issue_token, token_is_valid
+from .roles import ais_vendor, is_vendor, is_buyer
+from .caching import (
+    CATALOGUE,
+    PRODUCTS,
+    REVIEWS,
+    STORES,
+    AsyncCachedReadMixin,
+    CachedReadMixin,
+    acached,
+    aget_version,
+    product_key,
+    store_key,
+)
+from .pagination import (
+    KeysetPage,
+    ProductCursorPagination,
+    ReviewCursorPagination,
+    paginate_orders,
+    paginate_reviews,
+    parse_cursor,
+)
+from .search import search_products
+from . import metrics
+from .storage import IMMUTABLE_CACHE_CONTROL, is_blob_path
+from .filters import ProductFilterBackend, ProductOrderingFilter, product_facets
+from . import bulk
+from . import analytics
 
 # REST Framework
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 
 from .serializers import (
     StoreSerializer,
     StoreDetailSerializer,
+    BULK_MAX_ITEMS,
     ProductSerializer,
     ReviewSerializer,
+    RevenueDaySerializer,
+    PRODUCT_ROWS,
+    REVIEW_ROWS,
+    STORE_ROWS,
+    SellThroughSerializer,
+    TopProductSerializer,
 )
 from .permissions import IsOwnerOrReadOnly
-
-
-# ----------------------------
-# Helper functions
-# ----------------------------
-def is_vendor(user):
-    return user.groups.filter(name="Vendor").exists()
-
-def is_buyer(user):
-    return user.groups.filter(name="Buyer").exists()
+from .rows import RowListMixin
 
 
 # ----------------------------
@@ -69,7 +106,7 @@ def user_login(request):
         if user:
             login(request, user)
             # Redirect based on user role/group
-            if user.groups.filter(name="Vendor").exists():
+            if is_vendor(user):
                 return redirect("ecommerce:vendor_dashboard")
             else:
                 return redirect("ecommerce:product_list")
@@ -88,49 +125,133 @@ def user_logout(request):
 @login_required
 @user_passes_test(is_vendor, login_url="/login/")
 def vendor_dashboard(request):
-    stores = Store.objects.filter(vendor=request.user)
-    products = Product.objects.filter(store__vendor=request.user)
+    """
+    Per-store stats for all of the vendor's stores, and one page of products
+    from the store picked with ?store= (the first by default). The number of
+    queries does not depend on how many products or sales there are.
+    """
+    stores = analytics.store_stats(Store.objects.filter(vendor=request.user))
+    wanted = parse_cursor(request.GET.get("store"))
+    selected = next((store for store in stores if store.pk == wanted), stores[0] if stores else None)
+    page = None
+    if selected is not None:
+        page = KeysetPage(
+            Product.objects.filter(store=selected).only("id", "name", "price", "stock", "store_id"),
+            after=parse_cursor(request.GET.get("after")),
+            before=parse_cursor(request.GET.get("before")),
+        )
+    totals = {
+        field: sum(getattr(store, field) for store in stores)
+        for field in ("product_count", "total_stock", "units_sold", "revenue")
+    }
     return render(
         request,
         "ecommerce/vendor_dashboard.html",
-        {"stores": stores, "products": products},
+        {"stores": stores, "selected": selected, "page": page, "totals": totals},
     )
 
 
 @login_required
 @user_passes_test(is_buyer, login_url="/login/")
 def buyer_dashboard(request):
-    purchases = Purchase.objects.filter(user=request.user)
-    return render(request, "ecommerce/buyer_dashboard.html", {"purchases": purchases})
+    orders, next_url, previous_url = paginate_orders(
+        request,
+        Order.objects.filter(user=request.user).prefetch_related(
+            Prefetch("lines", queryset=OrderLine.objects.order_by("pk"))
+        ),
+        reverse("ecommerce:buyer_dashboard"),
+    )
+    return render(
+        request,
+        "ecommerce/buyer_dashboard.html",
+        {"orders": orders, "next_url": next_url, "previous_url": previous_url},
+    )
 
 
 # ----------------------------
 # Products
 # ----------------------------
+# product_list, product_detail and store_detail are async views: under ASGI
+# they wait on the cache and database without holding a worker thread.
+# Templates are still rendered synchronously, in a thread.
+async def arender(request, template_name, context):
+    """render() for async views."""
+    # Context processors read request.user, which must not query from here.
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
 @login_required
-def product_list(request):
-    products = Product.objects.select_related("store").all()
-    stores = Store.objects.all()
-    
-    # Check if user is a vendor
-    is_vendor = False
-    if request.user.is_authenticated:
-        is_vendor = request.user.groups.filter(name='Vendor').exists()
-    
-    return render(
+async def product_list(request):
+    # Rows are fetched while rendering, unless the page fragment is cached.
+    page = KeysetPage(
+        Product.objects.select_related("store"),
+        after=parse_cursor(request.GET.get("after")),
+        before=parse_cursor(request.GET.get("before")),
+    )
+    user = await request.auser()
+    return await arender(
         request,
         "ecommerce/product_list.html",
-        {"products": products, "stores": stores, "is_vendor": is_vendor},
+        {
+            "page": page,
+            "catalogue_version": await aget_version(CATALOGUE),
+            "is_vendor": await ais_vendor(user),
+        },
     )
 
 
-def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    reviews = product.reviews.select_related("user").all()
+def search(request):
+    query = request.GET.get("q", "").strip()
+    products = search_products(query) if query else []
     return render(
+        request,
+        "ecommerce/search.html",
+        {"query": query, "products": products},
+    )
+
+
+def review_queryset():
+    """Reviews with only the author's username loaded from User."""
+    return Review.objects.select_related("user").only(
+        "id", "product_id", "text", "verified", "created_at", "user__username"
+    )
+
+
+async def product_detail(request, pk):
+    async def load():
+        product = await aget_object_or_404(Product.objects.select_related("store"), pk=pk)
+        # DRF's cursor pagination is synchronous.
+        reviews, next_url = await sync_to_async(paginate_reviews)(
+            request,
+            review_queryset().filter(product=product),
+            reverse("ecommerce:product_reviews", args=[pk]),
+        )
+        return product, reviews, next_url
+
+    product, reviews, next_url = await acached(
+        "product_detail", [request.build_absolute_uri()], [product_key(pk)], load,
+        # The page shows the store's name.
+        depends=lambda page: [store_key(page[0].store_id)],
+    )
+    return await arender(
         request,
         "ecommerce/product_detail.html",
-        {"product": product, "reviews": reviews},
+        {"product": product, "reviews": reviews, "next_reviews_url": next_url},
+    )
+
+
+def product_reviews(request, pk):
+    """HTML fragment with the next page of reviews ("Load more")."""
+    reviews, next_url = paginate_reviews(
+        request,
+        review_queryset().filter(product_id=pk),
+        reverse("ecommerce:product_reviews", args=[pk]),
+    )
+    return render(
+        request,
+        "ecommerce/review_list.html",
+        {"reviews": reviews, "next_reviews_url": next_url},
     )
 
 
@@ -144,7 +265,6 @@ def add_product(request):
             product = form.save(commit=False)
             product.store = form.cleaned_data["store"]
             product.save()
-            tweet_product(product)
             messages.success(request, "Product added successfully!")
             return redirect("ecommerce:vendor_dashboard")
     else:
@@ -159,91 +279,74 @@ def add_product(request):
 @login_required
 def add_to_cart(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    qty = int(request.POST.get("quantity", 1))
-    cart = request.session.get("cart", {})
-    cart[str(product.pk)] = cart.get(str(product.pk), 0) + qty
-    request.session["cart"] = cart
-    request.session.modified = True
+    # The catalogue page posts every row's quantity as quantity-<pk>
+    qty = int(request.POST.get(f"quantity-{product.pk}", request.POST.get("quantity", 1)))
+    try:
+        add_item(request.user, product, max(qty, 1))
+    except OutOfStock as e:
+        return HttpResponse(str(e), status=400)
     return redirect("ecommerce:view_cart")
 
 
 @login_required
 def view_cart(request):
-    cart = request.session.get("cart", {})
-    items = []
-    total = 0
-    for pid, qty in cart.items():
-        try:
-            product = Product.objects.get(pk=int(pid))
-            subtotal = product.price * qty
-            items.append({"product": product, "quantity": qty, "subtotal": subtotal})
-            total += subtotal
-        except Product.DoesNotExist:
-            continue
+    items, total = price_cart(load_cart(request.user))
     return render(request, "ecommerce/cart.html", {"items": items, "total": total})
 
 
 @login_required
 def remove_from_cart(request, pk):
-    cart = request.session.get("cart", {})
-    if str(pk) in cart:
-        del cart[str(pk)]
-        request.session["cart"] = cart
-        request.session.modified = True
+    remove_item(request.user, pk)
     return redirect("ecommerce:view_cart")
 
 
 @login_required
 @user_passes_test(is_buyer, login_url="/login/")
 def checkout(request):
-    cart = request.session.get("cart", {})
+    cart = load_cart(request.user)
     if not cart:
         return redirect("ecommerce:view_cart")
 
-    items = []
-    total = 0
-    for pid, qty in cart.items():
-        product = Product.objects.get(pk=int(pid))
-        if product.stock < qty:
-            return HttpResponse(f"Not enough stock for {product.name}", status=400)
-
-        product.stock -= qty
-        product.save()
-        Purchase.objects.create(user=request.user, product=product, quantity=qty)
-        subtotal = product.price * qty
-        items.append({"product": product, "quantity": qty, "subtotal": subtotal})
-        total += subtotal
-
-    request.session["cart"] = {}
-    request.session.modified = True
-
-    # Send invoice email
-    from django.core.mail import send_mail
-    from django.template.loader import render_to_string
-    
-    invoice_html = render_to_string('ecommerce/invoice.html', {
-        'user': request.user,
-        'items': items,
-        'total': total,
-        'date': datetime.now()
-    })
-    
-    send_mail(
-        subject='Your Order Invoice',
-        message=f'Thank you for your order! Total: ${total}',
-        from_email='noreply@ecommerce.com',
-        recipient_list=[request.user.email],
-        html_message=invoice_html,
-        fail_silently=True,
+    try:
+        with transaction.atomic():
+            order, items = checkout_cart(request.user, cart)
+            clear_cart(request.user)
+    except OutOfStock as e:
+        return HttpResponse(str(e), status=400)
+    except EmptyCart:
+        # Only products that no longer exist were left in it.
+        clear_cart(request.user)
+        return redirect("ecommerce:view_cart")
+
+    # Queue invoice email (sent by the process_outbox worker)
+    invoice_html = render_invoice(order, [item["line"] for item in items])
+    enqueue(
+        OutboxEvent.EMAIL,
+        {
+            "subject": f"Your Order Invoice #{order.pk}",
+            "message": f"Thank you for your order! Total: ${order.total}",
+            "from_email": "noreply@ecommerce.com",
+            "recipient_list": [request.user.email],
+            "html_message": invoice_html,
+        },
+        dedup_key=f"invoice:order:{order.pk}",
     )
 
     return render(
         request,
         "ecommerce/checkout.html",
-        {"items": items, "total": total, "date": datetime.now()},
+        {"order": order, "items": items, "total": order.total, "date": order.created_at},
     )
 
 
+@login_required
+def order_detail(request, pk):
+    """A past order, shown as its invoice."""
+    order = get_object_or_404(Order.objects.select_related("user"), pk=pk, user=request.user)
+    lines = order.lines.order_by("pk")
+    return render(request, "ecommerce/order_detail.html", {"order": order, "lines": lines})
+
+
 # ----------------------------
 # Reviews
 # ----------------------------
@@ -280,7 +383,6 @@ def create_store(request):
             store = form.save(commit=False)
             store.vendor = request.user
             store.save()
-            # tweet_store(store)  # Disabled for now
             return redirect("ecommerce:vendor_dashboard")
     else:
         form = StoreForm()
@@ -303,10 +405,10 @@ def delete_store(request, pk):
 # API ViewSets
 # ----------------------------
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from .permissions import IsVendorOrReadOnly, IsOwnerOrReadOnly
+from .permissions import IsAuthenticatedVendor, IsVendorOrReadOnly, IsOwnerOrReadOnly
 
 
-class StoreViewSet(viewsets.ModelViewSet):
+class StoreViewSet(AsyncCachedReadMixin, RowListMixin, viewsets.ModelViewSet):
     """
     API endpoint for stores.
     - Anyone can view stores (GET)
@@ -314,6 +416,7 @@ class StoreViewSet(viewsets.ModelViewSet):
     """
     queryset = Store.objects.all()
     permission_classes = [IsVendorOrReadOnly]
+    row_plan = STORE_ROWS
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -324,17 +427,27 @@ class StoreViewSet(viewsets.ModelViewSet):
         """Set the vendor to current user when creating"""
         serializer.save(vendor=self.request.user)
     
+    def cache_versions(self):
+        return [store_key(self.kwargs["pk"])] if self.action == "retrieve" else [STORES]
+
+    def cache_vary(self):
+        # A vendor's store list holds only their own stores.
+        return self.request.user.pk if is_vendor(self.request.user) else ""
+
+    async def acache_vary(self):
+        return self.request.user.pk if await ais_vendor(self.request.user) else ""
+
     def get_queryset(self):
         """Vendors see only their stores via API, others see all"""
-        queryset = Store.objects.all()
-        if self.request.user.is_authenticated and self.request.user.groups.filter(name='Vendor').exists():
+        queryset = Store.objects.order_by("id")
+        if is_vendor(self.request.user):
             if self.action in ['list', 'update', 'partial_update', 'destroy']:
                 # Vendors see only their own stores for modification
                 queryset = queryset.filter(vendor=self.request.user)
         return queryset
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(AsyncCachedReadMixin, RowListMixin, viewsets.ModelViewSet):
     """
     API endpoint for products.
     - Anyone can view products (GET)
@@ -343,18 +456,117 @@ class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsVendorOrReadOnly]
+    pagination_class = ProductCursorPagination
+    row_plan = PRODUCT_ROWS
+    filter_backends = [ProductFilterBackend, ProductOrderingFilter]
+    ordering_fields = ["id", "price", "stock", "name"]
+    ordering = ["id"]
     
+    def cache_versions(self):
+        return [product_key(self.kwargs["pk"])] if self.action == "retrieve" else [PRODUCTS]
+
     def get_queryset(self):
         """Vendors see only products from their stores"""
         queryset = Product.objects.all()
-        if self.request.user.is_authenticated and self.request.user.groups.filter(name='Vendor').exists():
+        if is_vendor(self.request.user):
             if self.action in ['update', 'partial_update', 'destroy']:
                 # Vendors can only modify their own products
                 queryset = queryset.filter(store__vendor=self.request.user)
         return queryset
 
-
-class ReviewViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Ranked full-text search: /api/products/search/?q=..."""
+        products = search_products(request.query_params.get("q", ""))
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """Products per store and price bucket for the current filters."""
+        return Response(product_facets(self.get_queryset(), request.query_params))
+
+    @action(detail=False, methods=["post", "patch", "delete"])
+    def bulk(self, request):
+        """
+        Batch writes to the vendor's products, all in one transaction:
+        POST a list of new products, PATCH a list of changes (each with its
+        "id"), or DELETE {"ids": [...]}. Returns one result per item; if any
+        item is invalid nothing is written and the errors are keyed by index.
+        """
+        if request.method == "DELETE":
+            return self._bulk_delete(request)
+        products = None
+        with transaction.atomic():
+            if request.method == "PATCH":
+                items = request.data if isinstance(request.data, list) else []
+                ids = [item.get("id") for item in items if isinstance(item, dict)]
+                # Locked, and validated as locked, so no checkout can change
+                # them between the read and the write.
+                products = list(
+                    Product.objects.select_for_update(of=("self",)).select_related("store")
+                    .filter(store__vendor=request.user, pk__in=[pk for pk in ids if isinstance(pk, int)])
+                    .order_by("pk")
+                )
+            serializer = self.get_serializer(
+                products, data=request.data, many=True, partial=products is not None, max_length=BULK_MAX_ITEMS
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(
+            serializer.data,
+            status=status.HTTP_200_OK if products is not None else status.HTTP_201_CREATED,
+        )
+
+    def _bulk_delete(self, request):
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or len(ids) > BULK_MAX_ITEMS:
+            raise ValidationError({"ids": f"Must be a list of 1 to {BULK_MAX_ITEMS} product ids."})
+        owned = set(
+            Product.objects.filter(store__vendor=request.user, pk__in=[pk for pk in ids if isinstance(pk, int)])
+            .values_list("pk", flat=True)
+        )
+        errors = {
+            index: {"id": ["No product with this id in your stores."]}
+            for index, pk in enumerate(ids) if pk not in owned
+        }
+        if errors:
+            raise ValidationError(errors)
+        with transaction.atomic():
+            Product.objects.filter(pk__in=owned).delete()
+        return Response([{"id": pk, "deleted": True} for pk in ids])
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Create or update many products from an uploaded .csv or .jsonl file
+        (form field "file"). Rows with an id update that product; invalid rows
+        are skipped and reported by line number.
+        """
+        upload = request.FILES.get("file")
+        fmt = bulk.format_for(upload.name) if upload else None
+        if fmt is None:
+            raise ValidationError({"file": "Upload a .csv or .jsonl file."})
+        store_ids = Store.objects.filter(vendor=request.user).values_list("pk", flat=True)
+        return Response(bulk.import_products(upload, fmt, store_ids))
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Stream the vendor's products as CSV, or JSON Lines with ?as=jsonl."""
+        if not is_vendor(request.user):
+            raise PermissionDenied("Only vendors can export products.")
+        fmt = request.query_params.get("as", "csv")
+        if fmt not in bulk.CONTENT_TYPES:
+            raise ValidationError({"as": "Must be csv or jsonl."})
+        queryset = self.filter_queryset(Product.objects.filter(store__vendor=request.user))
+        response = StreamingHttpResponse(
+            bulk.export_products(queryset, fmt), content_type=bulk.CONTENT_TYPES[fmt]
+        )
+        response["Content-Disposition"] = f'attachment; filename="products.{fmt}"'
+        return response
+
+
+class ReviewViewSet(CachedReadMixin, RowListMixin, viewsets.ModelViewSet):
     """
     API endpoint for reviews.
     - Anyone can view reviews (GET)
@@ -364,18 +576,109 @@ class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    pagination_class = ReviewCursorPagination
+    row_plan = REVIEW_ROWS
+
+    def cache_versions(self):
+        return [REVIEWS]
+
+    def get_queryset(self):
+        """Optionally filter by ?product=<id>"""
+        queryset = review_queryset()
+        product = self.request.query_params.get("product")
+        if product:
+            if not product.isdigit():
+                raise ValidationError({"product": "Must be a product id."})
+            queryset = queryset.filter(product_id=product)
+        return queryset
     
     def perform_create(self, serializer):
         """Set the user to current user when creating review"""
         serializer.save(user=self.request.user)
 
 
+class SalesAnalyticsViewSet(viewsets.ViewSet):
+    """
+    Sales reports for the requesting vendor's stores, read from the daily
+    rollups only (see analytics.py).
+    - ?from=YYYY-MM-DD&to=YYYY-MM-DD (default: the last 30 days)
+    - ?store=<id> to report on one store
+    - ?limit=<n> for top-products and sell-through (default 20, max 500)
+    """
+    permission_classes = [IsAuthenticatedVendor]
+
+    def _rollups(self):
+        params = self.request.query_params
+        try:
+            last = date.fromisoformat(params["to"]) if params.get("to") else timezone.localdate()
+            if params.get("from"):
+                first = date.fromisoformat(params["from"])
+            else:
+                first = last - timedelta(days=analytics.DEFAULT_DAYS - 1)
+        except ValueError:
+            raise ValidationError({"detail": "from and to must be dates (YYYY-MM-DD)."})
+        rollups = SalesDailyRollup.objects.filter(store__vendor=self.request.user, day__range=(first, last))
+        store = params.get("store")
+        if store:
+            if not store.isdigit():
+                raise ValidationError({"store": "Must be a store id."})
+            rollups = rollups.filter(store_id=store)
+        return rollups
+
+    def _limit(self):
+        limit = self.request.query_params.get("limit", "20")
+        if not limit.isdigit() or not 0 < int(limit) <= analytics.MAX_LIMIT:
+            raise ValidationError({"limit": f"Must be between 1 and {analytics.MAX_LIMIT}."})
+        return int(limit)
+
+    @action(detail=False)
+    def revenue(self, request):
+        rows = analytics.revenue_by_day(self._rollups())
+        return Response(RevenueDaySerializer(rows, many=True).data)
+
+    @action(detail=False, url_path="top-products")
+    def top_products(self, request):
+        rows = analytics.top_products(self._rollups(), self._limit())
+        return Response(TopProductSerializer(rows, many=True).data)
+
+    @action(detail=False, url_path="sell-through")
+    def sell_through(self, request):
+        rows = analytics.sell_through(self._rollups(), self._limit())
+        return Response(SellThroughSerializer(rows, many=True).data)
+
+
 # ----------------------------
-# Password Reset
+# Media
 # ----------------------------
-RESET_TOKENS = {}
+def serve_media(request, path):
+    """Development media server; content-addressed blobs are cached forever."""
+    response = static_serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_blob_path(path):
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 
+# ----------------------------
+# Metrics
+# ----------------------------
+def metrics_view(request):
+    """
+    Per-view request metrics in Prometheus text format. With METRICS_TOKEN
+    set the token is required; without it, only staff users and INTERNAL_IPS
+    may read them.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return HttpResponse(status=401)
+    elif not (request.user.is_staff or request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render_prometheus(), content_type="text/plain; version=0.0.4")
+
+
+# ----------------------------
+# Password Reset
+# ----------------------------
 @csrf_exempt
 def send_password_reset(request):
     if request.method == "POST":
@@ -385,11 +688,7 @@ def send_password_reset(request):
 
         user = User.objects.filter(email=email).first()
         if user:
-            token = secrets.token_urlsafe(32)
-            RESET_TOKENS[token] = {
-                "user_id": user.id,
-                "expires": datetime.now() + timedelta(hours=1),
-            }
+            token = issue_token(user)
             reset_link = request.build_absolute_uri(f"/reset-password/{token}/")
 
             send_mail(
@@ -407,20 +706,23 @@ def send_password_reset(request):
 
 @csrf_exempt
 def reset_password(request, token):
-    token_data = RESET_TOKENS.get(token)
-    if not token_data or datetime.now() > token_data["expires"]:
-        return HttpResponse("Invalid or expired token", status=400)
-
     if request.method == "POST":
-        password = request.POST.get("password")
+        password = request.POST.get("password") or request.POST.get("new_password")
         if not password:
             return JsonResponse({"error": "Password is required"}, status=400)
-        user = get_object_or_404(User, id=token_data["user_id"])
+        confirm = request.POST.get("confirm_password")
+        if confirm is not None and confirm != password:
+            return JsonResponse({"error": "Passwords do not match"}, status=400)
+        user_id = consume_token(token)
+        if user_id is None:
+            return HttpResponse("Invalid or expired token", status=400)
+        user = get_object_or_404(User, id=user_id)
         user.set_password(password)
         user.save()
-        del RESET_TOKENS[token]
         return JsonResponse({"message": "Password reset successfully"})
 
+    if not token_is_valid(token):
+        return HttpResponse("Invalid or expired token", status=400)
     return render(
         request,
         "ecommerce/password_reset_confirm.html",
@@ -439,7 +741,7 @@ from .forms import StoreForm, ProductForm
 def edit_store(request, store_id):
     store = get_object_or_404(Store, id=store_id, vendor=request.user)
     if request.method == 'POST':
-        form = StoreForm(request.POST, instance=store)
+        form = StoreForm(request.POST, request.FILES, instance=store)
         if form.is_valid():
             form.save()
             return redirect('ecommerce:store_detail', store_id=store.id)
@@ -449,10 +751,14 @@ def edit_store(request, store_id):
 
 
 @login_required
-def store_detail(request, store_id):
-    store = get_object_or_404(Store, id=store_id)
-    products = Product.objects.filter(store=store)
-    return render(request, 'ecommerce/store_detail.html', {
+async def store_detail(request, store_id):
+    async def load():
+        store = await aget_object_or_404(Store, id=store_id)
+        products = Product.objects.filter(store=store).only("id", "name", "price", "store_id")
+        return store, [product async for product in products]
+
+    store, products = await acached("store_detail", [store_id], [store_key(store_id)], load)
+    return await arender(request, 'ecommerce/store_detail.html', {
         'store': store,
         'products': products
     })
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 
 try:
     from dotenv import load_dotenv
@@ -50,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce.middleware.ViewMetricsMiddleware',  # first, so every query is counted
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +75,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'ecommerce.context_processors.user_role',  # Makes is_vendor available everywhere
+                'ecommerce.context_processors.cart_size',
             ],
         },
     },
@@ -106,10 +110,50 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent checkouts queue on
+            # the busy timeout instead of failing with "database is locked".
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
+# Cache
+# CACHE_BACKEND picks where cached pages, API responses and roles are kept:
+#   file    files under CACHE_DIR, shared by every process on this host (default)
+#   db      a table in the default database; create it once with
+#           `python manage.py createcachetable`
+#   redis   the server at REDIS_URL, shared across hosts (pip install redis)
+#   locmem  per-process memory (what the test suite uses)
+TESTING = sys.argv[1:2] == ['test']
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem' if TESTING else 'file')
+CACHE_BACKENDS = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ecommerce_cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ecommerce_cache',
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+CACHES = {'default': CACHE_BACKENDS[CACHE_BACKEND]}
+
+# Sessions only hold the login now (carts are Cart rows), so they are read
+# from the cache and written to the database only when they change.
+# 'django.contrib.sessions.backends.signed_cookies' drops the table entirely.
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -169,9 +213,38 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # many=True validation errors as {item index: errors}
+    'LIST_SERIALIZER_ERRORS_AS_DICT': True,
+}
+
+# Query budgets: the most SQL queries one GET request to each view may run
+# (see ecommerce/metrics.py). Over-budget requests are logged, or fail outright
+# when QUERY_BUDGET_STRICT is on. The test runner turns it on for the suite.
+QUERY_BUDGETS = {
+    'ecommerce:product_list': 5,
+    'ecommerce:product_detail': 6,
+    'ecommerce:search': 5,
+    'ecommerce:view_cart': 4,
+    'ecommerce:store_detail': 6,
+    'ecommerce:vendor_dashboard': 6,
+    'ecommerce:buyer_dashboard': 4,
+    # API lists: +2 for the COUNT/MAX(updated_at) behind their ETags
+    'ecommerce:product-list': 7,
+    'ecommerce:store-list': 8,
+    'ecommerce:review-list': 7,
 }
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT") == "1"
+TEST_RUNNER = 'ecommerce.test_runner.TestRunner'
+
+# /metrics requires "Authorization: Bearer <token>" when this is set, and is
+# otherwise only served to staff users and to addresses in INTERNAL_IPS.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+INTERNAL_IPS = [ip for ip in os.getenv("INTERNAL_IPS", "").split(",") if ip]
 
 # Twitter Configuration
 TWITTER_CONFIG = {
@@ -181,11 +254,5 @@ TWITTER_CONFIG = {
     "ACCESS_SECRET": os.getenv("TWITTER_ACCESS_SECRET"),
 }
 
-REST_FRAMEWORK = {
-    'DEFAULT_PERMISSION_CLASSES': [
-        'rest_framework.permissions.IsAuthenticatedOrReadOnly',
-    ],
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-    ],
-}
+# Record tweets locally instead of posting them (see twitter_client.FakeTwitterClient)
+TWITTER_FAKE = os.getenv("TWITTER_FAKE") == "1"